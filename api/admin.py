@@ -1,7 +1,62 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
 from .models import File, Profile
+from .search import get_backend
 # Register your models here.
 
-admin.site.register(File)
-admin.site.register(Profile)
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that doesn't COUNT(*) the whole table
+
+    Unfiltered PostgreSQL listings use the planner's row estimate, other
+    listings are counted up to ADMIN_COUNT_LIMIT rows.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+        limit = getattr(settings, 'ADMIN_COUNT_LIMIT', 100000)
+        return queryset.order_by()[:limit].count()
+
+
+@admin.register(File)
+class FileAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'course', 'file_category', 'file_type', 'size', 'is_trashed', 'uploaded_by', 'created_at')
+    list_select_related = ('course', 'uploaded_by__user')
+    list_filter = ('file_category', 'is_trashed', 'course')
+    # Answered by get_search_results, through the project's search backend
+    search_fields = ('name',)
+    search_help_text = "Nom, description et texte extrait"
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    raw_id_fields = ('course', 'uploaded_by', 'university_ref', 'faculty_ref', 'department_ref', 'professor_ref', 'year_ref')
+    readonly_fields = ('uuid', 'size', 'original_size', 'checksum', 'file_type', 'nb_retrieved', 'trashed_at', 'created_at', 'updated_at')
+    ordering = ('-created_at',)
+
+    def get_queryset(self, request):
+        # The default manager hides the trash; the admin shows everything (see the is_trashed filter).
+        # `text` can be megabytes per row
+        queryset = File.all_objects.defer('text')
+        ordering = self.get_ordering(request)
+        return queryset.order_by(*ordering) if ordering else queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return get_backend().search(queryset, search_term), False
+
+
+admin.site.register(Profile)
@@ -4,3 +4,29 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_init, post_migrate, post_save, pre_save
+        from k_archiver.database import configure_connection
+        from .facets import file_deleted, file_loaded, file_saved, file_saving
+        from .models import Course, Faculty, File, Professor
+        from .search import setup_search_indexes
+        from . import normalize, quotas, suggest
+        connection_created.connect(configure_connection)
+        post_migrate.connect(setup_search_indexes, sender=self)
+        post_init.connect(file_loaded, sender=File)
+        post_init.connect(normalize.file_loaded, sender=File)
+        # Resolve the references before the facets diff them
+        pre_save.connect(normalize.file_saving, sender=File)
+        post_save.connect(normalize.file_saved, sender=File)
+        pre_save.connect(file_saving, sender=File)
+        post_save.connect(file_saved, sender=File)
+        post_delete.connect(file_deleted, sender=File)
+        post_init.connect(quotas.file_loaded, sender=File)
+        pre_save.connect(quotas.file_saving, sender=File)
+        post_save.connect(quotas.file_saved, sender=File)
+        post_delete.connect(quotas.file_deleted, sender=File)
+        for model in (Course, Faculty, Professor, File):
+            post_save.connect(suggest.object_saved, sender=model)
+            post_delete.connect(suggest.object_deleted, sender=model)
@@ -0,0 +1,147 @@
+"""
+Buffered audit logging
+
+record() only appends the event to an in-memory buffer; a background
+thread writes the buffer with one bulk_create every AUDIT_FLUSH_INTERVAL
+seconds, or as soon as it holds AUDIT_BUFFER_SIZE events, and prunes the
+events older than AUDIT_RETENTION_DAYS once per AUDIT_PRUNE_INTERVAL.
+Events still buffered are written at exit. With AUDIT_ASYNC = False every
+event is written immediately (tests, management commands).
+"""
+import atexit
+import datetime
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+PRUNE_BATCH_SIZE = 10000
+
+
+def prune(days=None, batch_size=PRUNE_BATCH_SIZE):
+    """Delete the events older than `days` (AUDIT_RETENTION_DAYS), in batches; returns the count"""
+    days = days if days is not None else getattr(settings, 'AUDIT_RETENTION_DAYS', 365)
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    deleted = 0
+    while True:
+        ids = list(AuditLog.objects.filter(timestamp__lt=cutoff).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += AuditLog.objects.filter(pk__in=ids).delete()[0]
+
+
+class AuditBuffer:
+    def __init__(self, max_size=500, interval=5, max_pending=50000):
+        self.max_size = max_size
+        self.interval = interval
+        # Past this, events are dropped rather than exhausting memory while the database is down
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.events = []
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.last_prune = None
+        self.dropped = 0
+
+    def add(self, event):
+        with self.lock:
+            if len(self.events) >= self.max_pending:
+                self.dropped += 1
+                return
+            self.events.append(event)
+            full = len(self.events) >= self.max_size
+        self.start()
+        if full:
+            self.wakeup.set()
+
+    def start(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name='audit-flush', daemon=True)
+                    self.thread.start()
+                    atexit.register(self.flush)
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+                self.prune_if_due()
+            except Exception:
+                logger.exception("Audit log flush failed")
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        with self.lock:
+            events, self.events = self.events, []
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            logger.warning("%d audit events dropped (buffer full)", dropped)
+        if not events:
+            return 0
+        try:
+            return self.write(events)
+        except Exception:
+            # Database unavailable: put them back for the next attempt
+            with self.lock:
+                self.events[:0] = events[:self.max_pending - len(self.events)]
+            raise
+
+    def write(self, events):
+        """
+        Insert `events`; returns the number written
+
+        A batch the database rejects (e.g. a profile deleted meanwhile) is
+        split in halves until the offending events are isolated: those are
+        logged and dropped, so they never block the following flushes.
+        """
+        try:
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(events, batch_size=self.max_size)
+            return len(events)
+        except (IntegrityError, DataError) as e:
+            if len(events) == 1:
+                event = events[0]
+                logger.error("Audit event dropped (%s on %s by profile %s): %s",
+                             event.action, event.target, event.profile_id, e)
+                return 0
+        middle = len(events) // 2
+        return self.write(events[:middle]) + self.write(events[middle:])
+
+    def prune_if_due(self):
+        interval = getattr(settings, 'AUDIT_PRUNE_INTERVAL', 86400)
+        if not interval:
+            return
+        if self.last_prune is None:
+            # Random phase, so that workers started together do not all prune on their first flush
+            self.last_prune = time.monotonic() - random.uniform(0, interval)
+        if time.monotonic() - self.last_prune >= interval:
+            self.last_prune = time.monotonic()
+            deleted = prune()
+            if deleted:
+                logger.info("Pruned %d audit events", deleted)
+
+
+BUFFER = AuditBuffer(
+    max_size=getattr(settings, 'AUDIT_BUFFER_SIZE', 500),
+    interval=getattr(settings, 'AUDIT_FLUSH_INTERVAL', 5),
+)
+
+
+def record(profile, action, target=None, ip=None):
+    event = AuditLog(profile_id=getattr(profile, 'pk', profile), action=action, target=target, ip=ip)
+    if getattr(settings, 'AUDIT_ASYNC', True):
+        BUFFER.add(event)
+    else:
+        event.save()
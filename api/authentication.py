@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.models import TokenUser
+
+from .models import Profile
+
+
+class ClaimsUser(TokenUser):
+    """
+    Caller built from the access token claims set by CustomTokenSerializer
+
+    Authenticating costs no query; the User row is only loaded when a view
+    reads `request.user.user`.
+    """
+
+    @cached_property
+    def token_profile(self):
+        if 'profile_id' not in self.token:
+            # Token issued before the profile claims existed
+            return None
+        return Profile(pk=self.token['profile_id'], uuid=self.token['profile'], user_id=self.id)
+
+    @cached_property
+    def user(self):
+        return User.objects.get(pk=self.id)
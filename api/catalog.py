@@ -0,0 +1,299 @@
+"""
+Bulk import of the academic catalog from spreadsheets
+
+One row per course, parents repeated on every row:
+
+    university, university_acronym, faculty, faculty_code, department,
+    department_code, degree, degree_year, academic_year, course
+
+Rows are streamed from CSV, XLSX (openpyxl) or XLS (xlrd) files and handled
+in batches: each level (universities, faculties, ...) of a batch is looked
+up in in-memory maps of the existing rows, and what is missing is inserted
+with one bulk_create. Rows already in the catalog are skipped, so an import
+can be run again.
+"""
+import csv
+import datetime
+import io
+import logging
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import AcademicDegree, AcademicYear, Course, Degree, Department, Faculty, University
+from .normalize import normalize_key, year_key
+
+try:
+    import openpyxl
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+try:
+    import xlrd
+    HAS_XLRD = True
+except ImportError:
+    HAS_XLRD = False
+
+logger = logging.getLogger(__name__)
+
+# column -> accepted headers (compared with normalize_key)
+COLUMNS = {
+    'university': ['university', 'universite'],
+    'university_acronym': ['university acronym', 'sigle', 'acronym'],
+    'faculty': ['faculty', 'faculte'],
+    'faculty_code': ['faculty code', 'code faculte'],
+    'department': ['department', 'departement'],
+    'department_code': ['department code', 'code departement'],
+    'degree': ['degree', 'cycle', 'diplome'],
+    'degree_year': ['degree year', 'promotion', 'niveau'],
+    'academic_year': ['academic year', 'annee academique', 'annee'],
+    'course': ['course', 'cours'],
+}
+# Model max_length of each column, longer values are truncated
+MAX_LENGTHS = {
+    'university': 100,
+    'university_acronym': 50,
+    'faculty': 500,
+    'faculty_code': 50,
+    'department': 50,
+    'department_code': 50,
+    'degree': 20,
+    'degree_year': 4,
+    'course': 100,
+}
+HEADERS = {alias: column for column, aliases in COLUMNS.items() for alias in aliases}
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def read_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def read_xlsx(stream):
+    if not HAS_OPENPYXL:
+        raise ImportError("openpyxl not installed")
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_xls(stream):
+    if not HAS_XLRD:
+        raise ImportError("xlrd not installed")
+    workbook = xlrd.open_workbook(file_contents=stream.read(), on_demand=True)
+    sheet = workbook.sheet_by_index(0)
+    for index in range(sheet.nrows):
+        yield sheet.row_values(index)
+
+
+READERS = {
+    '.csv': read_csv,
+    '.xlsx': read_xlsx,
+    '.xls': read_xls,
+}
+
+
+def read_rows(stream, filename):
+    """Yield (line number, {column: value}) for each non empty row of the first sheet"""
+    extension = Path(filename).suffix.lower()
+    if extension not in READERS:
+        raise CatalogError(f"Format non supporté : {extension or filename}")
+    rows = READERS[extension](stream)
+
+    header = next(rows, None)
+    if header is None:
+        raise CatalogError("Fichier vide")
+    columns = [HEADERS.get(normalize_key(cell)) for cell in header]
+    if 'university' not in columns:
+        raise CatalogError("Colonne 'university' manquante")
+
+    for line, row in enumerate(rows, start=2):
+        values = {}
+        for column, cell in zip(columns, row):
+            if column and cell is not None:
+                cell = str(int(cell)) if isinstance(cell, float) and cell.is_integer() else str(cell).strip()
+                if cell:
+                    values[column] = cell[:MAX_LENGTHS.get(column, len(cell))]
+        if values:
+            yield line, values
+
+
+def academic_year_bounds(value):
+    """'2023-2024' -> (date(2023, 10, 1), date(2024, 9, 30)) with the default start month"""
+    years = [int(year) for year in year_key(value).split()]
+    if not years:
+        raise CatalogError(f"Année académique invalide : {value}")
+    start_year = years[0]
+    start_month = getattr(settings, 'CATALOG_YEAR_START_MONTH', 10)
+    start = datetime.date(start_year, start_month, 1)
+    end = datetime.date(start_year + 1, start_month, 1) - datetime.timedelta(days=1)
+    return start, end
+
+
+class CatalogImporter:
+    """Resolves and creates catalog rows level by level, one bulk_create per level and batch"""
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.created = Counter()
+        self.rows = 0
+        self.errors = []
+
+        self.universities = {}
+        for pk, name, acronym in University.objects.values_list('id', 'name', 'acronym'):
+            self.universities.setdefault(normalize_key(name), pk)
+            self.universities.setdefault(normalize_key(acronym), pk)
+        self.faculties = {}
+        for pk, university, name, code in Faculty.objects.values_list('id', 'university_id', 'name', 'code'):
+            self.faculties.setdefault((university, normalize_key(name)), pk)
+        self.departments = {}
+        for pk, faculty, name in Department.objects.values_list('id', 'faculty_id', 'name'):
+            self.departments.setdefault((faculty, normalize_key(name)), pk)
+        self.degrees = {normalize_key(name): pk for pk, name in Degree.objects.values_list('id', 'name')}
+        self.academic_degrees = {
+            (university, degree, normalize_key(year)): pk
+            for pk, university, degree, year in AcademicDegree.objects.values_list('id', 'university_id', 'degree_id', 'year')
+        }
+        self.years = {start.year: pk for pk, start in AcademicYear.objects.values_list('id', 'start')}
+        self.courses = {
+            (degree, year, faculty, department, normalize_key(name)): pk
+            for pk, degree, year, faculty, department, name in Course.objects.values_list(
+                'id', 'academic_degree_id', 'academic_year_id', 'faculty_id', 'department_id', 'name')
+        }
+
+    def resolve(self, batch, lookup, key, build, model):
+        """
+        Fill `row[model]` with the id of each row's object, creating the missing ones
+
+        key(row) gives the lookup key (None when the row has no such object),
+        build(row) the unsaved instance to create for an unknown key.
+        """
+        pending = {}
+        for line, row in batch:
+            row_key = key(row)
+            if row_key is not None and row_key not in lookup and row_key not in pending:
+                pending[row_key] = build(row)
+        if pending:
+            model.objects.bulk_create(pending.values(), batch_size=self.batch_size)
+            for row_key, obj in pending.items():
+                lookup[row_key] = obj.pk
+            self.created[model._meta.model_name] += len(pending)
+        for line, row in batch:
+            row_key = key(row)
+            row[model] = lookup[row_key] if row_key is not None else None
+
+    def validate(self, line, row):
+        if not row.get('university'):
+            return "université manquante"
+        if row.get('course') and not (row.get('degree') and row.get('degree_year') and row.get('academic_year')):
+            return "un cours demande les colonnes degree, degree_year et academic_year"
+        if row.get('department') and not row.get('faculty'):
+            return "un département demande une faculté"
+        if row.get('academic_year'):
+            row['academic_year_bounds'] = academic_year_bounds(row['academic_year'])
+        return None
+
+    def import_batch(self, batch):
+        valid = []
+        for line, row in batch:
+            try:
+                error = self.validate(line, row)
+            except CatalogError as e:
+                error = str(e)
+            if error:
+                self.errors.append({'line': line, 'error': error})
+            else:
+                valid.append((line, row))
+        batch = valid
+
+        self.resolve(
+            batch, self.universities,
+            lambda row: normalize_key(row['university']) if row.get('university') else None,
+            lambda row: University(name=row['university'], acronym=row.get('university_acronym', ''), address=''),
+            University,
+        )
+        self.resolve(
+            batch, self.faculties,
+            lambda row: (row[University], normalize_key(row['faculty'])) if row.get('faculty') else None,
+            lambda row: Faculty(university_id=row[University], name=row['faculty'], code=row.get('faculty_code', '')),
+            Faculty,
+        )
+        self.resolve(
+            batch, self.departments,
+            lambda row: (row[Faculty], normalize_key(row['department'])) if row.get('department') else None,
+            lambda row: Department(faculty_id=row[Faculty], name=row['department'],
+                                   code=row.get('department_code', '')),
+            Department,
+        )
+        self.resolve(
+            batch, self.degrees,
+            lambda row: normalize_key(row['degree']) if row.get('degree') else None,
+            lambda row: Degree(name=row['degree']),
+            Degree,
+        )
+        self.resolve(
+            batch, self.academic_degrees,
+            lambda row: (row[University], row[Degree], normalize_key(row['degree_year']))
+            if row[Degree] and row.get('degree_year') else None,
+            lambda row: AcademicDegree(university_id=row[University], degree_id=row[Degree], year=row['degree_year']),
+            AcademicDegree,
+        )
+        self.resolve(
+            batch, self.years,
+            lambda row: row['academic_year_bounds'][0].year if row.get('academic_year') else None,
+            lambda row: AcademicYear(start=row['academic_year_bounds'][0], end=row['academic_year_bounds'][1]),
+            AcademicYear,
+        )
+        self.resolve(
+            batch, self.courses,
+            lambda row: (row[AcademicDegree], row[AcademicYear], row[Faculty], row[Department],
+                         normalize_key(row['course'])) if row.get('course') else None,
+            lambda row: Course(academic_degree_id=row[AcademicDegree], academic_year_id=row[AcademicYear],
+                               faculty_id=row[Faculty], department_id=row[Department], name=row['course']),
+            Course,
+        )
+        self.rows += len(batch)
+
+    def run(self, rows, dry_run=False):
+        with transaction.atomic():
+            batch = []
+            for line, row in rows:
+                batch.append((line, row))
+                if len(batch) >= self.batch_size:
+                    self.import_batch(batch)
+                    batch = []
+            if batch:
+                self.import_batch(batch)
+            if dry_run:
+                transaction.set_rollback(True)
+        return self.report()
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'created': dict(self.created),
+            'errors': len(self.errors),
+            'first_errors': self.errors[:50],
+        }
+
+
+def import_catalog(stream, filename, batch_size=1000, dry_run=False):
+    importer = CatalogImporter(batch_size=batch_size)
+    report = importer.run(read_rows(stream, filename), dry_run=dry_run)
+    logger.info("Catalog import of %s: %s", filename, report)
+    return report
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+from django.conf import settings
+
+# Only frames from this project are kept: they are what the fingerprint and the report are about
+PROJECT_DIR = str(settings.BASE_DIR)
+
+
+def app_frames(exception):
+    """Yield (file, line, function) for the project frames of the exception's traceback, innermost last"""
+    for frame, lineno in traceback.walk_tb(exception.__traceback__):
+        filename = frame.f_code.co_filename
+        if filename.startswith(PROJECT_DIR) and 'site-packages' not in filename:
+            yield os.path.relpath(filename, PROJECT_DIR), lineno, frame.f_code.co_name
+
+
+def fingerprint(exception, frames):
+    key = type(exception).__qualname__ + "|" + "|".join(f"{f}:{n}:{fn}" for f, n, fn in frames)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+@dataclass
+class ErrorEntry:
+    fingerprint: str
+    type: str
+    message: str
+    frames: List[str]
+    count: int = 0
+    first_seen: float = field(default_factory=time.time)
+    last_seen: float = field(default_factory=time.time)
+    last_path: Optional[str] = None
+    last_logged: float = 0.0
+    suppressed: int = 0
+
+
+class ErrorRegistry:
+    """
+    Bounded in-memory count of errors, grouped by fingerprint
+
+    The least recently seen fingerprints are evicted past `max_entries`.
+    `record` tells the caller whether the error should be logged, so an error
+    storm logs each distinct error once per `log_interval` seconds.
+    """
+
+    def __init__(self, max_entries=200, log_interval=60):
+        self.max_entries = max_entries
+        self.log_interval = log_interval
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def record(self, exception, path=None):
+        frames = list(app_frames(exception))
+        key = fingerprint(exception, frames)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                entry = ErrorEntry(
+                    fingerprint=key,
+                    type=type(exception).__qualname__,
+                    message=str(exception)[:500],
+                    frames=[f"{f}:{n} in {fn}" for f, n, fn in frames],
+                )
+                while len(self.entries) >= self.max_entries:
+                    self.entries.popitem(last=False)
+            self.entries[key] = entry
+            entry.count += 1
+            entry.last_seen = now
+            entry.last_path = path
+
+            should_log = now - entry.last_logged >= self.log_interval
+            if should_log:
+                entry.last_logged = now
+                suppressed, entry.suppressed = entry.suppressed, 0
+            else:
+                entry.suppressed += 1
+                suppressed = 0
+        return entry, should_log, suppressed
+
+    def snapshot(self):
+        with self.lock:
+            entries = [asdict(entry) for entry in self.entries.values()]
+        return sorted(entries, key=lambda entry: entry['count'], reverse=True)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+REGISTRY = ErrorRegistry(
+    max_entries=getattr(settings, 'ERROR_REGISTRY_SIZE', 200),
+    log_interval=getattr(settings, 'ERROR_LOG_INTERVAL', 60),
+)
@@ -0,0 +1,217 @@
+"""
+Streaming zip/tar export of a selection of files
+
+The archive is produced as a generator of byte chunks: blobs are read from
+the storage and written CHUNK_SIZE bytes at a time, and the rows are
+iterated in chunks, so memory use does not depend on the size of the
+selection. A manifest.json describing every exported file closes the
+archive: its entries are written as they come to a spooled temporary file
+(kept in memory up to MANIFEST_SPOOL_SIZE), then streamed like a blob.
+"""
+import io
+import json
+import posixpath
+import tarfile
+import tempfile
+import time
+import zipfile
+
+from django.conf import settings
+from django.utils.text import get_valid_filename
+
+from .models import File
+
+CHUNK_SIZE = 64 * 1024
+ROWS_CHUNK_SIZE = 200
+MANIFEST_SPOOL_SIZE = 1024 * 1024
+FORMATS = {
+    'zip': ('application/zip', '.zip'),
+    'tar': ('application/x-tar', '.tar'),
+}
+
+# selection parameter -> File lookup
+FILTERS = {
+    'course': 'course_id',
+    'university': 'university_ref_id',
+    'faculty': 'faculty_ref_id',
+    'department': 'department_ref_id',
+    'professor': 'professor_ref_id',
+    'year': 'year_ref_id',
+}
+
+
+def select_files(with_text=False, **selection):
+    """Non trashed files matching the given ids (e.g. course=3, faculty=2)"""
+    files = File.objects.filter(
+        **{FILTERS[name]: value for name, value in selection.items() if value},
+    ).select_related('course').order_by('course_id', 'pk')
+    if not with_text:
+        files = files.defer('text')
+    return files
+
+
+class Buffer(io.RawIOBase):
+    """Write-only sink whose content is taken out with `drain()` by the generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def drained(buffer):
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def read_chunks(field):
+    with field.open('rb') as f:
+        yield from read_file_chunks(f)
+
+
+def read_file_chunks(f):
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+class ManifestWriter:
+    """manifest.json written entry by entry to a spooled temporary file"""
+
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(max_size=MANIFEST_SPOOL_SIZE)
+        self.count = 0
+        self.file.write(b'{\n  "files": [')
+
+    def add(self, entry):
+        separator = b',\n    ' if self.count else b'\n    '
+        self.file.write(separator + json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+        self.count += 1
+
+    def finish(self):
+        """Close the document and return its size, the file being rewound"""
+        self.file.write(f'\n  ],\n  "count": {self.count}\n}}\n'.encode('utf-8'))
+        size = self.file.tell()
+        self.file.seek(0)
+        return size
+
+    def close(self):
+        self.file.close()
+
+
+class ZipStream:
+    def __init__(self, buffer):
+        self.zip = zipfile.ZipFile(buffer, 'w', allowZip64=True)
+
+    def add(self, path, chunks, size, compress=False):
+        info = zipfile.ZipInfo(path, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+        info.file_size = size
+        with self.zip.open(info, 'w', force_zip64=size > zipfile.ZIP64_LIMIT) as entry:
+            for chunk in chunks:
+                entry.write(chunk)
+                yield
+
+    def close(self):
+        self.zip.close()
+
+
+class TarStream:
+    """Tar writer taking the content by chunks (tarfile.addfile wants a whole file object)"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def add(self, path, chunks, size, compress=False):
+        info = tarfile.TarInfo(path)
+        info.size = size
+        info.mtime = int(time.time())
+        self.buffer.write(info.tobuf(format=tarfile.PAX_FORMAT))
+        written = 0
+        for chunk in chunks:
+            self.buffer.write(chunk)
+            written += len(chunk)
+            yield
+        if written != size:
+            raise IOError(f"{path}: expected {size} bytes, read {written}")
+        remainder = size % tarfile.BLOCKSIZE
+        if remainder:
+            self.buffer.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+    def close(self):
+        self.buffer.write(tarfile.NUL * tarfile.BLOCKSIZE * 2)
+
+
+def archive_path(file):
+    course = get_valid_filename(file.course.name) or str(file.course_id)
+    name = get_valid_filename(file.name or posixpath.basename(file.file.name)) or 'file'
+    return posixpath.join('files', f"{file.course_id}-{course}", f"{str(file.uuid)[:8]}-{name}")
+
+
+def stream_archive(files, archive_format='zip', with_text=False):
+    """Generate the chunks of an archive of `files` (a File queryset)"""
+    buffer = Buffer()
+    writer = ZipStream(buffer) if archive_format == 'zip' else TarStream(buffer)
+    manifest = ManifestWriter()
+    try:
+        yield from write_entries(files, writer, buffer, manifest, with_text)
+        size = manifest.finish()
+        for _ in writer.add('manifest.json', read_file_chunks(manifest.file), size, compress=True):
+            yield from drained(buffer)
+    finally:
+        manifest.close()
+    writer.close()
+    yield from drained(buffer)
+
+
+def write_entries(files, writer, buffer, manifest, with_text):
+    for file in files.iterator(chunk_size=ROWS_CHUNK_SIZE):
+        entry = {
+            'uuid': str(file.uuid),
+            'name': file.name,
+            'course': {'id': file.course_id, 'name': file.course.name},
+            'category': file.file_category,
+            'university': file.university,
+            'faculty': file.faculty,
+            'department': file.department,
+            'professor': file.professor,
+            'year': file.year,
+            'checksum': file.checksum,
+            'created_at': file.created_at.isoformat(),
+        }
+        path = archive_path(file)
+        try:
+            size = file.file.size if file.file else None
+        except OSError:
+            size = None
+        if size is None:
+            entry['missing'] = True
+        else:
+            entry.update(path=path, size=size)
+            for _ in writer.add(path, read_chunks(file.file), size):
+                yield from drained(buffer)
+
+        if with_text and file.text:
+            data = file.text.encode('utf-8')
+            entry['text_path'] = f"{path}.txt"
+            for _ in writer.add(entry['text_path'], [data], len(data), compress=True):
+                yield from drained(buffer)
+        manifest.add(entry)
+        yield from drained(buffer)
+
+
+def export_filename(archive_format):
+    return f"{getattr(settings, 'EXPORT_FILENAME_PREFIX', 'k-archiver')}-{time.strftime('%Y%m%d-%H%M%S')}{FORMATS[archive_format][1]}"
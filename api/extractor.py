@@ -3,7 +3,15 @@ import os
 import sys
 from pathlib import Path
 import argparse
-from typing import List, Optional, Union
+import json
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, List, Optional, Union
 import logging
 
 try:
@@ -30,18 +38,127 @@ try:
 except ImportError:
     HAS_PYMUPDF = False
 
+PAGE_MARKER_RE = re.compile(r"\n--- Page (\d+) ---\n")
+
+# Document profiling thresholds used by method="auto" (per sampled page)
+SCANNED_MAX_CHARS = 50
+SCANNED_MIN_IMAGE_COVERAGE = 0.5
+TABLE_MIN_RULES = 20
+
+# Images above this many pixels (or with several frames) are OCRed tile by tile
+TILE_THRESHOLD_PIXELS = 16_000_000
+TILE_SIZE = 2048
+# Wider than a line of text, so that each word is whole in at least one tile
+TILE_OVERLAP = 200
+# Tiles whose pixels barely vary (blank margins) are not sent to tesseract
+BLANK_TILE_STDDEV = 2.0
+# Frames above this many pixels are refused before being decoded (PIL's default
+# Image.MAX_IMAGE_PIXELS): a frame is decoded whole, as 8-bit grayscale, before
+# being cut into tiles, so this bounds the memory of an OCR to ~90 MB per frame
+MAX_FRAME_PIXELS = 89_478_485
+
+@dataclass
+class Span:
+    """Timing of one extraction stage, for a single page when `page` is set"""
+    name: str
+    seconds: float
+    page: Optional[int] = None
+
+@dataclass
+class ExtractionStats:
+    """Timings and counters collected while extracting one file"""
+    path: str = ""
+    pages: int = 0
+    bytes_read: int = 0
+    seconds: float = 0.0
+    route: Optional[dict] = None
+    spans: List[Span] = field(default_factory=list)
+    
+    def stage_totals(self) -> dict:
+        """Total seconds per stage name, over all pages"""
+        totals = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + span.seconds
+        return totals
+    
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["stages"] = self.stage_totals()
+        return data
+
+class LoggingSink:
+    """Stats sink logging a one-line summary per extraction"""
+    
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+    
+    def __call__(self, stats: ExtractionStats):
+        stages = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in stats.stage_totals().items())
+        self.logger.log(self.level, f"Extracted {stats.path}: {stats.pages} pages, {stats.bytes_read} bytes "
+                                    f"in {stats.seconds * 1000:.1f} ms ({stages})")
+
+class JSONFileSink:
+    """Stats sink appending one JSON document per extraction to a file"""
+    
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+    
+    def __call__(self, stats: ExtractionStats):
+        line = json.dumps(stats.to_dict())
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+class MetricsSink:
+    """Stats sink feeding a metrics registry (see api.metrics.Registry)"""
+    
+    def __init__(self, registry):
+        self.stage_seconds = registry.histogram("extraction_stage_seconds", "Time spent per extraction stage")
+        self.pages = registry.counter("extraction_pages_total", "Pages processed by the text extractor")
+        self.bytes_read = registry.counter("extraction_bytes_read_total", "Bytes read by the text extractor")
+    
+    def __call__(self, stats: ExtractionStats):
+        for name, seconds in stats.stage_totals().items():
+            self.stage_seconds.observe(seconds, stage=name)
+        self.pages.inc(stats.pages)
+        self.bytes_read.inc(stats.bytes_read)
+
 class TextExtractor:
     """Main class for extracting text from PDFs and images"""
     
-    def __init__(self, tesseract_path: Optional[str] = None):
+    def __init__(self, tesseract_path: Optional[str] = None,
+                 sinks: Optional[List[Callable[[ExtractionStats], None]]] = None,
+                 tile_size: int = TILE_SIZE,
+                 tile_overlap: int = TILE_OVERLAP,
+                 tile_workers: Optional[int] = None,
+                 tile_threshold: int = TILE_THRESHOLD_PIXELS,
+                 max_pixels: int = MAX_FRAME_PIXELS):
         """
         Initialize the text extractor
         
         Args:
             tesseract_path: Path to tesseract executable (optional)
+            sinks: Callables receiving the ExtractionStats of each extraction
+                (e.g. LoggingSink, JSONFileSink, MetricsSink)
+            tile_size: Side in pixels of the tiles of huge images
+            tile_overlap: Pixels shared by neighbouring tiles
+            tile_workers: Tiles OCRed in parallel (default: number of CPUs)
+            tile_threshold: Pixels above which an image is processed by tiles
+            max_pixels: Pixels per frame above which an image is refused
+                (PIL's own decompression bomb limit applies too)
         """
         self.setup_logging()
         
+        self.sinks = list(sinks or [])
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_workers = tile_workers or os.cpu_count() or 1
+        self.tile_threshold = tile_threshold
+        self.max_pixels = max_pixels
+        self.last_stats = None
+        self._stats = None
+        
         if tesseract_path and HAS_OCR:
             pytesseract.pytesseract.tesseract_cmd = tesseract_path
         
@@ -49,6 +166,9 @@ class TextExtractor:
         self.pdf_extensions = {'.pdf'}
         self.image_extensions = {'.png', '.jpg', '.jpeg', '.tiff', '.tif', '.bmp', '.gif'}
         
+        # Route chosen by the last method="auto" extraction, for observability
+        self.last_route = None
+        
     def setup_logging(self):
         """Setup logging configuration"""
         logging.basicConfig(
@@ -65,6 +185,61 @@ class TextExtractor:
         """Check if file is an image"""
         return Path(file_path).suffix.lower() in self.image_extensions
     
+    @contextmanager
+    def track(self, path: Union[str, Path]):
+        """
+        Collect stats for an extraction and emit them to the sinks when done
+        
+        Nested calls (e.g. extract_text_from_file -> extract_text_from_pdf)
+        share the stats of the outermost one.
+        """
+        if self._stats is not None:
+            yield self._stats
+            return
+        
+        stats = self._stats = ExtractionStats(path=str(path))
+        if os.path.isfile(path):
+            stats.bytes_read = os.path.getsize(path)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.seconds = time.perf_counter() - start
+            self._stats = None
+            self.last_stats = stats
+            for sink in self.sinks:
+                try:
+                    sink(stats)
+                except Exception as e:
+                    self.logger.warning(f"Stats sink {sink!r} failed: {e}")
+    
+    @contextmanager
+    def span(self, name: str, page: Optional[int] = None):
+        """Time a stage ('load', 'parse', 'tables', 'preprocess', 'ocr', 'write'...)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self._stats is not None:
+                self._stats.spans.append(Span(name, time.perf_counter() - start, page))
+    
+    def count_page(self):
+        if self._stats is not None:
+            self._stats.pages += 1
+    
+    @staticmethod
+    def split_pages(text: str) -> List[str]:
+        """
+        Split extracted text on the page markers written by the PDF extractors
+        
+        Text without markers (e.g. OCR output of a single image) is one page.
+        """
+        parts = PAGE_MARKER_RE.split(text or "")
+        if len(parts) == 1:
+            return [parts[0]]
+        # parts = [preamble, number, text, number, text, ...]
+        return parts[2::2]
+    
     def extract_text_from_pdf_pypdf2(self, pdf_path: Union[str, Path]) -> str:
         """Extract text from PDF using PyPDF2"""
         if not HAS_PDF:
@@ -73,12 +248,15 @@ class TextExtractor:
         text = ""
         try:
             with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
+                with self.span("load"):
+                    pdf_reader = PyPDF2.PdfReader(file)
                 
                 for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += f"\n--- Page {page_num + 1} ---\n"
-                    text += page.extract_text()
+                    with self.span("parse", page_num + 1):
+                        page = pdf_reader.pages[page_num]
+                        text += f"\n--- Page {page_num + 1} ---\n"
+                        text += page.extract_text()
+                    self.count_page()
                     
         except Exception as e:
             self.logger.error(f"Error with PyPDF2: {e}")
@@ -93,15 +271,20 @@ class TextExtractor:
         
         text = ""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
+            with self.span("load"):
+                pdf = pdfplumber.open(pdf_path)
+            with pdf:
                 for page_num, page in enumerate(pdf.pages):
                     text += f"\n--- Page {page_num + 1} ---\n"
-                    page_text = page.extract_text()
+                    with self.span("parse", page_num + 1):
+                        page_text = page.extract_text()
                     if page_text:
                         text += page_text
                     
                     # Extract tables if present
-                    tables = page.extract_tables()
+                    with self.span("tables", page_num + 1):
+                        tables = page.extract_tables()
+                    self.count_page()
                     for table in tables:
                         text += "\n--- Table ---\n"
                         for row in table:
@@ -121,12 +304,15 @@ class TextExtractor:
         
         text = ""
         try:
-            doc = fitz.open(pdf_path)
+            with self.span("load"):
+                doc = fitz.open(pdf_path)
             
             for page_num in range(doc.page_count):
-                page = doc[page_num]
-                text += f"\n--- Page {page_num + 1} ---\n"
-                text += page.get_text()
+                with self.span("parse", page_num + 1):
+                    page = doc[page_num]
+                    text += f"\n--- Page {page_num + 1} ---\n"
+                    text += page.get_text()
+                self.count_page()
                 
             doc.close()
             
@@ -136,13 +322,103 @@ class TextExtractor:
             
         return text
     
-    def extract_text_from_pdf(self, pdf_path: Union[str, Path], method: str = "auto") -> str:
+    def extract_text_from_pdf_ocr(self, pdf_path: Union[str, Path], lang: str = 'eng', dpi: int = 300) -> str:
+        """Extract text from a scanned PDF by rendering each page and running OCR"""
+        if not HAS_PYMUPDF:
+            raise ImportError("PyMuPDF not installed")
+        if not HAS_OCR:
+            raise ImportError("OCR libraries not installed. Install with: pip install pytesseract pillow opencv-python")
+        
+        text = ""
+        try:
+            with self.span("load"):
+                doc = fitz.open(pdf_path)
+            with doc:
+                for page_num in range(doc.page_count):
+                    with self.span("render", page_num + 1):
+                        pix = doc[page_num].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+                        image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+                    text += f"\n--- Page {page_num + 1} ---\n"
+                    with self.span("ocr", page_num + 1):
+                        text += pytesseract.image_to_string(image, lang=lang, config='--oem 3 --psm 6')
+                    self.count_page()
+                    
+        except Exception as e:
+            self.logger.error(f"Error with OCR: {e}")
+            raise
+            
+        return text
+    
+    def profile_pdf(self, pdf_path: Union[str, Path], sample_pages: int = 3) -> dict:
+        """
+        Quickly profile a PDF from a few sampled pages
+        
+        Args:
+            pdf_path: Path to PDF file
+            sample_pages: Number of pages to sample (first, last and evenly spread)
+        
+        Returns:
+            Per-page averages of text characters, ruling lines/rectangles and
+            the fraction of the page covered by images
+        """
+        def sample(page_count):
+            if page_count <= sample_pages:
+                return list(range(page_count))
+            step = (page_count - 1) / (sample_pages - 1)
+            return sorted({round(i * step) for i in range(sample_pages)})
+        
+        pages = []
+        if HAS_PYMUPDF:
+            with fitz.open(pdf_path) as doc:
+                page_count = doc.page_count
+                for page_num in sample(page_count):
+                    page = doc[page_num]
+                    area = abs(page.rect) or 1
+                    rules = sum(1 for drawing in page.get_drawings()
+                                for item in drawing["items"] if item[0] in ("l", "re"))
+                    images = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+                    pages.append((len(page.get_text().strip()), rules, images / area))
+        else:
+            with pdfplumber.open(pdf_path) as pdf:
+                page_count = len(pdf.pages)
+                for page_num in sample(page_count):
+                    page = pdf.pages[page_num]
+                    area = (page.width * page.height) or 1
+                    images = sum(image["width"] * image["height"] for image in page.images)
+                    pages.append((len(page.chars), len(page.lines) + len(page.rects), images / area))
+        
+        count = len(pages) or 1
+        return {
+            "page_count": page_count,
+            "sampled_pages": len(pages),
+            "chars_per_page": sum(p[0] for p in pages) / count,
+            "rules_per_page": sum(p[1] for p in pages) / count,
+            "image_coverage": min(sum(p[2] for p in pages) / count, 1.0),
+        }
+    
+    def choose_pdf_method(self, profile: dict) -> str:
+        """Pick the cheapest backend able to handle a profiled PDF"""
+        if (profile["chars_per_page"] < SCANNED_MAX_CHARS
+                and profile["image_coverage"] >= SCANNED_MIN_IMAGE_COVERAGE
+                and HAS_OCR and HAS_PYMUPDF):
+            return "ocr"
+        if profile["rules_per_page"] >= TABLE_MIN_RULES:
+            return "pdfplumber"
+        if HAS_PYMUPDF:
+            return "pymupdf"
+        return "pypdf2"
+    
+    def extract_text_from_pdf(self, pdf_path: Union[str, Path], method: str = "auto", lang: str = 'eng') -> str:
         """
         Extract text from PDF using specified method
         
         Args:
             pdf_path: Path to PDF file
-            method: Extraction method ('auto', 'pypdf2', 'pdfplumber', 'pymupdf')
+            method: Extraction method ('auto', 'pypdf2', 'pdfplumber', 'pymupdf', 'ocr').
+                'auto' profiles the document and routes it: scans to OCR,
+                table-heavy documents to pdfplumber, the rest to the fastest
+                text backend available.
+            lang: Language for OCR, when the document is routed to OCR
         """
         if not HAS_PDF:
             raise ImportError("No PDF libraries installed. Install with: pip install PyPDF2 pdfplumber PyMuPDF")
@@ -153,23 +429,43 @@ class TextExtractor:
         
         self.logger.info(f"Extracting text from PDF: {pdf_path}")
         
-        if method == "auto":
-            # Try methods in order of preference
-            if HAS_PYMUPDF:
-                method = "pymupdf"
-            elif HAS_PDF:
-                method = "pdfplumber"
+        with self.track(pdf_path) as stats:
+            route = None
+            if method == "auto":
+                start = time.perf_counter()
+                with self.span("profile"):
+                    profile = self.profile_pdf(pdf_path)
+                method = self.choose_pdf_method(profile)
+                route = {
+                    "path": str(pdf_path),
+                    "method": method,
+                    "profile": profile,
+                    "profile_seconds": time.perf_counter() - start,
+                }
+                self.last_route = stats.route = route
+            
+            start = time.perf_counter()
+            if method == "pypdf2":
+                text = self.extract_text_from_pdf_pypdf2(pdf_path)
+            elif method == "pdfplumber":
+                text = self.extract_text_from_pdf_pdfplumber(pdf_path)
+            elif method == "pymupdf":
+                text = self.extract_text_from_pdf_pymupdf(pdf_path)
+            elif method == "ocr":
+                text = self.extract_text_from_pdf_ocr(pdf_path, lang=lang)
             else:
-                method = "pypdf2"
-        
-        if method == "pypdf2":
-            return self.extract_text_from_pdf_pypdf2(pdf_path)
-        elif method == "pdfplumber":
-            return self.extract_text_from_pdf_pdfplumber(pdf_path)
-        elif method == "pymupdf":
-            return self.extract_text_from_pdf_pymupdf(pdf_path)
-        else:
-            raise ValueError(f"Unknown method: {method}")
+                raise ValueError(f"Unknown method: {method}")
+            
+            if route:
+                route["extract_seconds"] = time.perf_counter() - start
+                self.logger.info(
+                    f"Routed {pdf_path.name} to {method} "
+                    f"(profile {route['profile_seconds'] * 1000:.1f} ms, extract {route['extract_seconds'] * 1000:.1f} ms, "
+                    f"{route['profile']['chars_per_page']:.0f} chars/page, "
+                    f"{route['profile']['rules_per_page']:.0f} rules/page, "
+                    f"{route['profile']['image_coverage']:.0%} images)"
+                )
+            return text
     
     def preprocess_image(self, image_path: Union[str, Path]) -> np.ndarray:
         """Preprocess image for better OCR results"""
@@ -177,21 +473,204 @@ class TextExtractor:
             raise ImportError("OpenCV not installed")
         
         # Load image
-        img = cv2.imread(str(image_path))
+        with self.span("load"):
+            img = cv2.imread(str(image_path))
         if img is None:
             raise ValueError(f"Could not load image: {image_path}")
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        with self.span("preprocess", 1):
+            # Convert to grayscale
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            return self.preprocess_array(gray)
+    
+    @staticmethod
+    def preprocess_array(gray: np.ndarray, threshold: Optional[float] = None) -> np.ndarray:
+        """
+        Denoise and binarize a grayscale array
         
+        Args:
+            gray: 8-bit grayscale image
+            threshold: Binarization threshold; computed with Otsu when None
+        """
         # Apply denoising
         denoised = cv2.fastNlMeansDenoising(gray)
         
         # Apply threshold to get better contrast
-        _, thresh = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
+        if threshold is None:
+            _, thresh = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        else:
+            _, thresh = cv2.threshold(denoised, threshold, 255, cv2.THRESH_BINARY)
         return thresh
     
+    def check_size(self, image: "Image.Image", image_path: Union[str, Path]):
+        """Refuse the current frame of an opened image when it has more than max_pixels"""
+        if image.width * image.height > self.max_pixels:
+            raise ValueError(f"Image too large to OCR: {image_path} is {image.width}x{image.height}, "
+                             f"more than {self.max_pixels} pixels per frame")
+    
+    def open_image(self, image_path: Union[str, Path]) -> "Image.Image":
+        """
+        Image.open (header only) with the size checks: PIL's decompression
+        bomb limit stays active and the first frame must fit max_pixels
+        """
+        try:
+            image = Image.open(image_path)
+        except Image.DecompressionBombError as e:
+            raise ValueError(f"Image too large to OCR: {image_path} ({e})") from e
+        try:
+            self.check_size(image, image_path)
+        except ValueError:
+            image.close()
+            raise
+        return image
+    
+    def needs_tiling(self, image: "Image.Image") -> bool:
+        """Whether an opened (not yet decoded) image should be processed by tiles"""
+        return getattr(image, "n_frames", 1) > 1 or image.width * image.height > self.tile_threshold
+    
+    def tile_boxes(self, width: int, height: int):
+        """Overlapping (left, top, right, bottom) tiles covering the image, row by row"""
+        step = max(self.tile_size - self.tile_overlap, 1)
+        for top in range(0, max(height - self.tile_overlap, 1), step):
+            for left in range(0, max(width - self.tile_overlap, 1), step):
+                yield (left, top, min(left + self.tile_size, width), min(top + self.tile_size, height))
+    
+    def tile_core(self, box, width: int, height: int):
+        """
+        Part of a tile owned by it: half of each overlap goes to each neighbour,
+        so that a word seen by two tiles is kept once
+        """
+        left, top, right, bottom = box
+        half = self.tile_overlap // 2
+        return (
+            left + half if left > 0 else 0,
+            top + half if top > 0 else 0,
+            right - half if right < width else width,
+            bottom - half if bottom < height else height,
+        )
+    
+    @staticmethod
+    def global_threshold(frame: np.ndarray, max_pixels: int = 2_000_000) -> float:
+        """Otsu threshold of the whole frame, computed on a reduced copy"""
+        height, width = frame.shape
+        factor = max(1, int((width * height / max_pixels) ** 0.5 + 0.999))
+        small = cv2.resize(frame, (width // factor, height // factor), interpolation=cv2.INTER_AREA) if factor > 1 else frame
+        threshold, _ = cv2.threshold(cv2.fastNlMeansDenoising(small), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return threshold
+    
+    def ocr_tile(self, tile: np.ndarray, box, core, page: int,
+                 preprocess: bool, threshold: Optional[float], lang: str, config: str) -> list:
+        """OCR one tile; returns the words whose center lies in its core, in image coordinates"""
+        _, stddev = cv2.meanStdDev(tile)
+        if stddev[0][0] < BLANK_TILE_STDDEV:
+            return []
+        if preprocess:
+            with self.span("preprocess", page):
+                tile = self.preprocess_array(tile, threshold)
+        with self.span("ocr", page):
+            data = pytesseract.image_to_data(Image.fromarray(tile), lang=lang, config=config,
+                                             output_type=pytesseract.Output.DICT)
+        words = []
+        for text, x, y, w, h in zip(data["text"], data["left"], data["top"], data["width"], data["height"]):
+            text = text.strip()
+            if not text:
+                continue
+            x, y = x + box[0], y + box[1]
+            center_x, center_y = x + w / 2, y + h / 2
+            if core[0] <= center_x < core[2] and core[1] <= center_y < core[3]:
+                words.append((x, y, w, h, text))
+        return words
+    
+    @staticmethod
+    def stitch_words(words: list) -> str:
+        """Put words from all the tiles back in reading order: lines top to bottom, words left to right"""
+        lines = []
+        for x, y, w, h, text in sorted(words, key=lambda word: word[1] + word[3] / 2):
+            center = y + h / 2
+            if lines and abs(center - lines[-1]["center"]) <= max(lines[-1]["height"], h) / 2:
+                line = lines[-1]
+                line["words"].append((x, text))
+                count = len(line["words"])
+                line["center"] += (center - line["center"]) / count
+                line["height"] += (h - line["height"]) / count
+            else:
+                lines.append({"center": center, "height": h, "words": [(x, text)]})
+        return "\n".join(" ".join(text for _, text in sorted(line["words"])) for line in lines)
+    
+    def ocr_frame_tiled(self, frame: np.ndarray, page: int, executor: ThreadPoolExecutor,
+                        preprocess: bool, lang: str, config: str) -> str:
+        """OCR a decoded grayscale frame tile by tile, at most 2 tiles per worker in flight"""
+        height, width = frame.shape
+        threshold = None
+        if preprocess:
+            with self.span("preprocess", page):
+                threshold = self.global_threshold(frame)
+        
+        words, pending = [], deque()
+        for box in self.tile_boxes(width, height):
+            if len(pending) >= self.tile_workers * 2:
+                words += pending.popleft().result()
+            # Copied here: the workers never share the frame
+            left, top, right, bottom = box
+            tile = np.ascontiguousarray(frame[top:bottom, left:right])
+            pending.append(executor.submit(self.ocr_tile, tile, box, self.tile_core(box, width, height),
+                                           page, preprocess, threshold, lang, config))
+        while pending:
+            words += pending.popleft().result()
+        return self.stitch_words(words)
+    
+    def iter_gray_frames(self, image_path: Union[str, Path]):
+        """
+        Decode the frames of an image one at a time as 8-bit grayscale arrays
+        
+        The size of each frame is checked from its header before it is
+        decoded. OpenCV decodes straight to grayscale (1 byte per pixel, never
+        the 3 of a color copy), one frame of a TIFF at a time; PIL only
+        decodes the frames OpenCV cannot read (e.g. GIF).
+        """
+        with self.open_image(image_path) as image:
+            frames = getattr(image, "n_frames", 1)
+            for index in range(frames):
+                image.seek(index)
+                self.check_size(image, image_path)
+                if frames == 1:
+                    gray = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+                else:
+                    ok, mats = cv2.imreadmulti(str(image_path), index, 1, flags=cv2.IMREAD_GRAYSCALE)
+                    gray = mats[0] if ok and mats else None
+                if gray is None:
+                    gray = np.asarray(image.convert("L"))
+                yield gray
+                del gray
+    
+    def extract_text_from_image_tiled(self, image_path: Union[str, Path],
+                                      preprocess: bool = True,
+                                      lang: str = 'eng',
+                                      config: str = None) -> str:
+        """
+        Extract text from a huge or multi-frame image (TIFF, GIF) with bounded memory
+        
+        Frames are decoded one at a time as 8-bit grayscale; denoising,
+        binarization and OCR run on overlapping tiles, in parallel, and the
+        words are stitched back in reading order. Each frame is a page.
+        """
+        config = config or '--oem 3 --psm 6'
+        pages = []
+        with ThreadPoolExecutor(max_workers=self.tile_workers, thread_name_prefix="ocr-tile") as executor:
+            frames = self.iter_gray_frames(image_path)
+            while True:
+                with self.span("load", len(pages) + 1):
+                    frame = next(frames, None)
+                if frame is None:
+                    break
+                pages.append(self.ocr_frame_tiled(frame, len(pages) + 1, executor, preprocess, lang, config))
+                del frame
+                self.count_page()
+        
+        if len(pages) == 1:
+            return pages[0]
+        return "".join(f"\n--- Page {number} ---\n{text}" for number, text in enumerate(pages, start=1))
+    
     def extract_text_from_image(self, image_path: Union[str, Path], 
                               preprocess: bool = True, 
                               lang: str = 'eng',
@@ -215,22 +694,33 @@ class TextExtractor:
         self.logger.info(f"Extracting text from image: {image_path}")
         
         try:
-            if preprocess:
-                # Use OpenCV for preprocessing
-                processed_img = self.preprocess_image(image_path)
-                image = Image.fromarray(processed_img)
-            else:
-                # Use PIL directly
-                image = Image.open(image_path)
-            
-            # Default config for better accuracy
-            if config is None:
-                config = '--oem 3 --psm 6'
-            
-            # Extract text
-            text = pytesseract.image_to_string(image, lang=lang, config=config)
-            
-            return text
+            with self.track(image_path):
+                with self.open_image(image_path) as image:
+                    tiled = self.needs_tiling(image)
+                if tiled:
+                    return self.extract_text_from_image_tiled(image_path, preprocess=preprocess, lang=lang,
+                                                              config=config)
+                
+                if preprocess:
+                    # Use OpenCV for preprocessing
+                    processed_img = self.preprocess_image(image_path)
+                    image = Image.fromarray(processed_img)
+                else:
+                    # Use PIL directly
+                    with self.span("load"):
+                        image = Image.open(image_path)
+                        image.load()
+                
+                # Default config for better accuracy
+                if config is None:
+                    config = '--oem 3 --psm 6'
+                
+                # Extract text
+                with self.span("ocr", 1):
+                    text = pytesseract.image_to_string(image, lang=lang, config=config)
+                self.count_page()
+                
+                return text
             
         except Exception as e:
             self.logger.error(f"Error extracting text from image: {e}")
@@ -253,6 +743,13 @@ class TextExtractor:
         else:
             raise ValueError(f"Unsupported file type: {file_path.suffix}")
     
+    def iter_supported_files(self, directory_path: Union[str, Path], recursive: bool = False):
+        """Yield the PDF and image files of a directory, in a stable (sorted) order"""
+        pattern = "**/*" if recursive else "*"
+        for file_path in sorted(Path(directory_path).glob(pattern)):
+            if file_path.is_file() and (self.is_pdf(file_path) or self.is_image(file_path)):
+                yield file_path
+    
     def extract_text_from_directory(self, directory_path: Union[str, Path], 
                                    output_dir: Optional[Union[str, Path]] = None,
                                    recursive: bool = False) -> dict:
@@ -277,29 +774,25 @@ class TextExtractor:
         
         results = {}
         
-        # Get all supported files
-        pattern = "**/*" if recursive else "*"
-        all_files = directory_path.glob(pattern)
-        
-        for file_path in all_files:
-            if file_path.is_file() and (self.is_pdf(file_path) or self.is_image(file_path)):
-                try:
-                    self.logger.info(f"Processing: {file_path}")
+        for file_path in self.iter_supported_files(directory_path, recursive):
+            try:
+                self.logger.info(f"Processing: {file_path}")
+                with self.track(file_path):
                     text = self.extract_text_from_file(file_path)
                     results[str(file_path)] = text
                     
                     # Save to output directory if specified
                     if output_dir:
                         output_file = output_dir / f"{file_path.stem}_extracted.txt"
-                        with open(output_file, 'w', encoding='utf-8') as f:
+                        with self.span("write"), open(output_file, 'w', encoding='utf-8') as f:
                             f.write(f"Extracted from: {file_path}\n")
                             f.write("=" * 50 + "\n\n")
                             f.write(text)
                         self.logger.info(f"Saved to: {output_file}")
-                        
-                except Exception as e:
-                    self.logger.error(f"Failed to process {file_path}: {e}")
-                    results[str(file_path)] = f"ERROR: {e}"
+                    
+            except Exception as e:
+                self.logger.error(f"Failed to process {file_path}: {e}")
+                results[str(file_path)] = f"ERROR: {e}"
         
         return results
 
@@ -308,7 +801,7 @@ def main():
     parser = argparse.ArgumentParser(description="Extract text from PDF files and images")
     parser.add_argument("input", help="Input file or directory path")
     parser.add_argument("-o", "--output", help="Output file or directory")
-    parser.add_argument("-m", "--method", choices=["auto", "pypdf2", "pdfplumber", "pymupdf"], 
+    parser.add_argument("-m", "--method", choices=["auto", "pypdf2", "pdfplumber", "pymupdf", "ocr"], 
                        default="auto", help="PDF extraction method")
     parser.add_argument("-l", "--lang", default="eng", help="OCR language (e.g., eng, fra, deu)")
     parser.add_argument("-p", "--preprocess", action="store_true", 
@@ -316,7 +809,13 @@ def main():
     parser.add_argument("-r", "--recursive", action="store_true", 
                        help="Process directories recursively")
     parser.add_argument("--tesseract-path", help="Path to tesseract executable")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE,
+                       help="Side in pixels of the tiles used for huge or multi-frame images")
+    parser.add_argument("--tile-workers", type=int, help="Tiles OCRed in parallel (default: number of CPUs)")
     parser.add_argument("-v", "--verbose", action="store_true", help="Verbose output")
+    parser.add_argument("--profile", action="store_true",
+                       help="Report per-stage timings, pages and bytes read for each file")
+    parser.add_argument("--profile-json", help="Append per-file profiling stats as JSON lines to this file")
     
     args = parser.parse_args()
     
@@ -325,32 +824,40 @@ def main():
         logging.getLogger().setLevel(logging.DEBUG)
     
     # Initialize extractor
-    extractor = TextExtractor(tesseract_path=args.tesseract_path)
+    sinks = []
+    if args.profile:
+        sinks.append(LoggingSink())
+    if args.profile_json:
+        sinks.append(JSONFileSink(args.profile_json))
+    extractor = TextExtractor(tesseract_path=args.tesseract_path, sinks=sinks,
+                              tile_size=args.tile_size, tile_workers=args.tile_workers)
     
     input_path = Path(args.input)
     
     try:
         if input_path.is_file():
             # Process single file
-            if extractor.is_pdf(input_path):
-                text = extractor.extract_text_from_pdf(input_path, method=args.method)
-            elif extractor.is_image(input_path):
-                text = extractor.extract_text_from_image(input_path, 
-                                                        preprocess=args.preprocess, 
-                                                        lang=args.lang)
-            else:
+            if not (extractor.is_pdf(input_path) or extractor.is_image(input_path)):
                 print(f"Unsupported file type: {input_path.suffix}")
                 sys.exit(1)
             
-            # Output
-            if args.output:
-                with open(args.output, 'w', encoding='utf-8') as f:
-                    f.write(text)
-                print(f"Text saved to: {args.output}")
-            else:
-                print("Extracted Text:")
-                print("=" * 50)
-                print(text)
+            with extractor.track(input_path):
+                if extractor.is_pdf(input_path):
+                    text = extractor.extract_text_from_pdf(input_path, method=args.method, lang=args.lang)
+                else:
+                    text = extractor.extract_text_from_image(input_path, 
+                                                            preprocess=args.preprocess, 
+                                                            lang=args.lang)
+                
+                # Output
+                if args.output:
+                    with extractor.span("write"), open(args.output, 'w', encoding='utf-8') as f:
+                        f.write(text)
+                    print(f"Text saved to: {args.output}")
+                else:
+                    print("Extracted Text:")
+                    print("=" * 50)
+                    print(text)
                 
         elif input_path.is_dir():
             # Process directory
@@ -0,0 +1,189 @@
+"""
+Facet counts over the archive
+
+FacetCount holds, for every profile and facet value, the number of the
+profile's non trashed files carrying it. Rows are kept up to date
+incrementally from the File signals, so a user's unfiltered facet summary
+(profile_counts) is one indexed range read. Filtered summaries are computed
+with a single GROUP BY over the user's matching files (counts_for).
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import AcademicYear, Course, Department, FacetCount, Faculty, File, Professor, University
+
+# facet name -> File attribute
+FACETS = {
+    'university': 'university_ref_id',
+    'faculty': 'faculty_ref_id',
+    'department': 'department_ref_id',
+    'professor': 'professor_ref_id',
+    'year': 'year_ref_id',
+    'file_category': 'file_category',
+    'course': 'course_id',
+}
+
+# facet name -> model whose ids are the values of the facet
+LABELS = {
+    'university': University,
+    'faculty': Faculty,
+    'department': Department,
+    'professor': Professor,
+    'year': AcademicYear,
+    'course': Course,
+}
+
+
+def normalize(value):
+    if value is None:
+        return None
+    value = str(value).strip()[:255]
+    return value or None
+
+
+def facet_values(file):
+    """Facet values of `file`, as a set of (profile id, facet, value); empty for trashed or ownerless files"""
+    if file.is_trashed or not file.uploaded_by_id:
+        return set()
+    values = set()
+    for facet, attribute in FACETS.items():
+        value = normalize(getattr(file, attribute))
+        if value is not None:
+            values.add((file.uploaded_by_id, facet, value))
+    return values
+
+
+def snapshot(file):
+    """Remember the facet values a File was loaded with, to diff them on save"""
+    deferred = file.get_deferred_fields()
+    if any(attribute in deferred for attribute in (*FACETS.values(), 'is_trashed', 'uploaded_by_id')):
+        file._facet_snapshot = None
+    else:
+        file._facet_snapshot = facet_values(file) if file.pk else set()
+
+
+def file_loaded(sender, instance, **kwargs):
+    snapshot(instance)
+
+
+def previous_values(file):
+    values = getattr(file, '_facet_snapshot', None)
+    if values is None:
+        # Loaded with deferred facet columns: fetch what is currently stored
+        stored = File.all_objects.filter(pk=file.pk).only('is_trashed', 'uploaded_by_id', *FACETS.values()).first()
+        values = facet_values(stored) if stored else set()
+    return values
+
+
+def file_saving(sender, instance, **kwargs):
+    # Read the stored values before they get overwritten
+    if instance.pk and getattr(instance, '_facet_snapshot', None) is None:
+        instance._facet_snapshot = previous_values(instance)
+
+
+def apply_delta(delta):
+    """Add the (profile id, facet, value) -> increment mapping `delta` to the count table"""
+    for (profile, facet, value), increment in delta.items():
+        if not increment:
+            continue
+        rows = FacetCount.objects.filter(profile_id=profile, facet=facet, value=value)
+        # A missing row is not decremented: it went with its profile (cascade deletion)
+        if rows.update(count=F('count') + increment) or increment < 0:
+            continue
+        try:
+            with transaction.atomic():
+                FacetCount.objects.create(profile_id=profile, facet=facet, value=value, count=increment)
+        except IntegrityError:
+            # Created concurrently in the meantime
+            rows.update(count=F('count') + increment)
+
+
+def file_saved(sender, instance, created, **kwargs):
+    old = set() if created else previous_values(instance)
+    new = facet_values(instance)
+    delta = Counter({key: 1 for key in new - old})
+    delta.subtract({key: 1 for key in old - new})
+    apply_delta(delta)
+    instance._facet_snapshot = new
+
+
+def file_deleted(sender, instance, **kwargs):
+    apply_delta(Counter({key: -1 for key in previous_values(instance)}))
+
+
+def add_files(files):
+    """Count files created without signals (bulk_create)"""
+    delta = Counter()
+    for file in files:
+        delta.update(facet_values(file))
+    apply_delta(delta)
+
+
+def group_counts(queryset):
+    """Count every facet over `queryset` with one GROUP BY on all facet columns"""
+    columns = list(FACETS.values())
+    counts = defaultdict(Counter)
+    for row in queryset.order_by().values(*columns).annotate(n=Count('pk')):
+        for facet, attribute in FACETS.items():
+            value = normalize(row[attribute])
+            if value is not None:
+                counts[facet][value] += row['n']
+    return counts
+
+
+def rebuild():
+    """Recompute the whole count table from the File rows"""
+    counts = defaultdict(Counter)
+    files = File.objects.filter(uploaded_by__isnull=False).order_by()
+    for row in files.values('uploaded_by_id', *FACETS.values()).annotate(n=Count('pk')).iterator():
+        for facet, attribute in FACETS.items():
+            value = normalize(row[attribute])
+            if value is not None:
+                counts[row['uploaded_by_id'], facet][value] += row['n']
+    rows = [
+        FacetCount(profile_id=profile, facet=facet, value=value, count=count)
+        for (profile, facet), values in counts.items()
+        for value, count in values.items()
+    ]
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def labels(facet, values):
+    """Display names of the ids `values` of a reference facet, in one query"""
+    model = LABELS.get(facet)
+    if model is None:
+        return {}
+    ids = [int(value) for value in values]
+    rows = model.objects.filter(pk__in=ids)
+    if model is AcademicYear:
+        return {str(pk): f"{start.year}-{end.year}" for pk, start, end in rows.values_list('pk', 'start', 'end')}
+    return {str(pk): name for pk, name in rows.values_list('pk', 'name')}
+
+
+def format_counts(counts, limit):
+    result = {}
+    for facet in FACETS:
+        top = counts.get(facet, Counter()).most_common(limit)
+        names = labels(facet, [value for value, _ in top]) if top else {}
+        result[facet] = [{'value': value, 'label': names.get(value, value), 'count': count} for value, count in top]
+    return result
+
+
+def profile_counts(profile, limit=None):
+    """Summary of all the profile's files, read from the count table"""
+    limit = limit or getattr(settings, 'FACETS_LIMIT', 20)
+    counts = defaultdict(Counter)
+    rows = FacetCount.objects.filter(profile=profile, count__gt=0).values_list('facet', 'value', 'count')
+    for facet, value, count in rows:
+        counts[facet][value] = count
+    return format_counts(counts, limit)
+
+
+def counts_for(queryset, limit=None):
+    return format_counts(group_counts(queryset), limit or getattr(settings, 'FACETS_LIMIT', 20))
@@ -0,0 +1,247 @@
+"""
+Ingestion of an existing archive directory
+
+    <root>/<university>/<faculty>/<department>/<course>/<file>.pdf
+
+The directory segments of each file are mapped to catalog rows (see
+api/catalog.py, missing ones are created). Files are hashed and their text
+extracted in a process pool, duplicates (same SHA-256) are skipped, and the
+rest is copied into the storage and committed with bulk_create, one batch
+per transaction. Committed paths are appended to a checkpoint file so an
+interrupted run resumes where it stopped.
+"""
+import hashlib
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.core.files import File as DjangoFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import facets, quotas, similarity
+from .catalog import COLUMNS, MAX_LENGTHS, CatalogImporter
+from .extractor import TextExtractor
+from .models import Course, File, FilePage
+from .normalize import Resolver
+from .previews import generate_previews
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LAYOUT = ['university', 'faculty', 'department', 'course']
+# Columns a course needs, from the layout or the defaults
+COURSE_COLUMNS = ['degree', 'degree_year', 'academic_year']
+# Layout segment that is ignored
+SKIP_SEGMENT = '-'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_extractor = None
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_text(path):
+    """Pool worker: (text, error) of one file, runs in a child process without database access"""
+    global _extractor
+    if _extractor is None:
+        _extractor = TextExtractor()
+    try:
+        return _extractor.extract_text_from_file(path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def parse_layout(layout):
+    columns = layout.split('/') if isinstance(layout, str) else list(layout)
+    unknown = [column for column in columns if column != SKIP_SEGMENT and column not in COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown layout segments: {', '.join(unknown)} (expected {', '.join(COLUMNS)} or '-')")
+    return columns
+
+
+class Checkpoint:
+    """Append-only list of the relative paths already committed"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = set()
+        if self.path.exists():
+            self.done = set(self.path.read_text(encoding='utf-8').splitlines())
+
+    def add(self, paths):
+        paths = [path for path in paths if path not in self.done]
+        if not paths:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(f"{path}\n" for path in paths))
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(paths)
+
+
+class ArchiveIngester:
+    def __init__(self, root, layout=None, defaults=None, profile=None, checkpoint=None,
+                 workers=None, batch_size=50, previews=False):
+        self.root = Path(root)
+        self.layout = parse_layout(layout or DEFAULT_LAYOUT)
+        if 'course' not in self.layout:
+            raise ValueError("The layout must contain a 'course' level")
+        self.defaults = {column: value for column, value in (defaults or {}).items() if value}
+        # Courses are looked up by degree and academic year: without them every file would be rejected
+        missing = [column for column in COURSE_COLUMNS if column not in self.layout and column not in self.defaults]
+        if missing:
+            raise ValueError(f"Missing course columns: {', '.join(missing)} "
+                             f"(put them in the layout or give their default value)")
+        self.profile = profile
+        self.checkpoint = Checkpoint(checkpoint or self.root / '.ingest_checkpoint')
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.previews = previews
+
+        self.catalog = CatalogImporter()
+        self.resolver = Resolver()
+        self.extractor = TextExtractor()
+        self.field = File._meta.get_field('file')
+        self.seen = set()
+        self.stats = Counter()
+        self.errors = []
+
+    def relative(self, path):
+        return path.relative_to(self.root).as_posix()
+
+    def row_for(self, path):
+        """Catalog row (university, faculty, ..., course) of a file, from its directories"""
+        segments = path.relative_to(self.root).parts[:-1]
+        if len(segments) != len(self.layout):
+            return None
+        row = dict(self.defaults)
+        for column, segment in zip(self.layout, segments):
+            if column != SKIP_SEGMENT:
+                row[column] = segment.strip()[:MAX_LENGTHS.get(column, len(segment))]
+        return row
+
+    def pending(self):
+        for path in self.extractor.iter_supported_files(self.root, recursive=True):
+            if self.relative(path) in self.checkpoint.done:
+                self.stats['already_done'] += 1
+            else:
+                yield path
+
+    def run(self):
+        batch = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for path in self.pending():
+                batch.append(path)
+                if len(batch) >= self.batch_size:
+                    self.ingest_batch(pool, batch)
+                    batch = []
+            if batch:
+                self.ingest_batch(pool, batch)
+        return self.report()
+
+    def ingest_batch(self, pool, paths):
+        mapped = []
+        for path in paths:
+            row = self.row_for(path)
+            if row is None:
+                self.fail(path, f"expected {len(self.layout)} directory levels ({'/'.join(self.layout)})")
+            else:
+                mapped.append((path, row))
+
+        checksums = list(pool.map(hash_file, [path for path, _ in mapped]))
+        existing = set(File.all_objects.filter(checksum__in=checksums).values_list('checksum', flat=True))
+        new, duplicates = [], []
+        for (path, row), checksum in zip(mapped, checksums):
+            if checksum in existing or checksum in self.seen:
+                duplicates.append(path)
+            else:
+                self.seen.add(checksum)
+                new.append((path, row, checksum))
+        self.stats['duplicates'] += len(duplicates)
+
+        texts = list(pool.map(extract_text, [path for path, _, _ in new]))
+        stored = []
+        try:
+            with transaction.atomic():
+                files, committed = self.create_files(new, texts, stored)
+        except Exception:
+            # Nothing was committed: don't leave orphan copies in the storage
+            for name in stored:
+                default_storage.delete(name)
+            raise
+
+        self.checkpoint.add([self.relative(path) for path in duplicates]
+                            + [self.relative(path) for path in committed])
+        logger.info("Ingested %d files (%d duplicates) from %s", len(files), len(duplicates), self.root)
+        if self.previews:
+            for file in files:
+                try:
+                    generate_previews(file)
+                except Exception:
+                    logger.exception("generate_previews failed for %s", file.file.name)
+
+    def create_files(self, new, texts, stored):
+        self.catalog.import_batch([(self.relative(path), row) for path, row, _ in new])
+        self.errors += [{'path': error['line'], 'error': error['error']} for error in self.catalog.errors]
+        self.catalog.errors = []
+
+        files, committed = [], []
+        for (path, row, checksum), (text, error) in zip(new, texts):
+            if not row.get(Course):
+                # Rejected by the catalog import, reported in self.errors
+                self.stats['failed'] += 1
+                continue
+            if error:
+                self.fail(path, error, count=False)
+                self.stats['extraction_failed'] += 1
+            with open(path, 'rb') as f:
+                name = default_storage.save(self.field.generate_filename(None, path.name), DjangoFile(f))
+            stored.append(name)
+            file = File(
+                course_id=row[Course],
+                name=path.name,
+                file=name,
+                text=text,
+                size=path.stat().st_size,
+                file_type=path.suffix[1:].lower(),
+                checksum=checksum,
+                uploaded_by=self.profile,
+            )
+            self.resolver.apply(file)
+            similarity.set_signature(file)
+            files.append(file)
+            committed.append(path)
+
+        File.objects.bulk_create(files, batch_size=self.batch_size)
+        FilePage.objects.bulk_create(
+            (FilePage(file=file, number=number, text=page)
+             for file in files if file.text
+             for number, page in enumerate(TextExtractor.split_pages(file.text), start=1)),
+            batch_size=500,
+        )
+        similarity.add_bands(files)
+        facets.add_files(files)
+        quotas.add_files(files)
+        self.stats['ingested'] += len(files)
+        return files, committed
+
+    def fail(self, path, error, count=True):
+        self.errors.append({'path': self.relative(path), 'error': error})
+        if count:
+            self.stats['failed'] += 1
+
+    def report(self):
+        return {
+            **self.stats,
+            'catalog_created': dict(self.catalog.created),
+            'errors': len(self.errors),
+            'first_errors': self.errors[:50],
+        }
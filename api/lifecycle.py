@@ -0,0 +1,143 @@
+"""
+Trash lifecycle
+
+Trashed files stay restorable for TRASH_RETENTION_DAYS, then purge() deletes
+them for good. Each batch of rows is deleted in its own short transaction
+(the File signals keep the facet counts and quotas right), and the blobs it
+leaves are recorded as PendingDeletion rows in that same transaction. The
+blobs are only removed from the storage after the commit, and whatever fails
+stays pending for the next run: a crash or a storage outage never leaves a
+row pointing to a missing blob nor a blob nobody knows about.
+
+The optimiser queues the originals it replaces the same way, with a
+not_before date so that their URL keeps working for a while.
+"""
+import datetime
+import logging
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import File, FilePreview, PendingDeletion
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = 100
+
+
+def expired(days=None):
+    """Trashed files older than `days` (TRASH_RETENTION_DAYS)"""
+    days = days if days is not None else getattr(settings, 'TRASH_RETENTION_DAYS', 30)
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    # Files trashed before trashed_at existed fall back to their last update
+    return File.all_objects.trashed().filter(
+        Q(trashed_at__lt=cutoff) | Q(trashed_at__isnull=True, updated_at__lt=cutoff)
+    )
+
+
+def blob_names(ids):
+    names = set()
+    for file, original in File.all_objects.filter(pk__in=ids).values_list('file', 'original_file'):
+        names.update(name for name in (file, original) if name)
+    names.update(FilePreview.objects.filter(file_id__in=ids).values_list('image', flat=True))
+    return names
+
+
+def still_used(names):
+    """Blobs shared with rows that are kept (previews are content addressed)"""
+    used = set(FilePreview.objects.filter(image__in=names).values_list('image', flat=True))
+    used.update(File.all_objects.filter(file__in=names).values_list('file', flat=True))
+    used.update(File.all_objects.filter(original_file__in=names).values_list('original_file', flat=True))
+    return used
+
+
+def purge_batch(files, ids):
+    """Delete the rows `ids` of `files` and queue their blobs; returns the number of files deleted"""
+    with transaction.atomic():
+        # Locked and checked again: a file restored meanwhile is kept
+        ids = list(files.filter(pk__in=ids).select_for_update().values_list('pk', flat=True))
+        names = blob_names(ids)
+        # defer: the signal receivers never read the text
+        deleted = File.all_objects.filter(pk__in=ids).defer('text').delete()[1].get(File._meta.label, 0)
+        names -= still_used(names)
+        PendingDeletion.objects.bulk_create(
+            [PendingDeletion(name=name) for name in names], ignore_conflicts=True,
+        )
+    return deleted
+
+
+def due():
+    """Queued blobs that can be deleted now"""
+    return PendingDeletion.objects.filter(Q(not_before__isnull=True) | Q(not_before__lte=timezone.now()))
+
+
+def delete_blob(name, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            default_storage.delete(name)
+            return None
+        except Exception as e:
+            error = e
+            if attempt < retries:
+                time.sleep(backoff * 2 ** attempt)
+    return error
+
+
+def delete_pending(batch_size=PURGE_BATCH_SIZE, retries=None, backoff=None):
+    """Remove the queued blobs from the storage; returns (deleted, failed)"""
+    retries = retries if retries is not None else getattr(settings, 'TRASH_STORAGE_RETRIES', 3)
+    backoff = backoff if backoff is not None else getattr(settings, 'TRASH_STORAGE_BACKOFF', 0.5)
+    deleted = failed = 0
+    last = 0
+    while True:
+        pending = list(due().filter(pk__gt=last).order_by('pk')[:batch_size])
+        if not pending:
+            return deleted, failed
+        last = pending[-1].pk
+        done, errors = [], []
+        for blob in pending:
+            error = delete_blob(blob.name, retries, backoff)
+            if error is None:
+                done.append(blob.pk)
+            else:
+                logger.warning("Could not delete %s: %s", blob.name, error)
+                blob.attempts += 1
+                blob.last_error = str(error)
+                errors.append(blob)
+        PendingDeletion.objects.filter(pk__in=done).delete()
+        PendingDeletion.objects.bulk_update(errors, ['attempts', 'last_error'])
+        deleted += len(done)
+        failed += len(errors)
+
+
+def purge(days=None, batch_size=None, dry_run=False):
+    """
+    Delete the files trashed for more than `days` and their blobs
+
+    Returns {'files': ..., 'blobs': ..., 'failed': ...}, `failed` being the
+    blobs still pending; with dry_run only counts the files that would go.
+    """
+    batch_size = batch_size or getattr(settings, 'TRASH_PURGE_BATCH_SIZE', PURGE_BATCH_SIZE)
+    files = expired(days)
+    if dry_run:
+        return {'files': files.count(), 'blobs': 0, 'failed': 0}
+
+    # Blobs left over by a previous run first
+    blobs, _ = delete_pending(batch_size)
+    purged = 0
+    while True:
+        ids = list(files.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        purged += purge_batch(files, ids)
+        deleted, errors = delete_pending(batch_size)
+        blobs += deleted
+        if purged and not deleted and errors:
+            # Storage down: stop adding to the queue, the next run takes over
+            logger.error("Storage deletions failing, purge stopped after %d files", purged)
+            break
+    return {'files': purged, 'blobs': blobs, 'failed': due().count()}
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import facets
+from api.models import File
+from api.normalize import REFERENCES, Resolver
+
+
+class Command(BaseCommand):
+    help = "Resolve the text metadata of the files (university, faculty, department, professor, year) to references"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--force', action='store_true', help="Also re-resolve files that already have references")
+
+    def handle(self, *args, **options):
+        resolver = Resolver()
+        fields = [*REFERENCES.values(), *REFERENCES]
+        seen = updated = last = 0
+
+        while True:
+            batch = list(
+                File.all_objects.filter(pk__gt=last).order_by('pk')
+                .only('course', *fields)[:options['batch_size']]
+            )
+            if not batch:
+                break
+            resolver.load_courses(file.course_id for file in batch)
+            changed = [file for file in batch if resolver.apply(file, force=options['force'])]
+            with transaction.atomic():
+                File.all_objects.bulk_update(changed, fields)
+            seen += len(batch)
+            updated += len(changed)
+            last = batch[-1].pk
+            self.stdout.write(f"{seen} files, {updated} updated")
+
+        # bulk_update doesn't send signals: recount the facets
+        facets.rebuild()
+        unresolved = ", ".join(f"{field}: {count}" for field, count in resolver.unresolved.items()) or "none"
+        self.stdout.write(self.style.SUCCESS(f"Done: {updated}/{seen} files updated, unresolved texts: {unresolved}"))
@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api import similarity
+from api.models import File
+
+
+class Command(BaseCommand):
+    help = "List the groups of near-duplicate files (MinHash similarity of their text)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, help="Minimum similarity (default: MINHASH_THRESHOLD)")
+        parser.add_argument('--backfill', action='store_true',
+                            help="First compute the signatures of the files extracted before near-duplicate detection")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            count = similarity.backfill()
+            self.stderr.write(f"{count} signatures computed")
+
+        groups, scores = similarity.duplicate_groups(options['threshold'])
+        ids = [file_id for group in groups for file_id in group]
+        files = File.objects.defer('text', 'minhash').in_bulk(ids)
+        best = {}
+        for (a, b), score in scores.items():
+            best[a] = max(best.get(a, 0), score)
+            best[b] = max(best.get(b, 0), score)
+
+        report = [
+            [{
+                'id': file_id,
+                'uuid': str(files[file_id].uuid),
+                'name': str(files[file_id]),
+                'course': files[file_id].course_id,
+                'size': files[file_id].size,
+                'created_at': files[file_id].created_at.isoformat(),
+                'similarity': round(best[file_id], 3),
+            } for file_id in group if file_id in files]
+            for group in groups
+        ]
+        if options['json']:
+            self.stdout.write(json.dumps({'groups': report}, ensure_ascii=False, indent=2))
+            return
+        for number, group in enumerate(report, start=1):
+            self.stdout.write(f"Group {number} ({len(group)} files)")
+            for file in group:
+                self.stdout.write(f"  {file['uuid']}  {file['similarity']:.3f}  {file['size'] or 0:>10}  {file['name']}")
+        duplicates = sum(len(group) - 1 for group in report)
+        self.stdout.write(self.style.SUCCESS(f"{len(report)} groups, {duplicates} redundant files"))
@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import FILTERS, FORMATS, select_files, stream_archive
+
+
+class Command(BaseCommand):
+    help = "Write a zip or tar of the selected files and their manifest, streamed without holding it in memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Archive path, '-' for stdout")
+        parser.add_argument('--archive', choices=list(FORMATS), help="Default: from the output extension, else zip")
+        parser.add_argument('--with-text', action='store_true', help="Include the extracted text of each file")
+        parser.add_argument('--all', action='store_true', help="Export every file instead of a selection")
+        for name in FILTERS:
+            parser.add_argument(f'--{name}', type=int, help=f"id of the {name} to export")
+
+    def handle(self, *args, **options):
+        selection = {name: options[name] for name in FILTERS}
+        if not options['all'] and not any(selection.values()):
+            raise CommandError(f"Select files with --all or one of: {', '.join('--' + name for name in FILTERS)}")
+        archive_format = options['archive'] or ('tar' if options['output'].endswith('.tar') else 'zip')
+
+        files = select_files(with_text=options['with_text'], **selection)
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in stream_archive(files, archive_format, options['with_text']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
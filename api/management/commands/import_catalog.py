@@ -0,0 +1,22 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.catalog import CatalogError, import_catalog
+
+
+class Command(BaseCommand):
+    help = "Import universities, faculties, departments, degrees and courses from a CSV, XLSX or XLS file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Validate and count, then roll back")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = import_catalog(stream, options['path'], options['batch_size'], options['dry_run'])
+        except (OSError, CatalogError, ImportError) as e:
+            raise CommandError(e)
+        self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
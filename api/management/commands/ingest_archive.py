@@ -0,0 +1,48 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.ingest import DEFAULT_LAYOUT, ArchiveIngester
+from api.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Import a directory tree of PDFs and images as files, mapping directories to the catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--layout', default='/'.join(DEFAULT_LAYOUT),
+                            help="Meaning of the directory levels, '-' to ignore one (default: %(default)s)")
+        parser.add_argument('--degree', help="Degree of the courses, required when not in the layout")
+        parser.add_argument('--degree-year', help="Degree year of the courses, required when not in the layout")
+        parser.add_argument('--academic-year', help="Academic year of the courses (e.g. 2024-2025), required when not in the layout")
+        parser.add_argument('--profile', help="uuid of the profile the files are uploaded by")
+        parser.add_argument('--checkpoint', help="Checkpoint file (default: <directory>/.ingest_checkpoint)")
+        parser.add_argument('--workers', type=int, help="Hashing and extraction processes (default: CPU count)")
+        parser.add_argument('--batch-size', type=int, default=50, help="Files committed per transaction")
+        parser.add_argument('--previews', action='store_true', help="Also generate the thumbnails")
+
+    def handle(self, *args, **options):
+        profile = None
+        if options['profile']:
+            profile = Profile.objects.filter(uuid=options['profile']).first()
+            if profile is None:
+                raise CommandError(f"Unknown profile {options['profile']}")
+        try:
+            ingester = ArchiveIngester(
+                options['directory'],
+                layout=options['layout'],
+                defaults={
+                    'degree': options['degree'],
+                    'degree_year': options['degree_year'],
+                    'academic_year': options['academic_year'],
+                },
+                profile=profile,
+                checkpoint=options['checkpoint'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                previews=options['previews'],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write(json.dumps(ingester.run(), indent=2, ensure_ascii=False))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import audit
+
+
+class Command(BaseCommand):
+    help = "Delete the audit events older than AUDIT_RETENTION_DAYS (the web workers also do it daily)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Retention in days (default: AUDIT_RETENTION_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=audit.PRUNE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        deleted = audit.prune(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} audit events deleted"))
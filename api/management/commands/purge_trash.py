@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api import lifecycle
+
+
+class Command(BaseCommand):
+    help = "Delete the files trashed for more than TRASH_RETENTION_DAYS and their blobs (run it periodically)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Retention in days (default: TRASH_RETENTION_DAYS)")
+        parser.add_argument('--batch-size', type=int, help="Files per transaction (default: TRASH_PURGE_BATCH_SIZE)")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the files to purge")
+
+    def handle(self, *args, **options):
+        result = lifecycle.purge(options['days'], options['batch_size'], dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f"{result['files']} files would be purged")
+            return
+        self.stdout.write(self.style.SUCCESS(f"{result['files']} files purged, {result['blobs']} blobs deleted"))
+        if result['failed']:
+            self.stdout.write(self.style.WARNING(f"{result['failed']} blobs could not be deleted, retried on the next run"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import facets
+
+
+class Command(BaseCommand):
+    help = "Recompute the facet count table from the files (after bulk imports or raw updates)"
+
+    def handle(self, *args, **options):
+        rows = facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{rows} facet values counted"))
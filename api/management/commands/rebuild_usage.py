@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import quotas
+
+
+class Command(BaseCommand):
+    help = "Recompute the per profile file count and storage totals from the files"
+
+    def handle(self, *args, **options):
+        profiles = quotas.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Usage recomputed for {profiles} profiles"))
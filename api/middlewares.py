@@ -1,11 +1,69 @@
 from django.utils.deprecation import MiddlewareMixin
-from django.http import JsonResponse
-import traceback
+from django.http import Http404, JsonResponse
+from django.core.exceptions import BadRequest, PermissionDenied, SuspiciousOperation
+from django.conf import settings
+from django.db import connections
+from contextlib import ExitStack
+from . import errors, metrics
+import logging
+import time
+
+logger = logging.getLogger(__name__)
 
 class DisableCSRF(MiddlewareMixin):
 	def process_request(self, request):
 		setattr(request, '_dont_enforce_csrf_checks', True)
 
+class QueryTimer:
+	"""Database execute wrapper counting queries and the time spent in them"""
+	def __init__(self):
+		self.count = 0
+		self.duration = 0.0
+
+	def __call__(self, execute, sql, params, many, context):
+		start = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			self.count += 1
+			self.duration += time.perf_counter() - start
+
+class MetricsMiddleware(object):
+	"""Record latency, DB queries and response size of every request, per resolved view"""
+	def __init__(self, get_response):
+		self.get_response = get_response
+		self.slow_request_ms = getattr(settings, 'METRICS_SLOW_REQUEST_MS', 1000)
+
+	def __call__(self, request):
+		timer = QueryTimer()
+		start = time.perf_counter()
+		with ExitStack() as stack:
+			for connection in connections.all():
+				stack.enter_context(connection.execute_wrapper(timer))
+			response = self.get_response(request)
+		duration = time.perf_counter() - start
+
+		match = getattr(request, 'resolver_match', None)
+		view = (match.view_name or match.route) if match else '<unresolved>'
+		if response.streaming:
+			size = int(response.get('Content-Length') or 0)
+		else:
+			size = len(response.content)
+
+		metrics.REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+		metrics.REQUEST_DURATION.observe(duration, view=view, method=request.method)
+		metrics.REQUEST_QUERIES.observe(timer.count, view=view)
+		metrics.REQUEST_DB_DURATION.observe(timer.duration, view=view)
+		metrics.RESPONSE_SIZE.observe(size, view=view)
+
+		if duration * 1000 >= self.slow_request_ms:
+			logger.warning(
+				"Slow request: %s %s (%s) %d in %.0f ms, %d queries in %.0f ms, %d bytes",
+				request.method, request.path, view, response.status_code,
+				duration * 1000, timer.count, timer.duration * 1000, size,
+			)
+		return response
+
 class ExceptionMiddleware(object):
 	def __init__(self, get_response):
 		self.get_response = get_response
@@ -15,7 +73,10 @@ class ExceptionMiddleware(object):
 		return response
 
 	def process_exception(self, request, exception:Exception):
-		
+		# Left to Django, which turns them into 404/403/400 responses
+		if isinstance(exception, (Http404, PermissionDenied, SuspiciousOperation, BadRequest)):
+			return None
+
 		message = str(exception)
 		if "Duplicate entry '" in message:
 			message =  "Umwanya wo gusubiramwo iki igikorwa uku nyene nturakwira."
@@ -25,21 +86,15 @@ class ExceptionMiddleware(object):
 			}
 			return JsonResponse(data=data, status=500)
 	
-		try:
-			raise exception
-		except Exception:
-			lines = traceback.format_exc().splitlines()
-			list_errors = []
-			for line in lines:
-				if __package__ in str(line):
-					list_errors.append(str(line).split("/")[-1])
-			if len(list_errors) > 1:
-				for line in list_errors[-2:]:
-					print("[ERREUR]", str(line))
-			else:
-				print("[ERREUR]", str(list_errors[0]))
+		entry, should_log, suppressed = errors.REGISTRY.record(exception, request.path)
+		if should_log:
+			location = " <- ".join(reversed(entry.frames[-2:])) or "?"
+			repeated = f" (+{suppressed} identiques depuis le dernier rapport)" if suppressed else ""
+			logger.error("[ERREUR] %s %s: %s: %s at %s [%s]%s", request.method, request.path,
+				entry.type, message, location, entry.fingerprint, repeated)
+		# The details stay in the registry and the log
 		data = {
 			'code': 'Internal server error',
-			'message': str(exception)
+			'message': "Une erreur interne est survenue."
 		}
 		return JsonResponse(data=data, status=500)
\ No newline at end of file
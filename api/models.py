@@ -6,6 +6,7 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 import uuid
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
+from django.utils import timezone
 
 class UidModel(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, db_index=True)
@@ -19,12 +20,23 @@ class Profile(UidModel):
         return f"{self.user} {self.uuid}"
 
 class AuditLog(models.Model):
-    profile = models.OneToOneField(Profile, on_delete=models.CASCADE)
+    """Append-only log of user actions, written in batches by api/audit.py"""
+    profile = models.ForeignKey(Profile, on_delete=models.SET_NULL, null=True, blank=True, related_name='audit_logs')
     action = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # uuid of the object acted upon, if any
+    target = models.UUIDField(null=True, blank=True)
+    ip = models.GenericIPAddressField(null=True, blank=True)
+    # Time of the action (not of the flush)
+    timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['profile', '-timestamp'], name='auditlog_profile_time_idx'),
+        ]
 
     def __str__(self):
-        return f"[{self.timestamp}] {self.profile.user.username}: {self.action}"
+        return f"[{self.timestamp}] {self.profile_id}: {self.action}"
 
 class AcademicYear(models.Model):
     start = models.DateField()
@@ -83,6 +95,28 @@ class Course(models.Model):
 
     def __str__(self):
         return f"{self.name}"
+
+class Professor(models.Model):
+    name = models.CharField(max_length=255)
+    # Case and accent insensitive form of the name, used to merge spelling variants
+    key = models.CharField(max_length=255, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+class FileQuerySet(models.QuerySet):
+    def trashed(self):
+        return self.filter(is_trashed=True)
+
+class ActiveFileManager(models.Manager.from_queryset(FileQuerySet)):
+    """Default manager: files in the trash are left out (see the partial indexes on File)"""
+    def get_queryset(self):
+        return super().get_queryset().filter(is_trashed=False)
+
 class File(UidModel):
     
     FILE_CATEGORY = [
@@ -98,12 +132,28 @@ class File(UidModel):
     file = models.FileField(upload_to="fichiers/", null=True, blank=True)
     text = models.TextField(null=True, blank=True)
     size = models.BigIntegerField(null=True, blank=True)
+    original_file = models.FileField(upload_to="originaux/", null=True, blank=True)
+    original_size = models.BigIntegerField(null=True, blank=True)
+    # SHA-256 of the content as received, used to skip duplicates when ingesting archives
+    checksum = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # MinHash signature of the text (api/similarity.py), for near-duplicate detection
+    minhash = models.BinaryField(null=True, blank=True, editable=False)
     file_type = models.CharField(max_length=50, blank=True)
     file_category = models.CharField(max_length=20, choices=FILE_CATEGORY, default='cours')
     is_trashed = models.BooleanField(default=False)
+    # When the file was put in the trash; purge_trash deletes it TRASH_RETENTION_DAYS later
+    trashed_at = models.DateTimeField(null=True, blank=True)
     uploaded_by = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='files', null=True, blank=True)
     nb_retrieved = models.PositiveBigIntegerField(default=0)
     
+    # Normalized metadata, resolved from the text columns below by api/normalize.py
+    university_ref = models.ForeignKey(University, on_delete=models.SET_NULL, null=True, blank=True, related_name='files')
+    faculty_ref = models.ForeignKey(Faculty, on_delete=models.SET_NULL, null=True, blank=True, related_name='files')
+    department_ref = models.ForeignKey(Department, on_delete=models.SET_NULL, null=True, blank=True, related_name='files')
+    professor_ref = models.ForeignKey(Professor, on_delete=models.SET_NULL, null=True, blank=True, related_name='files')
+    year_ref = models.ForeignKey(AcademicYear, on_delete=models.SET_NULL, null=True, blank=True, related_name='files')
+
+    # Compatibility: free text kept in sync with the references above, do not filter on these
     university = models.TextField(null=True,blank=True)
     faculty = models.TextField(null=True,blank=True)
     department = models.TextField(null=True,blank=True)
@@ -112,13 +162,132 @@ class File(UidModel):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ActiveFileManager()
+    # Trashed files included: maintenance code, admin, purge
+    all_objects = FileQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if self.file:
             self.size = self.file.size
             self.file_type = os.path.splitext(self.file.name)[1][1:].lower()
         elif self.text:
             self.file_type = ".txt"
+        if self.is_trashed != (self.trashed_at is not None):
+            self.trashed_at = timezone.now() if self.is_trashed else None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'trashed_at' not in update_fields:
+                kwargs['update_fields'] = [*update_fields, 'trashed_at']
         super().save(*args, **kwargs)
 
+    def trash(self):
+        self.is_trashed = True
+        self.save(update_fields=['is_trashed', 'updated_at'])
+
+    def restore(self):
+        self.is_trashed = False
+        self.save(update_fields=['is_trashed', 'updated_at'])
+
+    class Meta:
+        # Related lookups, refresh_from_db and deferred loads must still reach trashed rows
+        base_manager_name = 'all_objects'
+        indexes = [
+            models.Index(fields=['file_category'], name='file_category_idx'),
+            # Admin changelist, newest first (the admin adds -pk to the ordering)
+            models.Index(fields=['-created_at', '-id'], name='file_created_idx'),
+            models.Index(fields=['is_trashed', '-created_at', '-id'], name='file_trashed_created_idx'),
+            models.Index(fields=['uploaded_by', '-created_at'], condition=models.Q(is_trashed=False),
+                         name='file_active_owner_idx'),
+            models.Index(fields=['trashed_at'], condition=models.Q(is_trashed=True), name='file_trash_purge_idx'),
+        ]
+
+    def __str__(self):
+        return self.name or os.path.basename(self.file.name or '') or str(self.uuid)
+
+class FilePage(models.Model):
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='pages')
+    number = models.PositiveIntegerField()
+    text = models.TextField(blank=True, default='')
+
+    class Meta:
+        ordering = ['number']
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'number'], name='unique_file_page'),
+        ]
+
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return f"{self.file_id} p{self.number}"
+
+class FilePreview(models.Model):
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='previews')
+    size = models.PositiveIntegerField()
+    digest = models.CharField(max_length=64, db_index=True)
+    image = models.ImageField(upload_to="previews/")
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['size']
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'size'], name='unique_file_preview_size'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_id} {self.size}px"
+
+class MinHashBand(models.Model):
+    """One LSH band of a file's MinHash signature: files sharing a bucket are duplicate candidates"""
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='minhash_bands')
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'bucket'], name='minhash_band_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_id} band {self.band}"
+
+class FacetCount(models.Model):
+    """Number of a profile's non trashed files per facet value, maintained incrementally by api/facets.py"""
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='facet_counts')
+    facet = models.CharField(max_length=32)
+    value = models.CharField(max_length=255)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['profile', 'facet', '-count']
+        indexes = [
+            models.Index(fields=['profile', 'facet', '-count'], name='facet_count_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'facet', 'value'], name='unique_facet_value'),
+        ]
+
+    def __str__(self):
+        return f"{self.profile_id}: {self.facet}={self.value} ({self.count})"
+
+
+class ProfileUsage(models.Model):
+    """Running totals of a profile's consumption, maintained incrementally by api/quotas.py"""
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, related_name='usage')
+    files = models.IntegerField(default=0)
+    storage_bytes = models.BigIntegerField(default=0)
+    ocr_pages = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.profile}: {self.files} files, {self.storage_bytes} bytes, {self.ocr_pages} OCR pages"
+
+
+class PendingDeletion(models.Model):
+    """Storage blob left by a purged file or an optimised upload, deleted (and retried) by api/lifecycle.py"""
+    name = models.CharField(max_length=255, unique=True)
+    # Kept until then: the original of an optimised upload stays reachable at the URL returned earlier
+    not_before = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
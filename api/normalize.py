@@ -0,0 +1,300 @@
+"""
+Resolution of File's free text metadata (university, faculty, department,
+professor, year) to foreign keys
+
+The reference tables are small, so a Resolver loads each of them once, on
+first use, and resolves any number of files without a query per file.
+Values are compared case, accent and punctuation insensitively; what the
+text does not resolve is taken from the file's course chain, read in one
+query with the names of its objects, so that a file saved with no text
+never loads the tables.
+"""
+import re
+import unicodedata
+from collections import Counter
+from functools import cached_property
+
+from .models import AcademicYear, Course, Department, Faculty, Professor, University
+
+# text column -> reference field
+REFERENCES = {
+    'university': 'university_ref',
+    'faculty': 'faculty_ref',
+    'department': 'department_ref',
+    'professor': 'professor_ref',
+    'year': 'year_ref',
+}
+
+# text column -> Resolver table
+TABLES = {
+    'university': 'universities',
+    'faculty': 'faculties',
+    'department': 'departments',
+    'professor': 'professors',
+    'year': 'years',
+}
+
+# Optional: a file with neither professor nor professor_ref is complete
+OPTIONAL = {'professor'}
+# Taken from the course when the text does not resolve them
+COURSE_REFERENCES = {'university', 'faculty', 'department', 'year'}
+# Sources of the references, remembered on load to notice the changes
+SNAPSHOT_FIELDS = ['course_id', *REFERENCES, *(f'{ref}_id' for ref in REFERENCES.values())]
+
+YEAR_RE = re.compile(r'\d{4}')
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def normalize_key(value):
+    """'Université  de Kinshasa' -> 'universite de kinshasa'"""
+    value = unicodedata.normalize('NFKD', str(value or ''))
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return ' '.join(NON_WORD_RE.sub(' ', value.casefold()).split())
+
+
+def year_key(value):
+    """'2023-2024', '2023 / 2024' and 'Année 2023-2024' -> '2023 2024'"""
+    return ' '.join(YEAR_RE.findall(str(value or '')))
+
+
+class Resolver:
+    """
+    Maps metadata strings to ids
+
+    Each table is an (index, labels) pair: index maps a normalized key to the
+    set of (id, parent id) it may designate, labels maps an id to its name.
+    Unknown professors are created; other unknown values stay unresolved
+    and are counted in `unresolved`.
+    """
+
+    def __init__(self, create_professors=True):
+        self.create_professors = create_professors
+        self.courses = {}
+        self.unresolved = Counter()
+
+    @staticmethod
+    def table(rows):
+        index, labels = {}, {}
+        for pk, parent, label, *keys in rows:
+            labels[pk] = label
+            for key in keys:
+                if key:
+                    index.setdefault(key, set()).add((pk, parent))
+        return index, labels
+
+    @cached_property
+    def universities(self):
+        return self.table(
+            (pk, None, name, normalize_key(name), normalize_key(acronym))
+            for pk, name, acronym in University.objects.values_list('id', 'name', 'acronym')
+        )
+
+    @cached_property
+    def faculties(self):
+        return self.table(
+            (pk, university, name, normalize_key(name), normalize_key(code))
+            for pk, university, name, code in Faculty.objects.values_list('id', 'university_id', 'name', 'code')
+        )
+
+    @cached_property
+    def departments(self):
+        return self.table(
+            (pk, faculty, name, normalize_key(name), normalize_key(code))
+            for pk, faculty, name, code in Department.objects.values_list('id', 'faculty_id', 'name', 'code')
+        )
+
+    @cached_property
+    def years(self):
+        # A single year ('2024') matches both years it belongs to, and so only resolves when unambiguous
+        return self.table(
+            (pk, None, f"{start.year}-{end.year}", f"{start.year} {end.year}", str(start.year), str(end.year))
+            for pk, start, end in AcademicYear.objects.values_list('id', 'start', 'end')
+        )
+
+    @cached_property
+    def professors(self):
+        return self.table(
+            (pk, None, name, key)
+            for pk, name, key in Professor.objects.values_list('id', 'name', 'key')
+        )
+
+    def pick(self, table, key, parent=None):
+        candidates = table[0].get(key, ())
+        ids = {pk for pk, candidate_parent in candidates if parent is None or candidate_parent == parent}
+        return ids.pop() if len(ids) == 1 else None
+
+    def load_courses(self, course_ids):
+        missing = set(course_ids) - set(self.courses) - {None}
+        if not missing:
+            return
+        rows = Course.objects.filter(id__in=missing).values_list(
+            'id', 'faculty__university_id', 'faculty__university__name',
+            'academic_degree__university_id', 'academic_degree__university__name',
+            'faculty_id', 'faculty__name', 'department_id', 'department__name',
+            'academic_year_id', 'academic_year__start', 'academic_year__end',
+        )
+        for (pk, faculty_university, faculty_university_name, degree_university, degree_university_name,
+             faculty, faculty_name, department, department_name, year, start, end) in rows:
+            self.courses[pk] = {
+                'university_ref': faculty_university or degree_university,
+                'faculty_ref': faculty,
+                'department_ref': department,
+                'year_ref': year,
+                # Text labels of the references above
+                'labels': {
+                    'university': faculty_university_name if faculty_university else degree_university_name,
+                    'faculty': faculty_name,
+                    'department': department_name,
+                    'year': f"{start.year}-{end.year}" if year else None,
+                },
+            }
+
+    def course(self, course_id):
+        self.load_courses([course_id])
+        return self.courses.get(course_id, {})
+
+    def label(self, field, pk, course):
+        """Name of the `field` object `pk`, from the course row or a loaded table when possible"""
+        if pk == course.get(REFERENCES[field]):
+            return course['labels'][field]
+        if TABLES[field] in self.__dict__:
+            return getattr(self, TABLES[field])[1].get(pk)
+        if field == 'year':
+            row = AcademicYear.objects.filter(pk=pk).values_list('start', 'end').first()
+            return f"{row[0].year}-{row[1].year}" if row else None
+        model = {'university': University, 'faculty': Faculty, 'department': Department, 'professor': Professor}[field]
+        return model.objects.filter(pk=pk).values_list('name', flat=True).first()
+
+    def professor(self, name):
+        key = normalize_key(name)
+        if not key:
+            return None
+        pk = self.pick(self.professors, key)
+        if pk is None and self.create_professors:
+            professor, _ = Professor.objects.get_or_create(key=key, defaults={'name': ' '.join(name.split())[:255]})
+            pk = professor.pk
+            self.professors[0][key] = {(pk, None)}
+            self.professors[1][pk] = professor.name
+        return pk
+
+    def lookup(self, field, text, parent=None):
+        if not text:
+            return None
+        key = year_key(text) if field == 'year' else normalize_key(text)
+        pk = self.pick(getattr(self, TABLES[field]), key, parent)
+        if pk is None:
+            self.unresolved[field] += 1
+        return pk
+
+    def resolve(self, file):
+        """The reference ids of `file`: the ones already set, else the text, else the course"""
+        course = self.course(file.course_id) if file.course_id else {}
+        university = (
+            file.university_ref_id
+            or self.lookup('university', file.university)
+            or course.get('university_ref')
+        )
+        faculty = (
+            file.faculty_ref_id
+            or self.lookup('faculty', file.faculty, university)
+            or course.get('faculty_ref')
+        )
+        department = (
+            file.department_ref_id
+            or self.lookup('department', file.department, faculty)
+            or course.get('department_ref')
+        )
+        year = file.year_ref_id or self.lookup('year', file.year) or course.get('year_ref')
+        professor = file.professor_ref_id or (self.professor(file.professor) if file.professor else None)
+        return {
+            'university_ref': university,
+            'faculty_ref': faculty,
+            'department_ref': department,
+            'professor_ref': professor,
+            'year_ref': year,
+        }
+
+    @staticmethod
+    def forget_stale(file, previous):
+        """
+        Clear what no longer matches its source since the file was loaded
+        (`previous`): the references taken from a changed course or text,
+        unless set by the caller, and the text copies of changed references
+        """
+        stale = set(COURSE_REFERENCES) if file.course_id != previous['course_id'] else set()
+        stale.update(text for text in REFERENCES if getattr(file, text) != previous[text])
+        for text, ref in REFERENCES.items():
+            ref_changed = getattr(file, f'{ref}_id') != previous[f'{ref}_id']
+            text_changed = getattr(file, text) != previous[text]
+            if text in stale and not ref_changed:
+                setattr(file, f'{ref}_id', None)
+                ref_changed = True
+            if ref_changed and not text_changed:
+                setattr(file, text, None)
+
+    def apply(self, file, force=False):
+        """
+        Set the references of `file`, and fill its empty text columns from them
+        so that readers of the text columns keep working. Returns whether anything changed.
+
+        For a file loaded from the database, what its changed course or text
+        columns made stale is resolved again.
+        """
+        before = {ref: getattr(file, f'{ref}_id') for ref in REFERENCES.values()}
+        previous = getattr(file, '_reference_snapshot', None)
+        if previous is not None and not force:
+            self.forget_stale(file, previous)
+        if not force and all(
+            (getattr(file, f'{ref}_id') and getattr(file, text))
+            or (text in OPTIONAL and not getattr(file, f'{ref}_id') and not getattr(file, text))
+            for text, ref in REFERENCES.items()
+        ):
+            return False
+        if force:
+            for ref in REFERENCES.values():
+                setattr(file, f'{ref}_id', None)
+
+        changed = False
+        for ref, pk in self.resolve(file).items():
+            setattr(file, f'{ref}_id', pk)
+            changed |= before[ref] != pk
+        course = self.course(file.course_id) if file.course_id else {}
+        for text, ref in REFERENCES.items():
+            pk = getattr(file, f'{ref}_id')
+            if pk and not getattr(file, text):
+                setattr(file, text, self.label(text, pk, course))
+                changed = True
+        return changed
+
+
+def snapshot(file):
+    """Remember the sources of the references a File was loaded (or saved) with"""
+    deferred = file.get_deferred_fields()
+    if not file.pk or any(field in deferred for field in SNAPSHOT_FIELDS):
+        file._reference_snapshot = None
+    else:
+        file._reference_snapshot = {field: getattr(file, field) for field in SNAPSHOT_FIELDS}
+
+
+def file_loaded(sender, instance, **kwargs):
+    snapshot(instance)
+
+
+def sources_changed(file, previous):
+    return any(getattr(file, field) != value for field, value in previous.items())
+
+
+def file_saving(sender, instance, raw=False, **kwargs):
+    """
+    pre_save receiver resolving the references of files saved one by one
+
+    A loaded file whose sources did not change was resolved when it was
+    last saved (rows older than the references: backfill_file_references).
+    """
+    previous = getattr(instance, '_reference_snapshot', None)
+    if not raw and (previous is None or sources_changed(instance, previous)):
+        Resolver().apply(instance)
+
+
+def file_saved(sender, instance, raw=False, **kwargs):
+    snapshot(instance)
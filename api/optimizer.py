@@ -0,0 +1,169 @@
+import datetime
+import io
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .extractor import TextExtractor
+from .models import File, PendingDeletion
+
+try:
+    import fitz
+    HAS_PYMUPDF = True
+except ImportError:
+    HAS_PYMUPDF = False
+
+try:
+    import pikepdf
+    HAS_PIKEPDF = True
+except ImportError:
+    HAS_PIKEPDF = False
+
+logger = logging.getLogger(__name__)
+
+IMAGE_FORMATS = {
+    'jpeg': ('JPEG', '.jpg'),
+    'webp': ('WEBP', '.webp'),
+}
+# Sources already lossy: only these are re-encoded to IMAGE_FORMAT, the others
+# (PNG/GIF/TIFF/BMP scans of text) are only shrunk and kept lossless, as PNG
+LOSSY_FORMATS = {'JPEG', 'MPO', 'WEBP'}
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA', 'RGBa', 'La') or 'transparency' in image.info
+
+
+def get_option(name, default):
+    return getattr(settings, f'OPTIMIZE_{name}', default)
+
+
+def downsample_pdf_images(doc, target_dpi, quality):
+    """Re-encode embedded raster images whose resolution exceeds `target_dpi` as JPEG"""
+    done = set()
+    for page in doc:
+        for xref, smask, width, height, bpc, *_ in page.get_images(full=True):
+            # Skip images with a transparency mask and 1-bit scans (JBIG2/CCITT are smaller than JPEG)
+            if xref in done or smask or bpc == 1:
+                continue
+            done.add(xref)
+            rects = page.get_image_rects(xref)
+            if not rects or rects[0].width <= 0:
+                continue
+            dpi = width / (rects[0].width / 72)
+            if dpi <= target_dpi * 1.1:
+                continue
+
+            image = Image.open(io.BytesIO(doc.extract_image(xref)["image"]))
+            image = image.convert('L' if image.mode in ('1', 'L', 'LA') else 'RGB')
+            scale = target_dpi / dpi
+            image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=quality, optimize=True)
+            page.replace_image(xref, stream=buffer.getvalue())
+
+
+def optimize_pdf(src, dst):
+    """
+    Write an optimised copy of the PDF `src` to `dst`
+
+    Embedded images are downsampled with PyMuPDF, then the document is
+    linearized ("fast web view") with pikepdf. Returns False when no
+    optimiser is installed.
+    """
+    if not HAS_PYMUPDF and not HAS_PIKEPDF:
+        return False
+
+    if HAS_PYMUPDF:
+        with fitz.open(src) as doc:
+            target_dpi = get_option('PDF_TARGET_DPI', 150)
+            if target_dpi:
+                downsample_pdf_images(doc, target_dpi, get_option('JPEG_QUALITY', 80))
+            doc.save(dst, garbage=3, deflate=True)
+        src = dst
+
+    if HAS_PIKEPDF:
+        with pikepdf.open(src, allow_overwriting_input=True) as pdf:
+            pdf.save(
+                dst,
+                linearize=True,
+                compress_streams=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            )
+    return True
+
+
+def optimize_image(src, dst_dir):
+    """
+    Recompress the photo `src` into `dst_dir`, shrinking it to OPTIMIZE_IMAGE_MAX_EDGE
+
+    Lossy sources are re-encoded to OPTIMIZE_IMAGE_FORMAT, lossless ones
+    stay lossless (PNG). Returns the path of the new file, or None for
+    images left untouched (animations, multi-page TIFFs, transparency).
+    """
+    with Image.open(src) as image:
+        if getattr(image, 'n_frames', 1) > 1 or has_alpha(image):
+            return None
+        lossy = image.format in LOSSY_FORMATS
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('L' if image.mode in ('1', 'L', 'I;16') else 'RGB')
+
+    max_edge = get_option('IMAGE_MAX_EDGE', 3000)
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    fmt, ext = IMAGE_FORMATS[get_option('IMAGE_FORMAT', 'jpeg')] if lossy else ('PNG', '.png')
+    dst = os.path.join(dst_dir, Path(src).stem + ext)
+    if fmt == 'PNG':
+        image.save(dst, fmt, optimize=True)
+    elif fmt == 'JPEG':
+        image.save(dst, fmt, quality=get_option('JPEG_QUALITY', 80), optimize=True, progressive=True)
+    else:
+        image.save(dst, fmt, quality=get_option('JPEG_QUALITY', 80), method=4)
+    return dst
+
+
+def optimize_file(file):
+    """Pipeline stage: replace an uploaded blob by a smaller optimised version"""
+    if not file.file or not get_option('ON_INGEST', True) or file.original_size is not None:
+        return
+
+    extractor = TextExtractor()
+    path = file.file.path
+    original_size = file.file.size
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if extractor.is_pdf(path):
+            optimized = os.path.join(tmp_dir, Path(path).name)
+            if not optimize_pdf(path, optimized):
+                optimized = None
+        elif extractor.is_image(path):
+            optimized = optimize_image(path, tmp_dir)
+        else:
+            optimized = None
+
+        # Only swap the blob when it saves at least OPTIMIZE_MIN_GAIN of the original
+        if optimized is None or os.path.getsize(optimized) > original_size * (1 - get_option('MIN_GAIN', 0.05)):
+            File.all_objects.filter(pk=file.pk).update(original_size=original_size)
+            file.original_size = original_size
+            return
+
+        old_name = file.file.name
+        with open(optimized, 'rb') as f:
+            file.file.save(Path(optimized).name, DjangoFile(f), save=False)
+
+    if get_option('KEEP_ORIGINAL', False):
+        file.original_file = old_name
+    else:
+        # Not deleted right away: the URL returned at upload points to it until clients refresh
+        grace = datetime.timedelta(seconds=get_option('ORIGINAL_GRACE', 86400))
+        PendingDeletion.objects.get_or_create(name=old_name, defaults={'not_before': timezone.now() + grace})
+
+    file.original_size = original_size
+    file.save(update_fields=['file', 'original_file', 'original_size', 'size', 'file_type', 'updated_at'])
+    logger.info("Optimised %s: %d -> %d bytes", file.file.name, original_size, file.size)
@@ -0,0 +1,102 @@
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .extractor import TextExtractor
+from .models import FilePreview
+
+try:
+    import fitz
+    HAS_PYMUPDF = True
+except ImportError:
+    HAS_PYMUPDF = False
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+
+def get_sizes():
+    return sorted(getattr(settings, 'PREVIEW_SIZES', (128, 256, 512)))
+
+
+def get_format():
+    return getattr(settings, 'PREVIEW_FORMAT', 'webp')
+
+
+def preview_name(digest, fmt=None):
+    """Storage path of a thumbnail, derived only from its content"""
+    return f"previews/{digest[:2]}/{digest}.{fmt or get_format()}"
+
+
+def render_first_page(path, max_size):
+    """Render the first page of a PDF (or the first frame of an image) as a PIL image"""
+    extractor = TextExtractor()
+    if extractor.is_pdf(path):
+        if not HAS_PYMUPDF:
+            raise ImportError("PyMuPDF not installed")
+        with fitz.open(path) as doc:
+            page = doc[0]
+            scale = max_size / max(page.rect.width, page.rect.height)
+            pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+            return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+    if extractor.is_image(path):
+        with Image.open(path) as image:
+            # Let the JPEG decoder downscale while decoding instead of loading full resolution
+            image.draft('RGB', (max_size, max_size))
+            return ImageOps.exif_transpose(image).convert('RGB')
+
+    raise ValueError(f"Unsupported file type: {path}")
+
+
+def make_thumbnails(image, sizes):
+    """Yield (size, bytes, width, height) for each requested size, largest first"""
+    fmt, _ = FORMATS[get_format()]
+    for size in sorted(sizes, reverse=True):
+        thumb = image.copy()
+        thumb.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if fmt == 'WEBP':
+            thumb.save(buffer, fmt, quality=80, method=4)
+        else:
+            thumb.save(buffer, fmt, quality=80, optimize=True)
+        yield size, buffer.getvalue(), thumb.width, thumb.height
+
+
+def store(data):
+    """Save thumbnail bytes under their sha256, reusing an identical existing blob"""
+    digest = hashlib.sha256(data).hexdigest()
+    name = preview_name(digest)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(data))
+        if saved != name:
+            logger.warning("Preview stored as %s instead of %s", saved, name)
+            name = saved
+    return digest, name
+
+
+def generate_previews(file):
+    if not file.file:
+        return
+    sizes = get_sizes()
+    image = render_first_page(file.file.path, max(sizes))
+
+    previews = []
+    for size, data, width, height in make_thumbnails(image, sizes):
+        digest, name = store(data)
+        previews.append(FilePreview(file=file, size=size, digest=digest, image=name, width=width, height=height))
+
+    with transaction.atomic():
+        FilePreview.objects.filter(file=file).delete()
+        FilePreview.objects.bulk_create(previews)
+    return previews
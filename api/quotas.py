@@ -0,0 +1,134 @@
+"""
+Per profile storage and OCR quotas
+
+ProfileUsage holds running totals updated from the File signals (and by
+the bulk paths through add_files), so checking a quota reads one row
+instead of summing the sizes of all the profile's files.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import File, ProfileUsage
+
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_403_FORBIDDEN
+    default_detail = "Quota dépassé"
+    default_code = 'quota_exceeded'
+
+
+def add_usage(profile_id, files=0, storage_bytes=0, ocr_pages=0):
+    if profile_id is None or not (files or storage_bytes or ocr_pages):
+        return
+    changes = {
+        'files': F('files') + files,
+        'storage_bytes': F('storage_bytes') + storage_bytes,
+        'ocr_pages': F('ocr_pages') + ocr_pages,
+        'updated_at': timezone.now(),
+    }
+    if ProfileUsage.objects.filter(profile_id=profile_id).update(**changes):
+        return
+    if files <= 0 and storage_bytes <= 0 and ocr_pages <= 0:
+        # Nothing counted yet, or the profile is being deleted with its files
+        return
+    try:
+        with transaction.atomic():
+            ProfileUsage.objects.create(profile_id=profile_id, files=files, storage_bytes=storage_bytes, ocr_pages=ocr_pages)
+    except IntegrityError:
+        # Created concurrently in the meantime
+        ProfileUsage.objects.filter(profile_id=profile_id).update(**changes)
+
+
+def get_usage(profile):
+    usage = ProfileUsage.objects.filter(profile=profile).first()
+    return usage or ProfileUsage(profile=profile)
+
+
+def limits():
+    return {
+        'storage_bytes': getattr(settings, 'QUOTA_STORAGE_BYTES', None),
+        'ocr_pages': getattr(settings, 'QUOTA_OCR_PAGES', None),
+    }
+
+
+def check_upload(profile, size):
+    limit = limits()['storage_bytes']
+    if limit is not None and get_usage(profile).storage_bytes + (size or 0) > limit:
+        raise QuotaExceeded(f"Quota de stockage dépassé ({limit} octets)")
+
+
+def ocr_allowed(profile_id):
+    limit = limits()['ocr_pages']
+    if limit is None or profile_id is None:
+        return True
+    used = ProfileUsage.objects.filter(profile_id=profile_id).values_list('ocr_pages', flat=True).first() or 0
+    return used < limit
+
+
+def snapshot(file):
+    deferred = file.get_deferred_fields()
+    if 'size' in deferred or 'uploaded_by_id' in deferred:
+        file._usage_snapshot = None
+    else:
+        file._usage_snapshot = (file.uploaded_by_id, file.size or 0) if file.pk else None
+
+
+def file_loaded(sender, instance, **kwargs):
+    snapshot(instance)
+
+
+def file_saving(sender, instance, raw=False, **kwargs):
+    # Read the stored owner and size before they get overwritten
+    if instance.pk and getattr(instance, '_usage_snapshot', None) is None:
+        instance._usage_snapshot = (
+            File.all_objects.filter(pk=instance.pk).values_list('uploaded_by_id', 'size').first()
+        )
+
+
+def file_saved(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, '_usage_snapshot', None)
+    new = (instance.uploaded_by_id, instance.size or 0)
+    if old is None:
+        add_usage(new[0], files=1, storage_bytes=new[1])
+    elif old[0] != new[0]:
+        add_usage(old[0], files=-1, storage_bytes=-(old[1] or 0))
+        add_usage(new[0], files=1, storage_bytes=new[1])
+    else:
+        add_usage(new[0], storage_bytes=new[1] - (old[1] or 0))
+    instance._usage_snapshot = new
+
+
+def file_deleted(sender, instance, **kwargs):
+    stored = getattr(instance, '_usage_snapshot', None)
+    profile_id, size = stored if stored else (instance.uploaded_by_id, instance.size or 0)
+    add_usage(profile_id, files=-1, storage_bytes=-(size or 0))
+
+
+def add_files(files):
+    """Count files created without signals (bulk_create)"""
+    totals = defaultdict(Counter)
+    for file in files:
+        totals[file.uploaded_by_id].update(files=1, storage_bytes=file.size or 0)
+    for profile_id, total in totals.items():
+        add_usage(profile_id, **total)
+
+
+def rebuild():
+    """Recompute the files and storage totals from the File rows (OCR pages are kept)"""
+    rows = File.all_objects.filter(uploaded_by__isnull=False).order_by().values('uploaded_by')
+    totals = {row['uploaded_by']: row for row in rows.annotate(files=Count('pk'), storage_bytes=Sum('size'))}
+    with transaction.atomic():
+        ProfileUsage.objects.exclude(profile_id__in=totals).update(files=0, storage_bytes=0)
+        for profile_id, row in totals.items():
+            updated = ProfileUsage.objects.filter(profile_id=profile_id).update(
+                files=row['files'], storage_bytes=row['storage_bytes'] or 0)
+            if not updated:
+                ProfileUsage.objects.create(profile_id=profile_id, files=row['files'],
+                                            storage_bytes=row['storage_bytes'] or 0)
+    return len(totals)
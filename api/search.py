@@ -0,0 +1,140 @@
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Course, Department, Faculty, File
+
+# Columns matched by ?q= on each model, in addition to the File full text
+SEARCH_FIELDS = {
+    File: ['name', 'description'],
+    Faculty: ['name'],
+    Department: ['name'],
+    Course: ['name'],
+}
+
+TSVECTOR_COLUMN = 'search_vector'
+TSVECTOR_CONFIGS = ('french', 'english')
+# tsvector values are capped at 1 MB, only index the beginning of huge documents
+TSVECTOR_MAX_TEXT = 300000
+
+
+class SearchBackend:
+    """Portable search: case-insensitive substring match, works on every database"""
+
+    def filter(self, queryset, query, fields):
+        return queryset.filter(reduce(or_, (Q(**{f'{field}__icontains': query}) for field in fields)))
+
+    def search(self, queryset, query):
+        return self.filter(queryset, query, SEARCH_FIELDS.get(queryset.model, ['name']))
+
+    def setup(self):
+        """Create whatever indexes the backend needs (run after migrate)"""
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    PostgreSQL search using pg_trgm GIN indexes and a generated tsvector
+
+    Name columns get trigram indexes: one on the column for fuzzy matching,
+    one on UPPER(column) for the `__icontains` filters of the viewsets (which
+    Django compiles to UPPER(col) LIKE UPPER('%...%')). File rows also get a
+    stored tsvector over name, description and text in French and English.
+    """
+
+    def filter(self, queryset, query, fields):
+        condition = reduce(or_, (
+            Q(**{f'{field}__icontains': query}) | Q(**{f'{field}__trigram_word_similar': query})
+            for field in fields
+        ))
+        return queryset.filter(condition)
+
+    def tsquery(self):
+        return " || ".join(f"websearch_to_tsquery('{config}', %s)" for config in TSVECTOR_CONFIGS)
+
+    def search(self, queryset, query):
+        if queryset.model is not File:
+            return super().search(queryset, query)
+
+        table = connection.ops.quote_name(File._meta.db_table)
+        column = f"{table}.{TSVECTOR_COLUMN}"
+        params = [query] * len(TSVECTOR_CONFIGS)
+        matches = RawSQL(f"{column} @@ ({self.tsquery()})", params, output_field=BooleanField())
+        rank = RawSQL(f"ts_rank({column}, {self.tsquery()})", params, output_field=FloatField())
+
+        fuzzy = reduce(or_, (Q(**{f'{field}__trigram_word_similar': query}) for field in SEARCH_FIELDS[File]))
+        return (
+            queryset.alias(search_match=matches)
+            .filter(Q(search_match=True) | fuzzy)
+            .annotate(search_rank=rank)
+            .order_by('-search_rank')
+        )
+
+    def setup(self):
+        statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+        for model, fields in SEARCH_FIELDS.items():
+            table = model._meta.db_table
+            for field in fields:
+                column = model._meta.get_field(field).column
+                statements += [
+                    f"CREATE INDEX IF NOT EXISTS {table}_{column}_trgm "
+                    f"ON {table} USING gin ({column} gin_trgm_ops)",
+                    f"CREATE INDEX IF NOT EXISTS {table}_{column}_upper_trgm "
+                    f"ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)",
+                ]
+
+        table = File._meta.db_table
+        vector = " || ".join(
+            [f"setweight(to_tsvector('{config}', coalesce(name, '')), 'A')" for config in TSVECTOR_CONFIGS]
+            + [f"setweight(to_tsvector('{config}', coalesce(description, '')), 'B')" for config in TSVECTOR_CONFIGS]
+            + [f"to_tsvector('{config}', left(coalesce(text, ''), {TSVECTOR_MAX_TEXT}))" for config in TSVECTOR_CONFIGS]
+        )
+        statements += [
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {TSVECTOR_COLUMN} tsvector "
+            f"GENERATED ALWAYS AS ({vector}) STORED",
+            f"CREATE INDEX IF NOT EXISTS {table}_{TSVECTOR_COLUMN} ON {table} USING gin ({TSVECTOR_COLUMN})",
+        ]
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+BACKENDS = {
+    'default': SearchBackend,
+    'postgres': PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_backend():
+    """The configured SEARCH_BACKEND; 'auto' picks the postgres engine on PostgreSQL"""
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'SEARCH_BACKEND', 'auto')
+        if name == 'auto':
+            name = 'postgres' if connection.vendor == 'postgresql' else 'default'
+        backend_class = BACKENDS[name] if name in BACKENDS else import_string(name)
+        _backend = backend_class()
+    return _backend
+
+
+def setup_search_indexes(sender, **kwargs):
+    """post_migrate receiver"""
+    get_backend().setup()
+
+
+class IndexedSearchFilter(BaseFilterBackend):
+    """`?q=` filter delegating to the search backend"""
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query or queryset.model not in SEARCH_FIELDS:
+            return queryset
+        return get_backend().search(queryset, query)
@@ -2,10 +2,24 @@ from rest_framework import serializers
 from django.contrib.contenttypes.models import ContentType
 from .models import *
 from django.contrib.auth.models import User
+from django.urls import reverse
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .utils import log_action, get_user_profile
+from .normalize import normalize_key
 
 class CustomTokenSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        # Read back by api.authentication.ClaimsUser, so requests need no User/Profile query
+        profile = get_user_profile(user)
+        token['profile_id'] = profile.pk
+        token['profile'] = str(profile.uuid)
+        token['username'] = user.username
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
+
     def validate(self, attrs):
         data = super(CustomTokenSerializer, self).validate(attrs)
         data['is_admin'] = self.user.is_superuser
@@ -46,14 +60,31 @@ class FileSerializer(serializers.ModelSerializer):
         required=False,
     )
     name = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+    previews = serializers.SerializerMethodField()
 
     class Meta:
         model = File
         fields = [
-            'uuid', 'name', 'file', 'uploaded_by', 'size','course' ,
-            'file_type', 'is_trashed', 'created_at', 'updated_at','file_category',
+            'uuid', 'name', 'file', 'uploaded_by', 'size', 'original_size', 'course' ,
+            'file_type', 'is_trashed', 'trashed_at', 'created_at', 'updated_at','file_category',
+            'text', 'previews',
+            'university_ref', 'faculty_ref', 'department_ref', 'professor_ref', 'year_ref',
         ]
-        read_only_fields = ['uploaded_by', 'size', 'file_type', 'created_at', 'updated_at']
+        read_only_fields = ['uploaded_by', 'size', 'original_size', 'file_type', 'trashed_at', 'created_at', 'updated_at', 'text']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # `text` can be megabytes long, only send it when explicitly asked for
+        if not self.context.get('with_text'):
+            self.fields.pop('text')
+
+    def get_previews(self, obj):
+        request = self.context.get('request')
+        previews = {}
+        for preview in obj.previews.all():
+            url = reverse('file-preview', args=[preview.digest])
+            previews[preview.size] = request.build_absolute_uri(url) if request else url
+        return previews
 
     def validate(self, attrs):
         if not attrs.get('name') and attrs.get('file'):
@@ -61,6 +92,11 @@ class FileSerializer(serializers.ModelSerializer):
         return attrs
 # Z15ZWBUNLX8JEWKM3RKCMYD7
 
+class FilePageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FilePage
+        fields = ['number', 'text']
+
 class AcademicYearSerializer(serializers.ModelSerializer):
    class Meta:
         model = AcademicYear
@@ -94,4 +130,26 @@ class DepartmentSerializer(serializers.ModelSerializer):
 class CourseSerializer(serializers.ModelSerializer):
    class Meta:
         model = Course
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+
+class ProfessorSerializer(serializers.ModelSerializer):
+   class Meta:
+        model = Professor
+        fields = ['id', 'name']
+
+   def validate_name(self, value):
+        others = Professor.objects.filter(key=normalize_key(value))
+        if self.instance:
+            others = others.exclude(pk=self.instance.pk)
+        if others.exists():
+            raise serializers.ValidationError("Ce professeur existe déjà")
+        return value
+
+   def create(self, validated_data):
+        validated_data['key'] = normalize_key(validated_data['name'])
+        return super().create(validated_data)
+
+   def update(self, instance, validated_data):
+        if 'name' in validated_data:
+            validated_data['key'] = normalize_key(validated_data['name'])
+        return super().update(instance, validated_data)
@@ -0,0 +1,227 @@
+"""
+Near-duplicate detection (MinHash + LSH)
+
+The text of a file is normalized and cut into shingles of
+MINHASH_SHINGLE_SIZE words; its signature keeps, for each of NUM_PERM hash
+functions, the smallest hash of its shingles. The proportion of equal
+positions between two signatures estimates the Jaccard similarity of the
+two texts, so re-scans and re-exports of a document score high even when
+their bytes differ.
+
+The signature (NUM_PERM 32-bit integers, 512 bytes) is stored on the File
+and cut into BANDS bands of ROWS values; each band is hashed into a
+MinHashBand row. Files sharing at least one bucket are the candidates, found
+through the (band, bucket) index without scanning the archive, and are then
+compared on their full signatures.
+"""
+import hashlib
+import random
+import struct
+import zlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import File, MinHashBand
+from .normalize import normalize_key
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+# Buckets holding more files than this (boilerplate, empty scans) yield no pairs in the report
+MAX_BUCKET_SIZE = 200
+
+PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+SIGNATURE_FORMAT = f'<{NUM_PERM}I'
+
+# Fixed seed: signatures must stay comparable across processes and releases
+_random = random.Random(20240501)
+PERMUTATIONS = [(_random.randrange(1, MAX_HASH), _random.randrange(0, MAX_HASH)) for _ in range(NUM_PERM)]
+
+
+def shingles(text, size=None):
+    """Hashes of the word n-grams of the normalized text"""
+    size = size or getattr(settings, 'MINHASH_SHINGLE_SIZE', 3)
+    words = normalize_key(text).split()
+    if not words:
+        return set()
+    if len(words) <= size:
+        return {zlib.crc32(' '.join(words).encode('utf-8'))}
+    return {zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+
+def signature(text):
+    """MinHash signature of `text` as a tuple of NUM_PERM integers, None when there is no text"""
+    hashes = shingles(text or '')
+    if not hashes:
+        return None
+    if HAS_NUMPY:
+        # (a*x + b) stays below 2**64 as a, b and x are 32-bit
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        a, b = (np.array(column, dtype=np.uint64)[:, None] for column in zip(*PERMUTATIONS))
+        permuted = ((a * values + b) % np.uint64(PRIME)) & np.uint64(MAX_HASH)
+        return tuple(int(value) for value in permuted.min(axis=1))
+    return tuple(min(((a * x + b) % PRIME) & MAX_HASH for x in hashes) for a, b in PERMUTATIONS)
+
+
+def pack(sig):
+    return struct.pack(SIGNATURE_FORMAT, *sig) if sig else None
+
+
+def unpack(data):
+    return struct.unpack(SIGNATURE_FORMAT, bytes(data)) if data else None
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def buckets(sig):
+    """(band, bucket) pairs of a signature"""
+    for band in range(BANDS):
+        data = struct.pack(f'<{ROWS}I', *sig[band * ROWS:(band + 1) * ROWS])
+        yield band, int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little', signed=True)
+
+
+def get_threshold(threshold=None):
+    return threshold if threshold is not None else getattr(settings, 'MINHASH_THRESHOLD', 0.7)
+
+
+def set_signature(file, text=None):
+    """Compute file.minhash from `text` (default file.text), without saving"""
+    file.minhash = pack(signature(file.text if text is None else text))
+    return file.minhash
+
+
+def add_bands(files):
+    """Index the signatures of saved files (bulk paths: set_signature, bulk_create, then this)"""
+    MinHashBand.objects.bulk_create(
+        (MinHashBand(file_id=file.pk, band=band, bucket=bucket)
+         for file in files if file.minhash
+         for band, bucket in buckets(unpack(file.minhash))),
+        batch_size=1000,
+    )
+
+
+def index_file(file):
+    """Extraction stage: store the signature of the file's text and its LSH bands"""
+    set_signature(file)
+    with transaction.atomic():
+        File.all_objects.filter(pk=file.pk).update(minhash=file.minhash)
+        MinHashBand.objects.filter(file_id=file.pk).delete()
+        add_bands([file])
+
+
+def candidates(sig):
+    """Ids of the files sharing at least one band bucket with `sig`"""
+    condition = Q()
+    for band, bucket in buckets(sig):
+        condition |= Q(band=band, bucket=bucket)
+    return set(MinHashBand.objects.filter(condition).values_list('file_id', flat=True))
+
+
+def similar(file, queryset=None, threshold=None, limit=20):
+    """Files of `queryset` whose text is similar to the file's, as (file, similarity), best first"""
+    sig = unpack(file.minhash)
+    if sig is None:
+        return []
+    threshold = get_threshold(threshold)
+    ids = candidates(sig) - {file.pk}
+    if not ids:
+        return []
+    queryset = File.objects.all() if queryset is None else queryset
+    scored = []
+    for other in queryset.filter(pk__in=ids):
+        score = similarity(sig, unpack(other.minhash))
+        if score >= threshold:
+            scored.append((other, score))
+    scored.sort(key=lambda item: -item[1])
+    return scored[:limit]
+
+
+def candidate_pairs(max_bucket_size=MAX_BUCKET_SIZE):
+    """Pairs of file ids sharing a bucket, from one ordered scan of the band table"""
+    pairs = set()
+    current, members = None, []
+
+    def flush():
+        if 1 < len(members) <= max_bucket_size:
+            members.sort()
+            pairs.update((a, b) for i, a in enumerate(members) for b in members[i + 1:])
+
+    rows = MinHashBand.objects.order_by('band', 'bucket').values_list('band', 'bucket', 'file_id')
+    for band, bucket, file_id in rows.iterator(chunk_size=5000):
+        if (band, bucket) != current:
+            flush()
+            current, members = (band, bucket), []
+        members.append(file_id)
+    flush()
+    return pairs
+
+
+def duplicate_groups(threshold=None, batch_size=1000):
+    """
+    Groups of near-duplicate (non trashed) files, as lists of ids
+
+    Candidate pairs above the threshold are merged transitively (union-find).
+    Returns (groups, scores) where scores maps each retained pair to its similarity.
+    """
+    threshold = get_threshold(threshold)
+    pairs = candidate_pairs()
+    ids = sorted({file_id for pair in pairs for file_id in pair})
+    signatures = {}
+    for start in range(0, len(ids), batch_size):
+        rows = File.objects.filter(pk__in=ids[start:start + batch_size]).values_list('pk', 'minhash')
+        signatures.update((pk, unpack(minhash)) for pk, minhash in rows if minhash)
+
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        if root != x:
+            parent[x] = root
+        return root
+
+    scores = {}
+    for a, b in pairs:
+        if a in signatures and b in signatures:
+            score = similarity(signatures[a], signatures[b])
+            if score >= threshold:
+                scores[a, b] = score
+                parent[find(b)] = find(a)
+
+    groups = defaultdict(list)
+    for file_id in {file_id for pair in scores for file_id in pair}:
+        groups[find(file_id)].append(file_id)
+    return sorted((sorted(group) for group in groups.values()), key=lambda group: (-len(group), group[0])), scores
+
+
+def backfill(batch_size=500):
+    """Compute the missing signatures of files that have a text; returns the count"""
+    done = 0
+    last = 0
+    while True:
+        files = list(File.all_objects.filter(pk__gt=last, minhash__isnull=True, text__isnull=False)
+                     .exclude(text='').order_by('pk').only('pk', 'text')[:batch_size])
+        if not files:
+            return done
+        last = files[-1].pk
+        for file in files:
+            set_signature(file)
+        with transaction.atomic():
+            File.all_objects.bulk_update(files, ['minhash'])
+            MinHashBand.objects.filter(file_id__in=[file.pk for file in files]).delete()
+            add_bands(files)
+        done += len(files)
@@ -0,0 +1,197 @@
+"""
+Search box suggestions from an in-memory prefix index
+
+The names of the courses, faculties, professors and (non trashed) files are
+normalized with normalize_key (case and accents ignored, "mathé" finds
+"Mathématiques") and indexed from the start of each word, so "ana" finds
+"Analyse" and "Travaux d'analyse". The index keeps one sorted list of
+(key, ref) tuples per kind, and per owner for files, searched with bisect: a
+lookup reads only the lists the caller may see, a binary search plus at most
+MAX_SCAN entries each, well under a millisecond whatever the size of the
+archive.
+
+It is built on the first request and kept up to date by the model signals
+of this process. Changes made by other processes (other workers, bulk
+imports) are picked up by a rebuild once the index is SUGGEST_MAX_AGE
+seconds old.
+"""
+import bisect
+import itertools
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Course, Faculty, File, Professor
+from .normalize import normalize_key
+
+# kind -> (model, queryset of the indexed rows)
+SOURCES = {
+    'course': (Course, lambda: Course.objects.all()),
+    'faculty': (Faculty, lambda: Faculty.objects.all()),
+    'professor': (Professor, lambda: Professor.objects.all()),
+    'file': (File, lambda: File.objects.exclude(name__isnull=True).exclude(name='')),
+}
+KINDS = {model: kind for kind, (model, _) in SOURCES.items()}
+
+# Only the beginning of long names is indexed
+MAX_WORDS = 8
+MAX_KEY_LENGTH = 40
+# Entries read at most per lookup, whatever the number of matches
+MAX_SCAN = 500
+
+
+def index_keys(label):
+    """Normalized suffixes of `label` starting at each of its first words"""
+    words = normalize_key(label).split()[:MAX_WORDS]
+    return {' '.join(words[i:])[:MAX_KEY_LENGTH] for i in range(len(words))}
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.building = threading.Lock()
+        # (kind, owner) -> sorted [(key, ref)]: one list per kind, and per owner for files,
+        # so a lookup only reads entries the caller may see
+        self.lists = {}
+        # ref -> (kind, pk, label, owner, public id, key of the whole name);
+        # owner is the profile id of files, None otherwise
+        self.items = {}
+        self.refs = {}
+        self.counter = itertools.count()
+        self.built_at = None
+
+    def build(self):
+        items = {}
+        lists = {}
+        counter = itertools.count()
+        for kind, (model, queryset) in SOURCES.items():
+            fields = ('pk', 'name', 'uploaded_by_id', 'uuid') if model is File else ('pk', 'name')
+            for row in queryset().order_by().values_list(*fields).iterator(chunk_size=5000):
+                ref = next(counter)
+                item = items[ref] = self.item(kind, *row)
+                lists.setdefault((kind, item[3]), []).extend((key, ref) for key in index_keys(row[1]))
+        for entries in lists.values():
+            entries.sort()
+        with self.lock:
+            self.lists = lists
+            self.items = items
+            self.refs = {(item[0], item[1]): ref for ref, item in items.items()}
+            self.counter = counter
+            self.built_at = time.monotonic()
+
+    @staticmethod
+    def item(kind, pk, name, owner=None, uuid=None):
+        # Files are exposed by uuid, like in the rest of the API
+        name_key = ' '.join(normalize_key(name).split()[:MAX_WORDS])[:MAX_KEY_LENGTH]
+        return (kind, pk, name, owner, str(uuid) if uuid else pk, name_key)
+
+    def is_stale(self):
+        max_age = getattr(settings, 'SUGGEST_MAX_AGE', 300)
+        return self.built_at is None or (max_age is not None and time.monotonic() - self.built_at > max_age)
+
+    def ensure_built(self):
+        if not self.is_stale():
+            return
+        # While one thread rebuilds, the others keep answering from the current index
+        if self.building.acquire(blocking=self.built_at is None):
+            try:
+                if self.is_stale():
+                    self.build()
+            finally:
+                self.building.release()
+
+    def _remove(self, key):
+        ref = self.refs.pop(key, None)
+        if ref is None:
+            return
+        kind, pk, label, owner, *_ = self.items.pop(ref)
+        entries = self.lists.get((kind, owner), [])
+        for index_key in index_keys(label):
+            position = bisect.bisect_left(entries, (index_key, ref))
+            if position < len(entries) and entries[position] == (index_key, ref):
+                del entries[position]
+        if not entries:
+            self.lists.pop((kind, owner), None)
+
+    def update(self, kind, pk, name, owner=None, uuid=None):
+        """Add or replace an object (no-op until the index is built)"""
+        if self.built_at is None:
+            return
+        with self.lock:
+            self._remove((kind, pk))
+            if not name:
+                return
+            ref = next(self.counter)
+            self.items[ref] = self.item(kind, pk, name, owner, uuid)
+            self.refs[kind, pk] = ref
+            entries = self.lists.setdefault((kind, owner), [])
+            for key in index_keys(name):
+                bisect.insort(entries, (key, ref))
+
+    def remove(self, kind, pk):
+        if self.built_at is None:
+            return
+        with self.lock:
+            self._remove((kind, pk))
+
+    def search(self, query, owner=None, kinds=None, limit=10):
+        """
+        Objects whose name has a word starting with `query`
+
+        Names starting with the query come first, then the other matches,
+        alphabetically. Files are only suggested to their owner: only the
+        caller's own list of files is read, so other users' files never take
+        up the MAX_SCAN entries read per list.
+        """
+        prefix = normalize_key(query)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+        matches = []
+        with self.lock:
+            for kind in kinds or SOURCES:
+                entries = self.lists.get((kind, owner if kind == 'file' else None), ())
+                position = bisect.bisect_left(entries, (prefix,))
+                for key, ref in entries[position:position + MAX_SCAN]:
+                    if not key.startswith(prefix):
+                        break
+                    matches.append((key, ref))
+            items = self.items
+            matches.sort()
+            seen = set()
+            starts, others = [], []
+            for key, ref in matches:
+                if ref in seen:
+                    continue
+                seen.add(ref)
+                kind, pk, label, item_owner, public_id, name_key = items[ref]
+                if key == name_key:
+                    starts.append({'type': kind, 'id': public_id, 'label': label})
+                    if len(starts) >= limit:
+                        break
+                elif len(others) < limit:
+                    others.append({'type': kind, 'id': public_id, 'label': label})
+        return (starts + others)[:limit]
+
+
+INDEX = PrefixIndex()
+
+
+def object_saved(sender, instance, **kwargs):
+    kind = KINDS[sender]
+    if kind == 'file':
+        if instance.is_trashed:
+            INDEX.remove(kind, instance.pk)
+        elif 'name' not in instance.get_deferred_fields():
+            INDEX.update(kind, instance.pk, instance.name, instance.uploaded_by_id, instance.uuid)
+    else:
+        INDEX.update(kind, instance.pk, instance.name)
+
+
+def object_deleted(sender, instance, **kwargs):
+    INDEX.remove(KINDS[sender], instance.pk)
+
+
+def suggest(query, owner=None, kinds=None, limit=None):
+    INDEX.ensure_built()
+    return INDEX.search(query, owner=owner, kinds=kinds, limit=limit or getattr(settings, 'SUGGEST_LIMIT', 10))
@@ -0,0 +1,125 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import metrics, quotas, similarity
+from .extractor import HAS_PDF, HAS_PYMUPDF, JSONFileSink, LoggingSink, MetricsSink, TextExtractor
+from .models import File, FilePage
+from .optimizer import optimize_file
+from .previews import generate_previews
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'EXTRACTION_WORKERS', 2),
+            thread_name_prefix='extraction',
+        )
+    return _executor
+
+
+def schedule_extraction(file):
+    """Run the extraction pipeline for `file` once the current transaction commits"""
+    file_id = file.pk
+    if getattr(settings, 'EXTRACTION_ASYNC', True):
+        transaction.on_commit(lambda: get_executor().submit(run_extraction, file_id))
+    else:
+        transaction.on_commit(lambda: run_extraction(file_id))
+
+
+def run_extraction(file_id):
+    close_old_connections()
+    try:
+        file = File.all_objects.get(pk=file_id)
+        # A failing stage (e.g. no OCR installed) must not prevent the next ones
+        for stage in PIPELINE:
+            try:
+                stage(file)
+            except Exception:
+                logger.exception("%s failed for file %s", stage.__name__, file_id)
+    except File.DoesNotExist:
+        logger.warning("File %s vanished before extraction", file_id)
+    finally:
+        close_old_connections()
+
+
+def get_extractor():
+    sinks = [MetricsSink(metrics.REGISTRY), LoggingSink()]
+    stats_file = getattr(settings, 'EXTRACTION_STATS_FILE', None)
+    if stats_file:
+        sinks.append(JSONFileSink(stats_file))
+    return TextExtractor(
+        sinks=sinks,
+        tile_size=getattr(settings, 'OCR_TILE_SIZE', 2048),
+        tile_overlap=getattr(settings, 'OCR_TILE_OVERLAP', 200),
+        tile_workers=getattr(settings, 'OCR_TILE_WORKERS', None),
+        tile_threshold=getattr(settings, 'OCR_TILE_THRESHOLD_PIXELS', 16_000_000),
+        max_pixels=getattr(settings, 'OCR_MAX_PIXELS', 89_478_485),
+    )
+
+
+def text_layer_method():
+    """Fastest installed backend reading the embedded text of PDFs, without OCR"""
+    if HAS_PYMUPDF:
+        return 'pymupdf'
+    if HAS_PDF:
+        return 'pypdf2'
+    return None
+
+
+def extract_file(file, extractor=None):
+    """Extract the text of `file` and store it both whole and page by page"""
+    if not file.file:
+        return
+    extractor = extractor or get_extractor()
+    path = file.file.path
+    if not (extractor.is_pdf(path) or extractor.is_image(path)):
+        return
+
+    options = {}
+    extractor.last_route = None
+    if not quotas.ocr_allowed(file.uploaded_by_id):
+        # Over the OCR quota: only the embedded text layer of PDFs is extracted
+        method = None if extractor.is_image(path) else text_layer_method()
+        if method is None:
+            logger.info("OCR quota reached and no text layer backend installed, not extracting %s", path)
+            return
+        options['method'] = method
+
+    with extractor.track(path):
+        text = extractor.extract_text_from_file(path, **options)
+        with extractor.span("write"):
+            store_pages(file, extractor.split_pages(text))
+            File.all_objects.filter(pk=file.pk).update(text=text)
+    file.text = text
+
+    stats = extractor.last_stats
+    route = extractor.last_route or {}
+    if extractor.is_image(path) or route.get('method') == 'ocr':
+        quotas.add_usage(file.uploaded_by_id, ocr_pages=max(stats.pages, 1))
+    return stats
+
+
+def store_pages(file, pages):
+    batch_size = getattr(settings, 'EXTRACTION_PAGE_BATCH_SIZE', 500)
+    with transaction.atomic():
+        FilePage.objects.filter(file=file).delete()
+        FilePage.objects.bulk_create(
+            (FilePage(file=file, number=number, text=text) for number, text in enumerate(pages, start=1)),
+            batch_size=batch_size,
+        )
+
+
+PIPELINE = [
+    optimize_file,
+    extract_file,
+    similarity.index_file,
+    generate_previews,
+]
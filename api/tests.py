@@ -1,3 +1,378 @@
-from django.test import TestCase
+import datetime
+import random
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from . import audit, facets, lifecycle, similarity, tasks
+from .extractor import HAS_OCR, TextExtractor
+from .models import (AcademicDegree, AcademicYear, AuditLog, Course, Degree, Department, FacetCount, Faculty, File,
+                     PendingDeletion, Profile, ProfileUsage, University)
+from .suggest import PrefixIndex
+from .throttling import LocalBuckets, UploadThrottle
+
+if HAS_OCR:
+    import numpy as np
+    from PIL import Image
+
+
+def make_course(name='Algorithmique'):
+    year = AcademicYear.objects.create(start=datetime.date(2024, 10, 1), end=datetime.date(2025, 9, 30))
+    university = University.objects.create(name='Université du Burundi', acronym='UB', address='Bujumbura')
+    degree = AcademicDegree.objects.create(university=university, degree=Degree.objects.create(name='Licence'), year='1')
+    return Course.objects.create(academic_year=year, academic_degree=degree, name=name)
+
+
+def make_profile(username):
+    return Profile.objects.create(user=User.objects.create_user(username, password='secret'))
+
+
+def fake_image_to_data(image, **kwargs):
+    """One word in the middle of each tile, as pytesseract.image_to_data would report it"""
+    width, height = image.size
+    return {"text": ["mot"], "left": [width // 2 - 5], "top": [height // 2 - 5], "width": [10], "height": [10]}
+
+
+@skipUnless(HAS_OCR, "OCR libraries not installed")
+class TiledExtractionTests(SimpleTestCase):
+    """Huge images are tiled up to max_pixels, and refused before decoding past it"""
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.workdir.cleanup)
+        # 200x100 = 20000 pixels per frame: tiled (above 1000) and within max_pixels
+        self.extractor = TextExtractor(tile_size=64, tile_overlap=8, tile_workers=2, tile_threshold=1000,
+                                       max_pixels=50000)
+        self.rng = np.random.default_rng(0)
+
+    def noise(self, width=200, height=100):
+        return Image.fromarray(self.rng.integers(0, 256, (height, width), dtype=np.uint8))
+
+    def test_huge_image_is_routed_to_tiles(self):
+        path = Path(self.workdir.name) / "scan.png"
+        self.noise().save(path)
+
+        tiled = mock.patch.object(self.extractor, "extract_text_from_image_tiled",
+                                  wraps=self.extractor.extract_text_from_image_tiled)
+        with tiled as spy, mock.patch("pytesseract.image_to_data", side_effect=fake_image_to_data) as ocr:
+            text = self.extractor.extract_text_from_image(path, preprocess=False)
+
+        spy.assert_called_once()
+        self.assertEqual(ocr.call_count, len(list(self.extractor.tile_boxes(200, 100))))
+        self.assertIn("mot", text)
+
+    def test_image_past_max_pixels_is_refused_before_decoding(self):
+        path = Path(self.workdir.name) / "bomb.png"
+        self.noise(400, 200).save(path)
+        with mock.patch("cv2.imread") as imread, self.assertRaises(ValueError):
+            self.extractor.extract_text_from_image(path, preprocess=False)
+        imread.assert_not_called()
+
+    def test_pil_bomb_limit_stays_active(self):
+        path = Path(self.workdir.name) / "scan.png"
+        self.noise().save(path)
+        extractor = TextExtractor(tile_threshold=1000, max_pixels=10 ** 9)
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 1000), self.assertRaises(ValueError):
+            extractor.extract_text_from_image(path, preprocess=False)
+
+    def test_multi_frame_tiff(self):
+        path = Path(self.workdir.name) / "scans.tif"
+        first, *others = [self.noise() for _ in range(3)]
+        first.save(path, save_all=True, append_images=others)
+
+        frames = list(self.extractor.iter_gray_frames(path))
+        self.assertEqual([frame.shape for frame in frames], [(100, 200)] * 3)
+        self.assertTrue(np.array_equal(frames[2], np.asarray(others[1])))
+
+        with mock.patch("pytesseract.image_to_data", side_effect=fake_image_to_data):
+            text = self.extractor.extract_text_from_image(path, preprocess=False)
+        self.assertEqual(text.count("\n--- Page "), 3)
+
+    def test_multi_frame_tiff_with_an_oversized_frame(self):
+        path = Path(self.workdir.name) / "scans.tif"
+        self.noise().save(path, save_all=True, append_images=[self.noise(400, 200)])
+        frames = self.extractor.iter_gray_frames(path)
+        self.assertEqual(next(frames).shape, (100, 200))
+        with self.assertRaises(ValueError):
+            next(frames)
+
+
+class PrefixIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = PrefixIndex()
+        # Filled through update() only, without reading the database
+        self.index.built_at = time.monotonic()
+
+    def labels(self, query, owner):
+        return [result['label'] for result in self.index.search(query, owner=owner)]
+
+    def test_other_users_files_do_not_hide_visible_matches(self):
+        for n in range(600):
+            self.index.update('file', n, f'TD analyse {n}', owner=1, uuid=uuid.uuid4())
+        self.index.update('file', 1000, 'TD zoologie', owner=2, uuid=uuid.uuid4())
+        self.index.update('course', 1, 'Topologie')
+
+        self.assertEqual(self.labels('td', owner=2), ['TD zoologie'])
+        self.assertEqual(self.labels('t', owner=2), ['TD zoologie', 'Topologie'])
+        self.assertEqual(len(self.labels('td analyse', owner=1)), 10)
+
+    def test_file_moves_and_removal(self):
+        self.index.update('file', 1, 'Examen final', owner=1, uuid=uuid.uuid4())
+        self.index.update('file', 1, 'Examen final', owner=2, uuid=uuid.uuid4())
+        self.assertEqual(self.labels('exam', owner=1), [])
+        self.assertEqual(self.labels('fin', owner=2), ['Examen final'])
+        self.index.remove('file', 1)
+        self.assertEqual(self.labels('exam', owner=2), [])
+
+
+class FacetCountTests(TestCase):
+    def setUp(self):
+        self.course = make_course()
+        self.other_course = Course.objects.create(academic_year=self.course.academic_year,
+                                                  academic_degree=self.course.academic_degree, name='Analyse')
+        self.alice = make_profile('alice')
+        self.bob = make_profile('bob')
+
+    def counts(self, profile, facet='course'):
+        return {entry['label']: entry['count'] for entry in facets.profile_counts(profile)[facet]}
+
+    def stored(self):
+        return sorted(FacetCount.objects.filter(count__gt=0).values_list('profile', 'facet', 'value', 'count'))
+
+    def test_counts_are_kept_per_owner(self):
+        first = File.objects.create(course=self.course, name='td1.pdf', uploaded_by=self.alice)
+        File.objects.create(course=self.course, name='td2.pdf', uploaded_by=self.alice, file_category='exam')
+        File.objects.create(course=self.course, name='td3.pdf', uploaded_by=self.bob)
+        self.assertEqual(self.counts(self.alice), {'Algorithmique': 2})
+        self.assertEqual(self.counts(self.alice, 'file_category'), {'cours': 1, 'exam': 1})
+        self.assertEqual(self.counts(self.bob), {'Algorithmique': 1})
+
+        first.course = self.other_course
+        first.save()
+        self.assertEqual(self.counts(self.alice), {'Algorithmique': 1, 'Analyse': 1})
+        first.trash()
+        self.assertEqual(self.counts(self.alice), {'Algorithmique': 1})
+
+        incremental = self.stored()
+        facets.rebuild()
+        self.assertEqual(self.stored(), incremental)
+
+
+class ReferenceResolutionTests(TestCase):
+    def setUp(self):
+        self.course = make_course()
+        university = University.objects.create(name='Université de Ngozi', acronym='UNG', address='Ngozi')
+        faculty = Faculty.objects.create(university=university, name='Sciences', code='FS')
+        self.other_course = Course.objects.create(
+            academic_year=AcademicYear.objects.create(start=datetime.date(2023, 10, 1), end=datetime.date(2024, 9, 30)),
+            academic_degree=AcademicDegree.objects.create(university=university, degree=Degree.objects.create(name='Master'), year='2'),
+            faculty=faculty,
+            department=Department.objects.create(faculty=faculty, name='Chimie', code='CH'),
+            name='Chimie organique',
+        )
+        self.profile = make_profile('alice')
+
+    def test_changing_the_course_resolves_the_references_again(self):
+        file = File.objects.create(course=self.course, name='td.pdf', uploaded_by=self.profile)
+        self.assertEqual((file.university, file.year, file.faculty), ('Université du Burundi', '2024-2025', None))
+
+        file = File.objects.get(pk=file.pk)
+        file.course = self.other_course
+        file.save()
+        file.refresh_from_db()
+        self.assertEqual(file.university_ref_id, self.other_course.faculty.university_id)
+        self.assertEqual(file.faculty_ref_id, self.other_course.faculty_id)
+        self.assertEqual(file.department_ref_id, self.other_course.department_id)
+        self.assertEqual(file.year_ref_id, self.other_course.academic_year_id)
+        self.assertEqual((file.university, file.faculty, file.department, file.year),
+                         ('Université de Ngozi', 'Sciences', 'Chimie', '2023-2024'))
+        self.assertEqual(facets.profile_counts(self.profile)['university'][0]['label'], 'Université de Ngozi')
+
+    def test_changed_text_wins_over_the_course(self):
+        file = File.objects.create(course=self.course, name='td.pdf', uploaded_by=self.profile)
+        file.university = 'ung'
+        file.save()
+        self.assertEqual(file.university_ref.name, 'Université de Ngozi')
+        self.assertEqual(file.university, 'ung')
+
+    def test_unchanged_file_is_not_resolved_again(self):
+        file = File.objects.create(course=self.course, name='td.pdf', uploaded_by=self.profile)
+        file = File.objects.get(pk=file.pk)
+        file.name = 'td2.pdf'
+        with self.assertNumQueries(1):
+            file.save(update_fields=['name'])
+
+
+class MetricsAccessTests(TestCase):
+    @override_settings(METRICS_TOKEN='secret', METRICS_ALLOWED_IPS=[])
+    def test_metrics_need_staff_or_the_token(self):
+        # Behind a reverse proxy on the same host, every request comes from 127.0.0.1
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+        self.client.force_login(User.objects.create_user('admin', password='secret', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_empty_bucket_charges_none(self):
+        buckets = LocalBuckets()
+        both = {'profile': (1.0, 5), 'ip': (1.0, 1)}
+        self.assertEqual(buckets.take(both)[0], True)
+        allowed, wait = buckets.take(both)
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+        # The refused requests took nothing from the profile bucket
+        self.assertAlmostEqual(buckets.buckets['profile'][0], 4, places=2)
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4')
+        self.assertEqual(UploadThrottle().get_ident(request), '10.0.0.1')
+
+
+class ProfileUsageTests(TestCase):
+    def test_deleting_a_user_with_files(self):
+        profile = make_profile('alice')
+        File.objects.create(course=make_course(), name='td.pdf', uploaded_by=profile, size=100)
+        self.assertEqual(ProfileUsage.objects.get(profile=profile).storage_bytes, 100)
+        profile.user.delete()
+        self.assertFalse(ProfileUsage.objects.exists())
+
+
+class OcrQuotaTests(SimpleTestCase):
+    def extract(self, **installed):
+        file = mock.Mock(uploaded_by_id=1, pk=1)
+        file.file.path = '/tmp/scan.pdf'
+        extractor = TextExtractor()
+        with mock.patch.multiple(tasks, **installed), \
+                mock.patch.object(tasks.quotas, 'ocr_allowed', return_value=False), \
+                mock.patch.object(extractor, 'extract_text_from_file', return_value='texte') as extract, \
+                mock.patch.object(tasks, 'store_pages'), mock.patch.object(File.all_objects, 'filter'):
+            tasks.extract_file(file, extractor)
+        return extract
+
+    def test_over_quota_reads_the_text_layer_with_an_installed_backend(self):
+        self.extract(HAS_PYMUPDF=False, HAS_PDF=True).assert_called_once_with('/tmp/scan.pdf', method='pypdf2')
+        self.extract(HAS_PYMUPDF=True, HAS_PDF=True).assert_called_once_with('/tmp/scan.pdf', method='pymupdf')
+
+    def test_over_quota_without_text_backend_skips_the_file(self):
+        with self.assertLogs('api.tasks', 'INFO') as logs:
+            self.extract(HAS_PYMUPDF=False, HAS_PDF=False).assert_not_called()
+        self.assertIn("no text layer backend", logs.output[0])
+
+
+class PurgeTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.course = make_course()
+
+    def trashed(self, blob):
+        file = File.objects.create(course=self.course, name='td.pdf', file=blob)
+        file.trash()
+        File.all_objects.filter(pk=file.pk).update(trashed_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        return file
+
+    def test_blob_still_referenced_elsewhere_is_kept(self):
+        shared = self.trashed(ContentFile(b'%PDF partage', name='partage.pdf'))
+        kept = File.objects.create(course=self.course, name='copie.pdf', file=shared.file.name)
+        own = self.trashed(ContentFile(b'%PDF seul', name='seul.pdf'))
+
+        self.assertEqual(lifecycle.purge(), {'files': 2, 'blobs': 1, 'failed': 0})
+        self.assertEqual(list(File.all_objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertTrue(default_storage.exists(shared.file.name))
+        self.assertFalse(default_storage.exists(own.file.name))
+
+    @override_settings(TRASH_STORAGE_RETRIES=1, TRASH_STORAGE_BACKOFF=0)
+    def test_failed_deletion_stays_pending(self):
+        file = self.trashed(ContentFile(b'%PDF', name='td.pdf'))
+        with mock.patch.object(default_storage, 'delete', side_effect=OSError("stockage indisponible")) as delete:
+            self.assertEqual(lifecycle.purge(), {'files': 1, 'blobs': 0, 'failed': 1})
+        self.assertEqual(delete.call_count, 2)
+        self.assertFalse(File.all_objects.exists())
+        pending = PendingDeletion.objects.get()
+        self.assertEqual((pending.name, pending.attempts), (file.file.name, 1))
+
+        self.assertEqual(lifecycle.purge(), {'files': 0, 'blobs': 1, 'failed': 0})
+        self.assertFalse(default_storage.exists(file.file.name))
+
+
+class AuditBufferTests(TransactionTestCase):
+    # Not TestCase: SQLite only checks the deferred foreign keys when the outermost transaction commits
+
+    def test_bad_event_is_dropped_and_the_others_written(self):
+        profile = make_profile('alice')
+        buffer = audit.AuditBuffer(max_size=500)
+        events = [AuditLog(profile_id=profile.pk, action=f'download {n}') for n in range(7)]
+        events.insert(3, AuditLog(profile_id=profile.pk + 1000, action='download orphelin'))
+        buffer.events = events
+
+        with self.assertLogs('api.audit', 'ERROR') as logs:
+            self.assertEqual(buffer.flush(), 7)
+        self.assertIn('download orphelin', logs.output[0])
+        self.assertEqual(sorted(AuditLog.objects.values_list('action', flat=True)),
+                         [f'download {n}' for n in range(7)])
+        self.assertEqual(buffer.events, [])
+
+    @override_settings(AUDIT_PRUNE_INTERVAL=3600)
+    def test_first_prune_has_a_random_phase(self):
+        for phase, pruned in ((3600, True), (0, False)):
+            buffer = audit.AuditBuffer()
+            with mock.patch.object(audit.random, 'uniform', return_value=phase) as uniform, \
+                    mock.patch.object(audit, 'prune', return_value=0) as prune:
+                buffer.prune_if_due()
+                buffer.prune_if_due()
+            uniform.assert_called_once_with(0, 3600)
+            self.assertEqual(prune.call_count, int(pruned))
+
+
+class DuplicateGroupTests(TestCase):
+    WORDS = ('algorithme tri graphe arbre pile file tas hachage récursion complexité boucle tableau liste '
+             'chaîne noeud parcours profondeur largeur chemin poids').split()
+
+    def text(self, seed, length=300):
+        rng = random.Random(seed)
+        return ' '.join(rng.choice(self.WORDS) for _ in range(length))
+
+    def indexed(self, text):
+        file = File.objects.create(course=self.course, name='td.pdf', text=text)
+        similarity.index_file(file)
+        return file
+
+    def setUp(self):
+        self.course = make_course()
+
+    def test_near_identical_texts_are_grouped(self):
+        words = self.text(0).split()
+        rescan = self.indexed(' '.join(words))
+        words[150] = 'Dijkstra'
+        original = self.indexed(' '.join(words))
+        words[40] = 'Kruskal'
+        reexport = self.indexed(' '.join(words))
+        other = self.indexed(self.text(1))
+
+        groups, scores = similarity.duplicate_groups()
+        self.assertEqual(groups, [[rescan.pk, original.pk, reexport.pk]])
+        self.assertTrue(all(score >= 0.7 for score in scores.values()))
+        self.assertNotIn(other.pk, {pk for pair in similarity.candidate_pairs() for pk in pair})
+        self.assertEqual({file.pk for file, _ in similarity.similar(original)}, {rescan.pk, reexport.pk})
+
+        # Without the direct pair, the first and the last are still joined through the second (union-find)
+        chain = {(rescan.pk, original.pk), (original.pk, reexport.pk)}
+        with mock.patch.object(similarity, 'candidate_pairs', return_value=chain):
+            self.assertEqual(similarity.duplicate_groups()[0], [[rescan.pk, original.pk, reexport.pk]])
+
+    def test_signature_without_numpy(self):
+        text = self.text(2)
+        with mock.patch.object(similarity, 'HAS_NUMPY', False):
+            pure = similarity.signature(text)
+        self.assertEqual(similarity.signature(text), pure)
@@ -0,0 +1,160 @@
+"""
+Token bucket throttling
+
+Each scope (upload, download, webhook) has a bucket per profile and a
+bucket per client IP, configured in THROTTLE_BUCKETS. A bucket holds up to
+`burst` tokens and refills at `rate`; a request takes one token from each of
+its buckets and is refused (429 with Retry-After) when one is empty, in
+which case none of them is charged.
+
+The IP bucket keys on REMOTE_ADDR. X-Forwarded-For is only read when
+REST_FRAMEWORK['NUM_PROXIES'] says how many trusted proxies set it, since
+clients can send any value.
+
+Buckets live in the process (THROTTLE_BACKEND='local') or in a Django cache
+shared by all the workers (THROTTLE_BACKEND='cache', THROTTLE_CACHE_ALIAS).
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .utils import get_user_profile
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate):
+    """'60/hour' -> tokens per second"""
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period.rstrip('s')]
+
+
+def refill(tokens, last, now, rate, burst):
+    return min(burst, tokens + (now - last) * rate)
+
+
+def take_from(states, buckets, now, cost):
+    """
+    New (tokens, last) of each bucket and the seconds to wait, 0 when allowed
+
+    `states` are the stored (tokens, last) or None, `buckets` the (rate, burst)
+    in the same order. The cost is taken from every bucket only if none is short.
+    """
+    tokens = [refill(*(state or (burst, now)), now, rate, burst)
+              for state, (rate, burst) in zip(states, buckets)]
+    wait = max([(cost - left) / rate for left, (rate, _) in zip(tokens, buckets) if left < cost], default=0)
+    if not wait:
+        tokens = [left - cost for left in tokens]
+    return [(left, now) for left in tokens], wait
+
+
+class LocalBuckets:
+    """Buckets of this process; the least recently used ones are dropped past `max_keys`"""
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, buckets, cost=1):
+        """Take `cost` from every bucket of `buckets` ({key: (rate, burst)}) or from none"""
+        now = time.monotonic()
+        with self.lock:
+            states = [self.buckets.pop(key, None) for key in buckets]
+            states, wait = take_from(states, buckets.values(), now, cost)
+            self.buckets.update(zip(buckets, states))
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return not wait, wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBuckets:
+    """
+    Buckets in a Django cache, shared between processes and servers
+
+    The read-modify-write is not atomic: under concurrent requests on the same
+    bucket a few extra requests may get through, which is fine for throttling.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def take(self, buckets, cost=1):
+        """Take `cost` from every bucket of `buckets` ({key: (rate, burst)}) or from none"""
+        keys = [f"throttle:{key}" for key in buckets]
+        now = time.time()
+        stored = self.cache.get_many(keys)
+        states, wait = take_from([stored.get(key) for key in keys], buckets.values(), now, cost)
+        for key, (tokens, _), (rate, burst) in zip(keys, states, buckets.values()):
+            # Expire once the bucket would be full again anyway
+            self.cache.set(key, (tokens, now), timeout=int((burst - tokens) / rate) + 1)
+        return not wait, wait
+
+    def clear(self):
+        self.cache.clear()
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if getattr(settings, 'THROTTLE_BACKEND', 'local') == 'cache':
+            _backend = CacheBuckets(getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default'))
+        else:
+            _backend = LocalBuckets()
+    return _backend
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Takes a token from the profile and IP buckets of `scope`"""
+    scope = None
+
+    def get_ident(self, request):
+        if api_settings.NUM_PROXIES is not None:
+            return super().get_ident(request)
+        return request.META.get('REMOTE_ADDR')
+
+    def allow_request(self, request, view):
+        config = getattr(settings, 'THROTTLE_BUCKETS', {}).get(self.scope)
+        self.wait_seconds = 0
+        if not config:
+            return True
+
+        buckets = {}
+        if 'profile' in config and request.user and request.user.is_authenticated:
+            buckets[f"profile:{get_user_profile(request.user).pk}"] = config['profile']
+        if 'ip' in config:
+            buckets[f"ip:{self.get_ident(request)}"] = config['ip']
+        if not buckets:
+            return True
+
+        allowed, self.wait_seconds = get_backend().take({
+            f"{self.scope}:{key}": (parse_rate(bucket['rate']), bucket['burst']) for key, bucket in buckets.items()
+        })
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class UploadThrottle(TokenBucketThrottle):
+    scope = 'upload'
+
+
+class DownloadThrottle(TokenBucketThrottle):
+    scope = 'download'
+
+
+class WebhookThrottle(TokenBucketThrottle):
+    scope = 'webhook'
@@ -13,6 +13,7 @@ router.register(r'academic-degrees', AcademicDegreeViewSet, basename='academic-d
 router.register(r'faculties', FacultyViewSet, basename='faculties')
 router.register(r'departments', DepartmentViewSet, basename='departments')
 router.register(r'courses', CourseViewSet, basename='courses')
+router.register(r'professors', ProfessorViewSet, basename='professors')
 router.register(r'root', RootViewSet,  basename='root')
 
 urlpatterns = [
@@ -22,4 +23,10 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls')),
     path('send', SendWhatsAppMessage.as_view()),
     path('webhook', receive_whatsapp_message),
+    path('previews/<str:digest>', preview_image, name='file-preview'),
+    path('facets/', FacetsView.as_view(), name='facets'),
+    path('suggest/', SuggestView.as_view(), name='suggest'),
+    path('catalog/import/', CatalogImportView.as_view(), name='catalog-import'),
+    path('export/', ExportView.as_view(), name='export'),
+    path('errors/', ErrorRegistryView.as_view(), name='errors'),
 ]
\ No newline at end of file
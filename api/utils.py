@@ -1,7 +1,10 @@
-from .models import AuditLog, Profile
+from . import audit
+from .models import Profile
 
-def log_action(profile, action):
-    AuditLog.objects.create(user=profile, action=action)
+def log_action(profile, action, target=None, request=None):
+    """Record an audit event; buffered, so it costs the request no database write"""
+    ip = request.META.get('REMOTE_ADDR') if request is not None else None
+    audit.record(profile, action, target=target, ip=ip)
 
 def get_all_descendants(folder):
     for subfolder in folder.subfolders.all():
@@ -10,7 +13,10 @@ def get_all_descendants(folder):
 
 def get_user_profile(user):
     if user:
-        profile, _ = Profile.objects.get_or_create(user=user)
+        # Stateless JWT callers carry their profile in the token
+        profile = getattr(user, 'token_profile', None)
+        if profile is None:
+            profile, _ = Profile.objects.get_or_create(user_id=user.pk)
         return profile
     return None
 
@@ -5,15 +5,26 @@ from .models import *
 from .serializers import *
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.contenttypes.models import ContentType
-from .utils import get_user_profile
+from .utils import get_user_profile, log_action
+from .tasks import schedule_extraction
+from .search import IndexedSearchFilter, get_backend
+from django.conf import settings
+from django.db.models import F
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotModified, StreamingHttpResponse
+from . import errors, facets, metrics, quotas, similarity, suggest
+from .throttling import DownloadThrottle, UploadThrottle, WebhookThrottle
+from .catalog import CatalogError, import_catalog
+from .export import FILTERS as EXPORT_FILTERS, FORMATS as EXPORT_FORMATS, export_filename, select_files, stream_archive
+from django.views.decorators.http import require_GET
+import hmac
+import mimetypes
 from rest_framework.response import Response
-from rest_framework.authentication import SessionAuthentication
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from django_filters import rest_framework as filters
 from rest_framework.views import APIView
 from rest_framework import status
 from twilio.rest import Client
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, throttle_classes
 import os
 from dotenv import load_dotenv
 import logging
@@ -29,19 +40,17 @@ class CustomTokenView(TokenObtainPairView):
     serializer_class = CustomTokenSerializer
 
 class RootViewSet(viewsets.ViewSet):
-    authentication_classes = SessionAuthentication, JWTAuthentication
     permission_classes = [permissions.IsAuthenticated]
 
     def list(self, request):
         profile = get_user_profile(request.user)
-        files = File.objects.filter(uploaded_by=profile)
+        files = File.objects.filter(uploaded_by=profile).defer('text').select_related('uploaded_by').prefetch_related('previews')
 
         return Response({
             "files":FileSerializer(files, many=True, context={'request': request}).data,
         })
 
 class ProfileViewSet(viewsets.ModelViewSet):
-    authentication_classes = SessionAuthentication, JWTAuthentication
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
     permission_classes = permissions.IsAuthenticated,
@@ -60,25 +69,21 @@ class ProfileViewSet(viewsets.ModelViewSet):
             return None 
 
 class AcademicYearViewSet(viewsets.ModelViewSet):
-    authentication_classes = SessionAuthentication, JWTAuthentication
     queryset = AcademicYear.objects.all()
     serializer_class = AcademicYearSerializer
     permission_classes = permissions.IsAuthenticated,
 
 class DegreeViewSet(viewsets.ModelViewSet):
-    authentication_classes = SessionAuthentication, JWTAuthentication
     queryset = Degree.objects.all()
     serializer_class = DegreeSerializer
     permission_classes = permissions.IsAuthenticated,
 
 class UniversityViewSet(viewsets.ModelViewSet):
-    authentication_classes = SessionAuthentication, JWTAuthentication
     queryset = University.objects.all()
     serializer_class = UniversitySerializer
     permission_classes = permissions.IsAuthenticated,
 
 class AcademicDegreeViewSet(viewsets.ModelViewSet):
-    authentication_classes = SessionAuthentication, JWTAuthentication
     queryset = AcademicDegree.objects.all()
     serializer_class = AcademicDegreeSerializer
     permission_classes = permissions.IsAuthenticated,
@@ -89,32 +94,30 @@ class AcademicDegreeViewSet(viewsets.ModelViewSet):
     }
 
 class FacultyViewSet(viewsets.ModelViewSet):
-    authentication_classes = SessionAuthentication, JWTAuthentication
     queryset = Faculty.objects.all()
     serializer_class = FacultySerializer
     permission_classes = permissions.IsAuthenticated,
-    filter_backends = [filters.DjangoFilterBackend, ]
+    filter_backends = [filters.DjangoFilterBackend, IndexedSearchFilter]
     filterset_fields = {
         'name': ['icontains'],
         'university':['exact'],
     }
 
 class DepartmentViewSet(viewsets.ModelViewSet):
-    authentication_classes = SessionAuthentication, JWTAuthentication
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     permission_classes = permissions.IsAuthenticated,
-    filter_backends = [filters.DjangoFilterBackend, ]
+    filter_backends = [filters.DjangoFilterBackend, IndexedSearchFilter]
     filterset_fields = {
         'name': ['icontains'],
         'faculty':['exact'],
     }
 
 class CourseViewSet(viewsets.ModelViewSet):
-    authentication_classes = SessionAuthentication, JWTAuthentication
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
     permission_classes = permissions.IsAuthenticated,
+    filter_backends = [filters.DjangoFilterBackend, IndexedSearchFilter]
     filterset_fields = {
         'name': ['icontains'],
         'faculty':['exact'],
@@ -122,31 +125,284 @@ class CourseViewSet(viewsets.ModelViewSet):
     }
 
 
+class ProfessorViewSet(viewsets.ModelViewSet):
+    queryset = Professor.objects.all()
+    serializer_class = ProfessorSerializer
+    permission_classes = permissions.IsAuthenticated,
+    filterset_fields = {
+        'name': ['icontains'],
+    }
+
+
 class FileViewSet(viewsets.ModelViewSet):
-    authentication_classes = SessionAuthentication, JWTAuthentication
     serializer_class = FileSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
     lookup_field = 'uuid'
+    filter_backends = [filters.DjangoFilterBackend, IndexedSearchFilter]
     filterset_fields = {
         'name': ['icontains'],
         'description': ['icontains'],
         'file_type': ['icontains'],
         'file_category': ['icontains'],
         'course':['exact'],
+        'university_ref': ['exact'],
+        'faculty_ref': ['exact'],
+        'department_ref': ['exact'],
+        'professor_ref': ['exact'],
+        'year_ref': ['exact'],
     }
 
+    def with_text(self):
+        return self.request.query_params.get('with_text', '').lower() in ('1', 'true', 'yes')
+
     def get_queryset(self):
         profile = get_user_profile(self.request.user)
-        qs = File.objects.filter(uploaded_by=profile)
+        # Trashed files are only reachable through the trash listing and restore
+        files = File.all_objects.trashed() if self.action in ('trash', 'restore') else File.objects
+        qs = files.filter(uploaded_by=profile).select_related('uploaded_by').prefetch_related('previews')
+        if not self.with_text():
+            qs = qs.defer('text')
         return qs
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['with_text'] = self.with_text()
+        return context
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets', '').lower() in ('1', 'true', 'yes'):
+            if set(request.query_params) <= {'facets', 'with_text'}:
+                # All the caller's files: precomputed counts
+                counts = facets.profile_counts(get_user_profile(request.user))
+            else:
+                counts = facets.counts_for(self.filter_queryset(self.get_queryset()))
+            response.data = {"results": response.data, "facets": counts}
+        return response
+
+    def get_throttles(self):
+        if self.action == 'create':
+            return [UploadThrottle()]
+        if self.action == 'download':
+            return [DownloadThrottle()]
+        return super().get_throttles()
+
     def perform_create(self, serializer):
         profile = get_user_profile(self.request.user)
-        serializer.save(uploaded_by=profile)
+        upload = serializer.validated_data.get('file')
+        quotas.check_upload(profile, upload.size if upload else 0)
+        file = serializer.save(uploaded_by=profile)
+        log_action(profile, 'file.upload', target=file.uuid, request=self.request)
+        schedule_extraction(file)
+
+    def perform_update(self, serializer):
+        file = serializer.save()
+        log_action(get_user_profile(self.request.user), 'file.update', target=file.uuid, request=self.request)
+
+    def perform_destroy(self, instance):
+        log_action(get_user_profile(self.request.user), 'file.delete', target=instance.uuid, request=self.request)
+        instance.delete()
+
+    @action(detail=False, methods=['get'])
+    def trash(self, request):
+        return self.list(request)
+
+    @action(detail=True, methods=['post'])
+    def restore(self, request, uuid=None):
+        file = self.get_object()
+        file.restore()
+        log_action(get_user_profile(request.user), 'file.restore', target=file.uuid, request=request)
+        return Response(self.get_serializer(file).data)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, uuid=None):
+        file = self.get_object()
+        if not file.file:
+            raise Http404
+        File.objects.filter(pk=file.pk).update(nb_retrieved=F('nb_retrieved') + 1)
+        log_action(get_user_profile(request.user), 'file.download', target=file.uuid, request=request)
+        name = file.name or os.path.basename(file.file.name)
+        return FileResponse(file.file.open('rb'), as_attachment=True, filename=name)
+
+    @action(detail=False, methods=['get'])
+    def usage(self, request):
+        usage = quotas.get_usage(get_user_profile(request.user))
+        return Response({
+            "files": usage.files,
+            "storage_bytes": usage.storage_bytes,
+            "ocr_pages": usage.ocr_pages,
+            "limits": quotas.limits(),
+        })
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, uuid=None):
+        file = self.get_object()
+        try:
+            threshold = float(request.query_params.get('threshold', similarity.get_threshold()))
+        except ValueError:
+            return Response({"error": "'threshold' doit être un nombre"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < threshold <= 1:
+            return Response({"error": "'threshold' doit être compris entre 0 et 1"}, status=status.HTTP_400_BAD_REQUEST)
+        results = []
+        for other, score in similarity.similar(file, self.get_queryset(), threshold):
+            results.append({**self.get_serializer(other).data, "similarity": round(score, 3)})
+        return Response({"file": file.uuid, "threshold": threshold, "results": results})
+
+    @action(detail=True, methods=['get'])
+    def pages(self, request, uuid=None):
+        file = self.get_object()
+        max_range = getattr(settings, 'FILE_PAGES_MAX_RANGE', 50)
+        try:
+            start = max(int(request.query_params.get('from', 1)), 1)
+            end = int(request.query_params.get('to', start + max_range - 1))
+        except ValueError:
+            return Response({"error": "'from' et 'to' doivent être des entiers"}, status=status.HTTP_400_BAD_REQUEST)
+        end = min(end, start + max_range - 1)
+        if end < start:
+            return Response({"error": "'to' doit être supérieur ou égal à 'from'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        pages = FilePage.objects.filter(file=file, number__gte=start, number__lte=end)
+        return Response({
+            "file": file.uuid,
+            "count": FilePage.objects.filter(file=file).count(),
+            "from": start,
+            "to": end,
+            "pages": FilePageSerializer(pages, many=True).data,
+        })
+
+
+@require_GET
+def preview_image(request, digest):
+    # Thumbnails are content addressed: a given URL never changes, so it can be cached forever,
+    # but only by the browser: they show private files, shared caches must not keep them
+    etag = f'"{digest}"'
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponseNotModified()
+    name = FilePreview.objects.filter(digest=digest).values_list('image', flat=True).first()
+    if not name or not default_storage.exists(name):
+        raise Http404
+    response = FileResponse(default_storage.open(name), content_type=mimetypes.guess_type(name)[0])
+    response['Cache-Control'] = f"private, max-age={getattr(settings, 'PREVIEW_CACHE_MAX_AGE', 31536000)}, immutable"
+    response['ETag'] = etag
+    return response
+
+
+def metrics_allowed(request):
+    """Staff session, `Authorization: Bearer <METRICS_TOKEN>`, or an address listed in METRICS_ALLOWED_IPS"""
+    if request.user.is_staff:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip().encode(), token.encode()):
+        return True
+    # Only safe when no proxy of the same host forwards the public traffic
+    return request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+
+
+@require_GET
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class FacetsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        selected = {
+            facet: request.query_params[facet]
+            for facet in facets.FACETS
+            if request.query_params.get(facet)
+        }
+        invalid = [facet for facet, value in selected.items() if facet in facets.LABELS and not value.isdigit()]
+        if invalid:
+            return Response({"error": f"Identifiant invalide pour : {', '.join(invalid)}"}, status=status.HTTP_400_BAD_REQUEST)
+        query = request.query_params.get('q', '').strip()
+        # Only the caller's files, like FileViewSet: counts over the whole archive would reveal other users' files
+        profile = get_user_profile(request.user)
+        if not selected and not query:
+            # Unfiltered: read the precomputed counts
+            return Response({"selected": selected, "facets": facets.profile_counts(profile)})
+
+        files = File.objects.filter(
+            uploaded_by=profile,
+            **{facets.FACETS[facet]: value for facet, value in selected.items()},
+        )
+        if query:
+            files = get_backend().search(files, query)
+        return Response({"selected": selected, "facets": facets.counts_for(files)})
+
+
+class SuggestView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+        unknown = [kind for kind in kinds if kind not in suggest.SOURCES]
+        if unknown:
+            return Response({"error": f"Type inconnu : {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not query:
+            return Response({"query": query, "results": []})
+        profile = get_user_profile(request.user)
+        return Response({"query": query, "results": suggest.suggest(query, owner=profile.pk, kinds=kinds)})
+
+
+class CatalogImportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "Fichier requis"}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        try:
+            report = import_catalog(upload.file, upload.name, dry_run=dry_run)
+        except (CatalogError, ImportError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED)
+
+
+class ExportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        archive_format = request.query_params.get('archive', 'zip')
+        if archive_format not in EXPORT_FORMATS:
+            return Response({"error": "'archive' doit être zip ou tar"}, status=status.HTTP_400_BAD_REQUEST)
+        selection = {name: request.query_params.get(name) for name in EXPORT_FILTERS}
+        if not any(selection.values()):
+            return Response({"error": f"Sélection requise : {', '.join(EXPORT_FILTERS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not all(value.isdigit() for value in selection.values() if value):
+            return Response({"error": "Les identifiants doivent être des entiers"}, status=status.HTTP_400_BAD_REQUEST)
+        with_text = request.query_params.get('with_text', '').lower() in ('1', 'true', 'yes')
+
+        files = select_files(with_text=with_text, **selection)
+        response = StreamingHttpResponse(
+            stream_archive(files, archive_format, with_text),
+            content_type=EXPORT_FORMATS[archive_format][0],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(archive_format)}"'
+        return response
+
+
+class ErrorRegistryView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(errors.REGISTRY.snapshot())
+
+    def delete(self, request):
+        errors.REGISTRY.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class SendWhatsAppMessage(APIView):
+    throttle_classes = [WebhookThrottle]
+
     def post(self, request):
         # Récupérer les données envoyées par le client
         to_number = request.data.get("to")
@@ -172,6 +428,7 @@ class SendWhatsAppMessage(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 # class SendWhatsAppMessage(APIView):
+
 def sendMessage(to, msg):
         # Récupérer les données envoyées par le client
         to_number = to.split(":")[1]
@@ -199,6 +456,7 @@ def sendMessage(to, msg):
 
         
 @api_view(["POST"])
+@throttle_classes([WebhookThrottle])
 def receive_whatsapp_message(request):
     # Configuration logging
     
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Reproducible synthetic corpus for the extractor benchmarks
+
+Every document is generated from a seeded RNG, so the same seed always
+produces the same files and the same ground truth. Nothing is downloaded:
+text and table PDFs are written by a tiny PDF writer, scans and photos are
+rendered with Pillow.
+
+    python -m benchmarks.corpus /tmp/corpus --seed 42
+"""
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import List
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+VOCABULARY = (
+    "algorithme analyse architecture base biologie calcul chimie chapitre code "
+    "cours donnees droit economie energie equation examen exercice faculte fonction "
+    "geographie histoire informatique langue logique matrice medecine memoire methode "
+    "modele physique probleme professeur programme question reseau semestre solution "
+    "statistique structure systeme theorie travail universite variable vecteur"
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 56
+FONT_SIZE = 11
+LEADING = 15
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize()
+
+
+def text_lines(rng: random.Random, count: int) -> List[str]:
+    return [sentence(rng, rng.randint(6, 10)) for _ in range(count)]
+
+
+def pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: Path, page_streams: List[str]):
+    """Write a PDF whose pages draw the given content streams with Helvetica"""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled once the page ids are known
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for stream in page_streams:
+        data = stream.encode("latin-1")
+        objects.append(f"<< /Length {len(data)} >>\nstream\n{stream}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(bytes(out))
+
+
+def text_stream(lines: List[str], top: float = PAGE_HEIGHT - MARGIN) -> str:
+    ops = [f"BT /F1 {FONT_SIZE} Tf {LEADING} TL {MARGIN} {top} Td"]
+    ops += [f"({pdf_escape(line)}) '" for line in lines]
+    ops.append("ET")
+    return "\n".join(ops)
+
+
+def table_stream(rows: List[List[str]], top: float) -> str:
+    """Draw a ruled grid with one word per cell"""
+    columns = len(rows[0])
+    cell_width = (PAGE_WIDTH - 2 * MARGIN) / columns
+    row_height = LEADING + 6
+    ops = ["0.5 w"]
+    for r, row in enumerate(rows):
+        y = top - (r + 1) * row_height
+        for c, cell in enumerate(row):
+            x = MARGIN + c * cell_width
+            ops.append(f"{x:.2f} {y:.2f} {cell_width:.2f} {row_height} re S")
+            ops.append(f"BT /F1 {FONT_SIZE} Tf {x + 4:.2f} {y + 6:.2f} Td ({pdf_escape(cell)}) Tj ET")
+    return "\n".join(ops)
+
+
+def render_page_image(lines: List[str], dpi: int = 150) -> Image.Image:
+    scale = dpi / 72
+    image = Image.new("L", (int(PAGE_WIDTH * scale), int(PAGE_HEIGHT * scale)), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=int(FONT_SIZE * scale * 1.3))
+    y = MARGIN * scale
+    for line in lines:
+        draw.text((MARGIN * scale, y), line, fill=0, font=font)
+        y += LEADING * scale * 1.3
+    return image
+
+
+def make_text_pdf(rng, path, pages):
+    truth = [text_lines(rng, 40) for _ in range(pages)]
+    write_pdf(path, [text_stream(lines) for lines in truth])
+    return truth
+
+
+def make_table_pdf(rng, path, pages):
+    truth, streams = [], []
+    for _ in range(pages):
+        heading = text_lines(rng, 3)
+        rows = [[rng.choice(VOCABULARY) for _ in range(5)] for _ in range(25)]
+        top = PAGE_HEIGHT - MARGIN - LEADING * (len(heading) + 1)
+        streams.append(text_stream(heading) + "\n" + table_stream(rows, top))
+        truth.append(heading + [" ".join(row) for row in rows])
+    write_pdf(path, streams)
+    return truth
+
+
+def make_scanned_pdf(rng, path, pages):
+    truth = [text_lines(rng, 30) for _ in range(pages)]
+    images = [render_page_image(lines).filter(ImageFilter.GaussianBlur(0.6)) for lines in truth]
+    images[0].save(path, "PDF", resolution=150, save_all=True, append_images=images[1:])
+    return truth
+
+
+def make_photo(rng, path, pages=1):
+    lines = text_lines(rng, 20)
+    image = render_page_image(lines, dpi=200).convert("RGB")
+    # Uneven lighting, a slight tilt and JPEG compression, like a phone picture of a handout
+    shade = Image.linear_gradient("L").resize(image.size).point(lambda v: 200 + v // 5)
+    image = Image.composite(image, Image.merge("RGB", [shade] * 3), image.convert("L").point(lambda v: 255 - v))
+    image = image.rotate(rng.uniform(-1.5, 1.5), expand=True, fillcolor=(235, 235, 230))
+    image.save(path, "JPEG", quality=80)
+    return [lines]
+
+
+GENERATORS = {
+    "text_pdf": (make_text_pdf, ".pdf"),
+    "table_pdf": (make_table_pdf, ".pdf"),
+    "scanned_pdf": (make_scanned_pdf, ".pdf"),
+    "photo": (make_photo, ".jpg"),
+}
+
+
+def generate_corpus(output_dir, seed: int = 42, docs_per_kind: int = 3, pages: int = 4) -> dict:
+    """
+    Generate the corpus into `output_dir` and write its manifest.json
+
+    Returns the manifest: one entry per document with its kind, page count
+    and ground truth text (one list of lines per page).
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+
+    documents = []
+    for kind, (generator, suffix) in GENERATORS.items():
+        for index in range(docs_per_kind):
+            path = output_dir / f"{kind}_{index}{suffix}"
+            truth = generator(rng, path, pages)
+            documents.append({
+                "path": path.name,
+                "kind": kind,
+                "pages": len(truth),
+                "bytes": path.stat().st_size,
+                "ground_truth": ["\n".join(lines) for lines in truth],
+            })
+
+    manifest = {"seed": seed, "documents": documents}
+    (output_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the synthetic extractor benchmark corpus")
+    parser.add_argument("output", help="Output directory")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--docs", type=int, default=3, help="Documents per kind")
+    parser.add_argument("--pages", type=int, default=4, help="Pages per PDF")
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.output, seed=args.seed, docs_per_kind=args.docs, pages=args.pages)
+    print(f"Generated {len(manifest['documents'])} documents in {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Concurrent writer/reader throughput for each database profile
+
+Every profile runs in a child process configured through the same
+environment variables as the settings (see k_archiver/database.py):
+
+    sqlite-default  SQLite with default journaling (SQLITE_TUNING=0)
+    sqlite-wal      SQLite with WAL, synchronous=NORMAL, mmap and busy timeout
+    postgres        the PostgreSQL server described by DB_* (only with --postgres)
+
+    python -m benchmarks.db_concurrency --writers 4 --readers 8 --seconds 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROFILES = {
+    'sqlite-default': {'DB_ENGINE': 'sqlite', 'SQLITE_TUNING': '0'},
+    'sqlite-wal': {'DB_ENGINE': 'sqlite', 'SQLITE_TUNING': '1'},
+    'postgres': {'DB_ENGINE': 'postgres'},
+}
+
+TABLE = 'bench_concurrency'
+
+
+def worker(kind, deadline, counts, errors, lock):
+    from django.db import connection, transaction
+
+    done = failed = 0
+    payload = 'x' * 512
+    try:
+        while time.perf_counter() < deadline:
+            try:
+                with connection.cursor() as cursor:
+                    if kind == 'write':
+                        with transaction.atomic():
+                            cursor.execute(f"INSERT INTO {TABLE} (payload) VALUES (%s)", [payload])
+                    else:
+                        cursor.execute(f"SELECT id, payload FROM {TABLE} ORDER BY id DESC LIMIT 20")
+                        cursor.fetchall()
+                done += 1
+            except Exception as e:
+                failed += 1
+                key = f"{type(e).__name__}: {str(e)[:80]}"
+                with lock:
+                    errors[key] = errors.get(key, 0) + 1
+    finally:
+        connection.close()
+        with lock:
+            counts[kind] += done
+            counts[kind + '_errors'] += failed
+
+
+def run_child(writers, readers, seconds):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'k_archiver.settings')
+    import django
+    django.setup()
+    from django.db import connection
+
+    primary_key = 'SERIAL PRIMARY KEY' if connection.vendor == 'postgresql' else 'INTEGER PRIMARY KEY AUTOINCREMENT'
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cursor.execute(f"CREATE TABLE {TABLE} (id {primary_key}, payload TEXT NOT NULL)")
+    connection.close()
+
+    counts = {'write': 0, 'read': 0, 'write_errors': 0, 'read_errors': 0}
+    errors, lock = {}, threading.Lock()
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=worker, args=('write', deadline, counts, errors, lock)) for _ in range(writers)]
+    threads += [threading.Thread(target=worker, args=('read', deadline, counts, errors, lock)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE {TABLE}")
+
+    print(json.dumps({
+        'vendor': connection.vendor,
+        'writes_per_sec': round(counts['write'] / seconds, 1),
+        'reads_per_sec': round(counts['read'] / seconds, 1),
+        'write_errors': counts['write_errors'],
+        'read_errors': counts['read_errors'],
+        'errors': errors,
+    }))
+
+
+def run_profile(name, writers, readers, seconds, workdir):
+    env = dict(os.environ, **PROFILES[name])
+    if env['DB_ENGINE'] == 'sqlite':
+        env['DB_NAME'] = str(Path(workdir) / f'{name}.sqlite3')
+    command = [sys.executable, '-m', 'benchmarks.db_concurrency', '--child',
+               '--writers', str(writers), '--readers', str(readers), '--seconds', str(seconds)]
+    result = subprocess.run(command, env=env, capture_output=True, text=True,
+                            cwd=Path(__file__).resolve().parent.parent)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent DB throughput per database profile")
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--postgres', action='store_true', help="Also benchmark the PostgreSQL server from DB_*")
+    parser.add_argument('-o', '--output', help="Write the JSON report to this file")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.writers, args.readers, args.seconds)
+        return
+
+    profiles = ['sqlite-default', 'sqlite-wal'] + (['postgres'] if args.postgres else [])
+    with tempfile.TemporaryDirectory() as workdir:
+        report = {
+            'writers': args.writers,
+            'readers': args.readers,
+            'seconds': args.seconds,
+            'profiles': {name: run_profile(name, args.writers, args.readers, args.seconds, workdir)
+                         for name in profiles},
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding='utf-8')
+        print(f"Results saved to: {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
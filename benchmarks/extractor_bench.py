@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Throughput, memory and accuracy benchmark for api.extractor.TextExtractor
+
+Each configuration (PDF backend, or image preprocessing on/off) runs in its
+own process so that peak RSS is measured for that configuration alone.
+
+    python -m benchmarks.extractor_bench --corpus /tmp/corpus -o results.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import re
+import resource
+import sys
+import time
+from pathlib import Path
+
+from .corpus import generate_corpus
+
+PDF_METHODS = ["pypdf2", "pdfplumber", "pymupdf", "auto"]
+IMAGE_SETTINGS = {"raw": {"preprocess": False}, "preprocess": {"preprocess": True}}
+# Table blocks pdfplumber appends after the text of a page: the cells are already in
+# the text, and the ground truth is the plain text
+TABLE_BLOCK_RE = re.compile(r"\n--- Table ---\n.*", re.S)
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def levenshtein(a: str, b: str) -> int:
+    # Bit-parallel edit distance (Myers 1999, Hyyrö 2003): a single pass over `b`
+    # with `a` encoded as bit vectors, fast enough to score whole pages
+    if not a or not b:
+        return len(a) + len(b)
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    peq = {}
+    for i, char in enumerate(a):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    pv, mv, score = full, 0, len(a)
+    for char in b:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
+
+
+def character_error_rate(predicted: str, truth: str) -> float:
+    predicted, truth = normalize(predicted), normalize(truth)
+    if not truth:
+        return 0.0 if not predicted else 1.0
+    return levenshtein(predicted, truth) / len(truth)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_configuration(corpus_dir: str, documents: list, kwargs: dict, repeat: int) -> dict:
+    """Body of a benchmark child process"""
+    logging.disable(logging.CRITICAL)
+    from api.extractor import TextExtractor
+
+    extractor = TextExtractor()
+    baseline_rss = peak_rss_mb()
+    pages = 0
+    elapsed = 0.0
+    errors = []
+    error_rates = {}
+    tables = {}
+
+    for document in documents:
+        path = Path(corpus_dir) / document["path"]
+        text = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                text = extractor.extract_text_from_file(path, **kwargs)
+            except Exception as e:
+                errors.append(f"{document['path']}: {e}")
+                break
+            elapsed += time.perf_counter() - start
+            pages += document["pages"]
+        if text is None:
+            continue
+
+        predicted = extractor.split_pages(text)
+        tables[document["kind"]] = tables.get(document["kind"], 0) + text.count("\n--- Table ---\n")
+        predicted = [TABLE_BLOCK_RE.sub("", page) for page in predicted]
+        truth = document["ground_truth"]
+        if len(predicted) != len(truth):
+            # Backends that do not emit page markers are scored on the whole document
+            predicted, truth = ["\n".join(predicted)], ["\n".join(truth)]
+        rates = [character_error_rate(p, t) for p, t in zip(predicted, truth)]
+        error_rates.setdefault(document["kind"], []).extend(rates)
+
+    return {
+        "pages": pages,
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rss_over_baseline_mb": round(peak_rss_mb() - baseline_rss, 1),
+        # Scored without the table blocks, counted apart
+        "cer": {kind: round(sum(r) / len(r), 4) for kind, r in error_rates.items()},
+        "tables": tables,
+        "errors": errors,
+    }
+
+
+def run_isolated(*args) -> dict:
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_configuration, args)
+
+
+def benchmark(corpus_dir, repeat: int = 1) -> dict:
+    manifest = json.loads((Path(corpus_dir) / "manifest.json").read_text(encoding="utf-8"))
+    documents = manifest["documents"]
+    pdfs = [d for d in documents if d["path"].endswith(".pdf")]
+    images = [d for d in documents if not d["path"].endswith(".pdf")]
+
+    results = {}
+    for method in PDF_METHODS:
+        results[f"pdf:{method}"] = run_isolated(str(corpus_dir), pdfs, {"method": method}, repeat)
+    for name, kwargs in IMAGE_SETTINGS.items():
+        results[f"image:{name}"] = run_isolated(str(corpus_dir), images, kwargs, repeat)
+
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": manifest["seed"],
+        "documents": len(documents),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TextExtractor backends")
+    parser.add_argument("--corpus", required=True, help="Corpus directory (generated if missing)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed used when generating the corpus")
+    parser.add_argument("--repeat", type=int, default=1, help="Extractions per document")
+    parser.add_argument("-o", "--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if not (Path(args.corpus) / "manifest.json").exists():
+        generate_corpus(args.corpus, seed=args.seed)
+
+    report = benchmark(args.corpus, repeat=args.repeat)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+        print(f"Results saved to: {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Load test of the REST API with concurrent simulated students
+
+Each virtual user logs in with one of the accounts created by
+benchmarks.loadtest_fixtures, then runs scenarios picked at random
+according to --mix until the time is up:
+
+    browse    course list, the files of a course, a file's details
+    search    full text search on files, autocomplete, faceted search
+    download  download one of the user's files
+    upload    upload a small PDF to a course
+    login     obtain a new token
+
+The report gives, per endpoint, the throughput, p50/p95/p99 latencies and
+error/throttled counts seen by the clients, and the database queries per
+request measured by the server: /metrics is read before and after the run
+with --metrics-token (the server's METRICS_TOKEN). The metrics live in
+each server process, so run a single process (runserver, or gunicorn with
+one worker and threads) for exact query counts. The token bucket throttles
+apply as in production: 429 responses are counted apart.
+
+    DB_NAME=/tmp/loadtest.sqlite3 METRICS_TOKEN=secret python manage.py runserver --noreload
+    python -m benchmarks.loadtest --metrics-token secret --users 50 --duration 60 --mix browse=5,search=3,download=2,upload=1
+"""
+import argparse
+import json
+import math
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import requests
+
+from .corpus import VOCABULARY, make_text_pdf
+
+DEFAULT_MIX = 'browse=5,search=3,download=2,upload=1,login=1'
+METRIC_RE = re.compile(r'^(http_request_(?:db_queries|duration_seconds|db_duration_seconds))_(sum|count)\{([^}]*)\} (\S+)$')
+VIEW_RE = re.compile(r'view="([^"]*)"')
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def add(self, endpoint, seconds, status):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            statuses = self.statuses[endpoint]
+            endpoints[endpoint] = {
+                'requests': len(values),
+                'rps': round(len(values) / elapsed, 2),
+                'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+                'max_ms': round(values[-1] * 1000, 1),
+                'throttled': statuses.get(429, 0),
+                'errors': sum(count for status, count in statuses.items()
+                              if status != 429 and not 200 <= status < 400),
+                'statuses': dict(statuses),
+            }
+        return endpoints
+
+
+class Client:
+    """A student: a session, a token, the course ids and the uuids of their files"""
+
+    def __init__(self, base_url, username, password, recorder, rng, payload=b''):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.recorder = recorder
+        self.rng = rng
+        # PDF sent by the upload scenario
+        self.payload = payload
+        self.session = requests.Session()
+        self.courses = []
+        self.files = []
+
+    def request(self, endpoint, method, path, **kwargs):
+        """Send a request, recorded under `endpoint` (the path with its parameters left out)"""
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=60, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 0
+        self.recorder.add(endpoint, time.perf_counter() - start, status)
+        if status == 401 and endpoint != 'POST /api/login/':
+            self.login()
+        return response
+
+    def login(self):
+        response = self.request('POST /api/login/', 'POST', '/api/login/',
+                                json={'username': self.username, 'password': self.password})
+        if response is None or response.status_code != 200:
+            return False
+        self.session.headers['Authorization'] = f"Bearer {response.json()['access']}"
+        return True
+
+    def start(self):
+        if not self.login():
+            return False
+        response = self.request('GET /api/courses/', 'GET', '/api/courses/')
+        if response is not None and response.ok:
+            self.courses = [course['id'] for course in response.json()]
+        response = self.request('GET /api/files/', 'GET', '/api/files/')
+        if response is not None and response.ok:
+            self.files = [file['uuid'] for file in response.json()]
+        return True
+
+    def word(self):
+        return self.rng.choice(VOCABULARY)
+
+
+def browse(client):
+    client.request('GET /api/courses/', 'GET', '/api/courses/')
+    if client.courses:
+        client.request('GET /api/files/?course=', 'GET', f'/api/files/?course={client.rng.choice(client.courses)}')
+    if client.files:
+        client.request('GET /api/files/{uuid}/', 'GET', f'/api/files/{client.rng.choice(client.files)}/')
+
+
+def search(client):
+    client.request('GET /api/files/?q=', 'GET', f'/api/files/?q={client.word()}')
+    word = client.word()
+    for length in range(2, min(len(word), 5) + 1):
+        # One request per keystroke, like the search box
+        client.request('GET /api/suggest/?q=', 'GET', f'/api/suggest/?q={word[:length]}')
+    client.request('GET /api/facets/?q=', 'GET', f'/api/facets/?q={client.word()}')
+
+
+def download(client):
+    if client.files:
+        client.request('GET /api/files/{uuid}/download/', 'GET',
+                       f'/api/files/{client.rng.choice(client.files)}/download/')
+
+
+def upload(client):
+    if not client.courses:
+        return
+    response = client.request('POST /api/files/', 'POST', '/api/files/',
+                              data={'course': client.rng.choice(client.courses), 'file_category': 'exam'},
+                              files={'file': ('loadtest.pdf', client.payload, 'application/pdf')})
+    if response is not None and response.status_code == 201:
+        client.files.append(response.json()['uuid'])
+
+
+def login(client):
+    client.login()
+
+
+SCENARIOS = {
+    'browse': browse,
+    'search': search,
+    'download': download,
+    'upload': upload,
+    'login': login,
+}
+
+
+def parse_mix(mix):
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario: {name}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def make_upload_payload(seed):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = Path(workdir) / 'upload.pdf'
+        make_text_pdf(random.Random(seed), path, 2)
+        return path.read_bytes()
+
+
+def scrape_metrics(base_url, token=None):
+    """{view: {metric: (sum, count)}} from the server's /metrics, None when not reachable"""
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    try:
+        response = requests.get(base_url.rstrip('/') + '/metrics', headers=headers, timeout=10)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    values = defaultdict(lambda: defaultdict(lambda: [0.0, 0.0]))
+    for line in response.text.splitlines():
+        match = METRIC_RE.match(line)
+        if match:
+            metric, part, labels, value = match.groups()
+            view = VIEW_RE.search(labels)
+            if view:
+                # Summed over the other labels (method)
+                values[view.group(1)][metric][0 if part == 'sum' else 1] += float(value)
+    return values
+
+
+def server_report(before, after):
+    """Queries and time per request of each view during the run"""
+    views = {}
+    for view, metrics in sorted(after.items()):
+        previous = before.get(view, {})
+        delta = {name: [value - previous.get(name, [0, 0])[i] for i, value in enumerate(pair)]
+                 for name, pair in metrics.items()}
+        count = delta.get('http_request_duration_seconds', [0, 0])[1]
+        if not count:
+            continue
+        views[view] = {
+            'requests': int(count),
+            'avg_ms': round(delta['http_request_duration_seconds'][0] / count * 1000, 1),
+            'avg_db_queries': round(delta.get('http_request_db_queries', [0, 0])[0] / count, 2),
+            'avg_db_ms': round(delta.get('http_request_db_duration_seconds', [0, 0])[0] / count * 1000, 1),
+        }
+    return views
+
+
+def run_user(client, weights, deadline, start_at):
+    time.sleep(max(0.0, start_at - time.perf_counter()))
+    if not client.start():
+        return
+    names, values = list(weights), list(weights.values())
+    while time.perf_counter() < deadline:
+        SCENARIOS[client.rng.choices(names, values)[0]](client)
+
+
+def run(base_url, users, duration, weights, user_prefix, password, accounts, ramp, seed, metrics_token=None):
+    payload = make_upload_payload(seed)
+    recorder = Recorder()
+    before = scrape_metrics(base_url, metrics_token)
+
+    started = time.perf_counter()
+    deadline = started + ramp + duration
+    threads = []
+    for n in range(users):
+        client = Client(base_url, f'{user_prefix}{n % accounts}', password, recorder, random.Random(seed + n), payload)
+        start_at = started + ramp * n / max(users, 1)
+        threads.append(threading.Thread(target=run_user, args=(client, weights, deadline, start_at), daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    after = scrape_metrics(base_url, metrics_token)
+    endpoints = recorder.report(elapsed)
+    total = sum(endpoint['requests'] for endpoint in endpoints.values())
+    return {
+        'base_url': base_url,
+        'users': users,
+        'duration': duration,
+        'ramp': ramp,
+        'mix': weights,
+        'seconds': round(elapsed, 1),
+        'requests': total,
+        'rps': round(total / elapsed, 2),
+        'errors': sum(endpoint['errors'] for endpoint in endpoints.values()),
+        'throttled': sum(endpoint['throttled'] for endpoint in endpoints.values()),
+        'endpoints': endpoints,
+        'server': server_report(before, after) if before is not None and after is not None else None,
+    }
+
+
+def print_report(report):
+    print(f"{report['users']} users, {report['seconds']} s: {report['requests']} requests, "
+          f"{report['rps']} req/s, {report['errors']} errors, {report['throttled']} throttled")
+    print(f"{'endpoint':<36} {'req':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>5} {'429':>5}")
+    for endpoint, stats in report['endpoints'].items():
+        print(f"{endpoint:<36} {stats['requests']:>7} {stats['rps']:>8} {stats['p50_ms']:>8} "
+              f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>5} {stats['throttled']:>5}")
+    if report['server'] is None:
+        print("Server metrics unavailable (pass the server's METRICS_TOKEN with --metrics-token)")
+        return
+    print(f"\n{'view':<36} {'req':>7} {'avg ms':>8} {'queries':>8} {'db ms':>8}")
+    for view, stats in report['server'].items():
+        print(f"{view:<36} {stats['requests']:>7} {stats['avg_ms']:>8} {stats['avg_db_queries']:>8} {stats['avg_db_ms']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the REST API with simulated students")
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--users', type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds of load once every user started")
+    parser.add_argument('--ramp', type=float, default=5, help="Seconds over which the users start")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--accounts', type=int, default=20,
+                        help="Number of loadtest-<n> accounts to log in with (at most the seeded users)")
+    parser.add_argument('--user-prefix', default='loadtest-')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--metrics-token', help="Server's METRICS_TOKEN, to read the queries per request from /metrics")
+    parser.add_argument('-o', '--output', help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args.base_url, args.users, args.duration, args.mix, args.user_prefix, args.password,
+                 args.accounts, args.ramp, args.seed, args.metrics_token)
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding='utf-8')
+        print(f"Results saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
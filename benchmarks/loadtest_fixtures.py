@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Seed a database with realistic volumes for the API load test
+
+Universities, faculties, departments, courses, professors, users and files
+are generated from a seeded RNG and bulk inserted; the files share a small
+pool of real PDF blobs (written to the storage once) so that downloads
+work without filling the disk. The facet counts and usage totals are
+rebuilt at the end, as after any bulk import.
+
+Every user is named loadtest-<n> with the password given by --password, and
+owns an even share of the files. Use a dedicated database (DB_* environment
+variables, see k_archiver/database.py):
+
+    DB_NAME=/tmp/loadtest.sqlite3 python manage.py migrate
+    DB_NAME=/tmp/loadtest.sqlite3 python -m benchmarks.loadtest_fixtures --scale medium
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .corpus import make_text_pdf, sentence
+
+USER_PREFIX = 'loadtest-'
+UNIVERSITY_PREFIX = 'Loadtest'
+BLOB_DIR = 'fichiers/loadtest'
+
+# universities, faculties per university, departments per faculty, courses per department,
+# professors, users, files
+SCALES = {
+    'small': dict(universities=2, faculties=3, departments=2, courses=5, professors=50, users=20, files=2000),
+    'medium': dict(universities=4, faculties=5, departments=4, courses=10, professors=300, users=200, files=20000),
+    'large': dict(universities=8, faculties=8, departments=5, courses=15, professors=1500, users=1000, files=200000),
+}
+CATEGORIES = ['course', 'exam', 'correction', 'essay']
+FIRST_NAMES = ['Jean', 'Marie', 'Élodie', 'Pierre', 'Aline', 'Éric', 'Claude', 'Josée', 'André', 'Hélène']
+LAST_NAMES = ['Ndayishimiye', 'Niyonzima', 'Hakizimana', 'Irakoze', 'Bizimana', 'Lefèvre', 'Mbonimpa', 'Nkurunziza']
+
+
+def setup_django():
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'k_archiver.settings')
+    import django
+    django.setup()
+
+
+def title(rng, words):
+    return sentence(rng, words).title()
+
+
+def reset():
+    """Delete the rows and blobs of a previous run (files go with their courses)"""
+    from django.contrib.auth.models import User
+    from django.core.files.storage import default_storage
+    from api.models import Professor, University
+
+    University.objects.filter(name__startswith=UNIVERSITY_PREFIX).delete()
+    User.objects.filter(username__startswith=USER_PREFIX).delete()
+    Professor.objects.filter(key__startswith='loadtest ').delete()
+    if default_storage.exists(BLOB_DIR):
+        for name in default_storage.listdir(BLOB_DIR)[1]:
+            default_storage.delete(f'{BLOB_DIR}/{name}')
+
+
+def store_blobs(rng, count, pages):
+    """Write `count` PDFs to the storage; returns [(name, size, text)]"""
+    from django.core.files import File as DjangoFile
+    from django.core.files.storage import default_storage
+
+    blobs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for index in range(count):
+            path = Path(workdir) / f'loadtest-{index}.pdf'
+            truth = make_text_pdf(rng, path, pages)
+            text = ''.join(f"\n--- Page {number} ---\n" + '\n'.join(lines) for number, lines in enumerate(truth, start=1))
+            with open(path, 'rb') as f:
+                name = default_storage.save(f'{BLOB_DIR}/{path.name}', DjangoFile(f))
+            blobs.append((name, path.stat().st_size, text))
+    return blobs
+
+
+def seed(seed=42, universities=2, faculties=3, departments=2, courses=5, professors=50, users=20, files=2000,
+         password='loadtest', blobs=20, batch_size=2000):
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from api import facets, quotas
+    from api.models import (AcademicDegree, AcademicYear, Course, Degree, Department, Faculty, File,
+                            Professor, Profile, University)
+    from api.normalize import normalize_key
+
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    blob_pool = store_blobs(rng, blobs, pages=3)
+
+    with transaction.atomic():
+        years = [AcademicYear.objects.get_or_create(start=datetime.date(year, 10, 1), end=datetime.date(year + 1, 9, 30))[0]
+                 for year in range(2019, 2025)]
+        degrees = [Degree.objects.get_or_create(name=name)[0] for name in ('Licence', 'Master')]
+
+        unis = University.objects.bulk_create(
+            University(name=f'{UNIVERSITY_PREFIX} {title(rng, 2)} {n}', acronym=f'LT{n}', address=title(rng, 3))
+            for n in range(universities)
+        )
+        academic_degrees = AcademicDegree.objects.bulk_create(
+            AcademicDegree(university=uni, degree=degree, year=str(level))
+            for uni in unis for degree in degrees for level in range(1, 4)
+        )
+        facs = Faculty.objects.bulk_create(
+            Faculty(university=uni, name=f'Faculté de {title(rng, 2)}', code=f'F{n}')
+            for uni in unis for n in range(faculties)
+        )
+        depts = Department.objects.bulk_create(
+            Department(faculty=fac, name=title(rng, 2)[:50], code=f'D{n}')
+            for fac in facs for n in range(departments)
+        )
+        degrees_by_uni = {}
+        for academic_degree in academic_degrees:
+            degrees_by_uni.setdefault(academic_degree.university_id, []).append(academic_degree)
+        course_rows = Course.objects.bulk_create(
+            Course(faculty=dept.faculty, department=dept, academic_year=rng.choice(years),
+                   academic_degree=rng.choice(degrees_by_uni[dept.faculty.university_id]),
+                   name=f'{title(rng, rng.randint(1, 3))} {rng.randint(1, 4)}'[:100])
+            for dept in depts for _ in range(courses)
+        )
+        profs = []
+        for n in range(professors):
+            name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {n}'
+            profs.append(Professor(name=name, key=f'loadtest {normalize_key(name)}'))
+        profs = Professor.objects.bulk_create(profs)
+
+        hashed = make_password(password)  # hashed once: PBKDF2 per user would take minutes
+        user_rows = User.objects.bulk_create(User(username=f'{USER_PREFIX}{n}', password=hashed) for n in range(users))
+        profiles = Profile.objects.bulk_create(Profile(user=user) for user in user_rows)
+
+    created = 0
+    while created < files:
+        batch = []
+        for n in range(created, min(created + batch_size, files)):
+            course = rng.choice(course_rows)
+            professor = rng.choice(profs) if profs else None
+            year = course.academic_year
+            name, size, text = rng.choice(blob_pool)
+            batch.append(File(
+                course=course,
+                name=f'{title(rng, rng.randint(2, 5))}.pdf',
+                description=sentence(rng, 8),
+                file=name,
+                size=size,
+                text=text,
+                file_type='pdf',
+                file_category=rng.choice(CATEGORIES),
+                uploaded_by=profiles[n % len(profiles)],
+                nb_retrieved=rng.randint(0, 500),
+                university_ref_id=course.department.faculty.university_id,
+                faculty_ref_id=course.faculty_id,
+                department_ref_id=course.department_id,
+                professor_ref=professor,
+                year_ref=year,
+                university=course.department.faculty.university.name,
+                faculty=course.faculty.name,
+                department=course.department.name,
+                professor=professor.name if professor else None,
+                year=f'{year.start.year}-{year.end.year}',
+            ))
+        with transaction.atomic():
+            File.objects.bulk_create(batch, batch_size=500)
+        created += len(batch)
+
+    facets.rebuild()
+    quotas.rebuild()
+    return {
+        'seed': seed,
+        'universities': len(unis),
+        'faculties': len(facs),
+        'departments': len(depts),
+        'courses': len(course_rows),
+        'professors': len(profs),
+        'users': len(user_rows),
+        'files': created,
+        'blobs': len(blob_pool),
+        'user_prefix': USER_PREFIX,
+        'password': password,
+        'seconds': round(time.perf_counter() - started, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the database with load test fixtures")
+    parser.add_argument('--scale', choices=SCALES, default='small', help="Volume preset (default: small)")
+    for option in SCALES['small']:
+        parser.add_argument(f'--{option}', type=int, help=f"Override the {option} count of the preset")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password', default='loadtest', help="Password of every loadtest-<n> user")
+    parser.add_argument('--blobs', type=int, default=20, help="Distinct PDF blobs shared by the files")
+    parser.add_argument('--reset', action='store_true', help="First delete the fixtures of a previous run")
+    parser.add_argument('-o', '--output', help="Write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    setup_django()
+    logging.disable(logging.INFO)
+    if args.reset:
+        reset()
+    volumes = {option: getattr(args, option) if getattr(args, option) is not None else value
+               for option, value in SCALES[args.scale].items()}
+    summary = seed(seed=args.seed, password=args.password, blobs=args.blobs, **volumes)
+
+    output = json.dumps(summary, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding='utf-8')
+        print(f"Summary saved to: {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
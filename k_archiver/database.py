@@ -0,0 +1,71 @@
+"""
+Environment driven database configuration
+
+    DB_ENGINE=sqlite (default)  file database tuned for concurrent access (WAL)
+    DB_ENGINE=postgres          PostgreSQL with persistent, health-checked connections
+
+See database_config() for the variables read by each profile.
+"""
+import os
+
+
+def env_bool(name, default):
+    return os.getenv(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def database_config(base_dir):
+    engine = os.getenv('DB_ENGINE', 'sqlite').lower()
+
+    if engine in ('postgres', 'postgresql'):
+        # Requires psycopg (pip install "psycopg[binary]")
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'k_archiver'),
+            'USER': os.getenv('DB_USER', 'k_archiver'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # Keep connections open between requests instead of reconnecting every time,
+            # and check them before reuse so a restarted server doesn't break requests
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+                'application_name': 'k_archiver',
+            },
+        }
+
+    if engine != 'sqlite':
+        raise ValueError(f"Unsupported DB_ENGINE: {engine}")
+
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DB_NAME', base_dir / 'db.sqlite3'),
+        'OPTIONS': {
+            # Seconds a connection waits on a locked database before "database is locked"
+            'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+        },
+    }
+
+
+def sqlite_pragmas():
+    if not env_bool('SQLITE_TUNING', True):
+        return []
+    return [
+        # Readers no longer block the writer (and vice versa)
+        'PRAGMA journal_mode=WAL',
+        # Safe with WAL: only fsync at checkpoints instead of every commit
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+        f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)) * 1000}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver applying the per-connection SQLite settings"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
@@ -1,6 +1,7 @@
 import os
 from datetime import timedelta
 from pathlib import Path
+from .database import database_config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -36,6 +37,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middlewares.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -47,6 +49,7 @@ MIDDLEWARE = [
     'api.middlewares.DisableCSRF',
     'corsheaders.middleware.CorsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middlewares.ExceptionMiddleware',
 ]
 
 ROOT_URLCONF = 'k_archiver.urls'
@@ -73,12 +76,13 @@ WSGI_APPLICATION = 'k_archiver.wsgi.application'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(BASE_DIR),
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    # Trigram lookups used by the postgres search backend (api/search.py)
+    INSTALLED_APPS.append('django.contrib.postgres')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -126,16 +130,135 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
-    'REFRESH_TOKEN_LIFETIME': timedelta(hours=13)
+    'REFRESH_TOKEN_LIFETIME': timedelta(hours=13),
+    # request.user is built from the token claims (see CustomTokenSerializer)
+    'TOKEN_USER_CLASS': 'api.authentication.ClaimsUser',
 }
 
+# Session authentication on the API, for the browsable API; JWT only otherwise
+API_SESSION_AUTH = os.getenv('API_SESSION_AUTH', 'False').lower() in ('1', 'true', 'yes')
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'rest_framework.authentication.SessionAuthentication',
+        # No User/Profile query per request: the caller comes from the access token claims
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
+    ] + (['rest_framework.authentication.SessionAuthentication'] if API_SESSION_AUTH else []),
+    'DEFAULT_FILTER_BACKENDS': ('django_filters.rest_framework.DjangoFilterBackend',),
+    # Trusted proxies in front of the app, for the client IP taken from X-Forwarded-For
+    # (api/throttling.py). Unset: REMOTE_ADDR, as the header can be forged.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES')) if os.getenv('NUM_PROXIES') else None,
+}
 
 
-    ],
-    'DEFAULT_FILTER_BACKENDS': ('django_filters.rest_framework.DjangoFilterBackend',)
+# Text extraction pipeline (api/tasks.py)
+EXTRACTION_ASYNC = True
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', 2))
+FILE_PAGES_MAX_RANGE = 50
+# Append per-file extraction timings as JSON lines (None to disable)
+EXTRACTION_STATS_FILE = os.getenv('EXTRACTION_STATS_FILE')
+
+# First page thumbnails (api/previews.py)
+PREVIEW_SIZES = (128, 256, 512)
+PREVIEW_FORMAT = 'webp'
+PREVIEW_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Ingest optimisation (api/optimizer.py)
+OPTIMIZE_ON_INGEST = True
+OPTIMIZE_KEEP_ORIGINAL = False
+# Without KEEP_ORIGINAL, seconds a replaced upload stays downloadable at the URL returned at upload
+# before `manage.py purge_trash` deletes it
+OPTIMIZE_ORIGINAL_GRACE = 86400
+OPTIMIZE_PDF_TARGET_DPI = 150
+OPTIMIZE_IMAGE_MAX_EDGE = 3000
+OPTIMIZE_IMAGE_FORMAT = 'jpeg'
+OPTIMIZE_JPEG_QUALITY = 80
+OPTIMIZE_MIN_GAIN = 0.05
+
+# Request instrumentation (api/middlewares.py MetricsMiddleware, /metrics)
+METRICS_SLOW_REQUEST_MS = int(os.getenv('METRICS_SLOW_REQUEST_MS', 1000))
+# /metrics answers staff sessions and `Authorization: Bearer <METRICS_TOKEN>` (disabled when empty).
+# METRICS_ALLOWED_IPS lets addresses in without token: behind a reverse proxy on the same host every
+# request comes from 127.0.0.1, so keep it empty there.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = []
+
+# Error registry (api/errors.py), viewable by admins at /api/errors/
+ERROR_REGISTRY_SIZE = 200
+ERROR_LOG_INTERVAL = 60
+
+# Search engine behind ?q= (api/search.py): 'auto', 'default', 'postgres' or a dotted path
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+
+# Number of values returned per facet by /api/facets/ and ?facets=1
+FACETS_LIMIT = 20
+
+# Month academic years start in, for the years created by the catalog import (api/catalog.py)
+CATALOG_YEAR_START_MONTH = 10
+
+# Name prefix of the archives downloaded from /api/export/
+EXPORT_FILENAME_PREFIX = 'k-archiver'
+
+# Token bucket throttling (api/throttling.py): a bucket per profile and per client IP for each scope,
+# holding up to `burst` requests and refilled at `rate`. 'local' keeps them in the process,
+# 'cache' in the THROTTLE_CACHE_ALIAS cache shared by all workers
+THROTTLE_BACKEND = os.getenv('THROTTLE_BACKEND', 'local')
+THROTTLE_CACHE_ALIAS = 'default'
+THROTTLE_BUCKETS = {
+    'upload': {
+        'profile': {'rate': '120/hour', 'burst': 30},
+        'ip': {'rate': '600/hour', 'burst': 100},
+    },
+    'download': {
+        'profile': {'rate': '1200/hour', 'burst': 100},
+        'ip': {'rate': '6000/hour', 'burst': 300},
+    },
+    'webhook': {
+        'ip': {'rate': '60/minute', 'burst': 30},
+    },
 }
 
+# Per profile quotas (api/quotas.py), None for unlimited (an empty or 'none' variable)
+def optional_int(name, default):
+    value = os.getenv(name, str(default)).strip()
+    return None if value.lower() in ('', 'none') else int(value)
+
+
+QUOTA_STORAGE_BYTES = optional_int('QUOTA_STORAGE_BYTES', 5 * 1024 ** 3)
+QUOTA_OCR_PAGES = optional_int('QUOTA_OCR_PAGES', 5000)
+
+# Audit log (api/audit.py): events are buffered and written in batches by a background thread
+AUDIT_ASYNC = True
+AUDIT_BUFFER_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 5
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', 365))
+# Seconds between two prunes by the flush thread, None to leave it to `manage.py prune_audit_log`
+AUDIT_PRUNE_INTERVAL = 86400
+
+# Admin changelists count at most this many rows (api/admin.py EstimatedCountPaginator)
+ADMIN_COUNT_LIMIT = 100000
+
+# Trash (api/lifecycle.py): `manage.py purge_trash` deletes the files trashed for longer than this
+TRASH_RETENTION_DAYS = int(os.getenv('TRASH_RETENTION_DAYS', 30))
+TRASH_PURGE_BATCH_SIZE = 100
+# Attempts per blob and first delay (seconds, doubled each time) before leaving it for the next run
+TRASH_STORAGE_RETRIES = 3
+TRASH_STORAGE_BACKOFF = 0.5
+
+# Near-duplicate detection (api/similarity.py): words per shingle and minimum estimated similarity
+MINHASH_SHINGLE_SIZE = 3
+MINHASH_THRESHOLD = 0.7
+
+# Search box suggestions (api/suggest.py): results per lookup, and age in seconds after which a
+# worker rebuilds its index to pick up the changes made by other processes (None: never)
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_AGE = 300
+
+# OCR of images above OCR_TILE_THRESHOLD_PIXELS or with several frames (TIFF, GIF): overlapping
+# tiles of OCR_TILE_SIZE pixels, OCR_TILE_WORKERS at a time (None: number of CPUs)
+OCR_TILE_THRESHOLD_PIXELS = 16_000_000
+OCR_TILE_SIZE = 2048
+OCR_TILE_OVERLAP = 200
+OCR_TILE_WORKERS = None
+# Images with a frame above this many pixels are refused before decoding (a frame is decoded
+# whole in grayscale, 1 byte per pixel, before tiling); PIL's own bomb limit also applies
+OCR_MAX_PIXELS = 89_478_485
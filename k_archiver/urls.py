@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include, re_path
 from django.views.generic.base import RedirectView
 from . import settings
+from api.views import metrics_view
 
 admin.site.site_header = 'K-Achiver Admin'
 admin.site.site_title = 'K-Achiver Admin'
@@ -123,6 +124,7 @@ def whatsapp_webhook(request):
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/',include('api.urls')),
     path('githubhook/', github_webhook, name='github_webhook'),
     path('whatsapp-webhook/', whatsapp_webhook, name='whatsapp_webhook'),